@@ -1,28 +1,66 @@
 import os
-import sqlite3
+import time
 import pandas as pd
 from flask_cors import CORS
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
 import logging
-from io import StringIO # Import StringIO for reading CSV string
+from io import StringIO, BytesIO # StringIO for reading CSV strings, BytesIO for in-memory audio
 
 # Import functions and constants from your insight_module
 from insight_module import ( # Corrected module name to insight_module
     get_ai_insights_and_chart_data,
-    fetch_dynamic_chart_data,
-    USER_SALES_TABLE_NAME,
-    DATABASE_SCHEMA
+    iter_ai_insight_events,
+    fetch_dynamic_chart_data
 )
 
 # Import the OCR Blueprint from ocr_module.py
 from ocr_module import ocr_bp # Make sure ocr_module.py is in the same directory or accessible via PYTHONPATH
 
 # Import new functions from recent_sales_module and dashboard_data_module
-from recent_sales_module import fetch_recent_sales_for_table
-from dashboard_data_module import get_dashboard_summary, get_sales_trend_data, get_inventory_distribution_data
+from recent_sales_module import fetch_recent_sales
+from dashboard_data_module import get_dashboard_summary, get_sales_trend_data, get_inventory_distribution_data, get_dashboard_bundle
+
+# Startup schema bootstrap and versioned migrations for master and per-user DBs
+from schema_module import bootstrap_schemas, ensure_user_sales_db
+
+# Canonical sale_date parsing shared by every ingest path
+from time_period_module import normalize_sale_date
+
+# Shared cleaning, upload dedup and chunked, transactional writes for CSV and OCR uploads
+from ingest_module import (
+    clean_sales_frame,
+    ingest_sales_frame,
+    UploadLineCounter,
+    stream_csv_upload,
+    hash_upload,
+    find_upload,
+    record_upload,
+    parse_ndjson_sales,
+    validate_sales_batch,
+    MAX_SALES_BATCH_ROWS
+)
+
+# Single writer thread per user DB with group commit
+from write_queue_module import write_sales
+
+# Fast JSON encoding and the opt-in columnar row format for tabular responses
+from response_module import json_response, rows_payload, rows_response, wants_columnar, stream_events_response
+
+# Keyset-paginated access to a user's full sales ledger
+from ledger_module import fetch_ledger_page
+
+# Per-stage and per-endpoint latency, exposed at /metrics
+from metrics_module import (
+    REQUEST_SECONDS, METRICS_TRACE_LOGS, PROMETHEUS_CONTENT_TYPE, TRACE_ID_HEADER,
+    install_trace_logging, new_trace_id, render_metrics
+)
+
+# Background speech synthesis for insight answers
+from audio_module import (
+    audio_jobs, audio_cache, is_valid_audio_id, AUDIO_PENDING, AUDIO_FAILED, AUDIO_MIMETYPE, AUDIO_MAX_AGE_SECONDS
+)
 
 # Configure logging for the app
 logging.basicConfig(level=logging.INFO) # Keep INFO for general app logs
@@ -30,73 +68,14 @@ logging.basicConfig(level=logging.INFO) # Keep INFO for general app logs
 # Initialize db globally, will be bound to app in create_app
 db = SQLAlchemy()
 
-# Master DB setup
-MASTER_DB_PATH = "master_sales.db"
-
-def create_master_db():
-    """Ensures the master sales database and table exist."""
-    if not os.path.exists(MASTER_DB_PATH):
-        conn = sqlite3.connect(MASTER_DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sales_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                phone_number TEXT,
-                item TEXT,
-                price REAL,
-                quantity_in_stock INTEGER,
-                quantity_sold INTEGER,
-                sale_date TEXT
-            )
-        ''')
-        conn.commit()
-        conn.close()
-        logging.info(f"Master database created at {MASTER_DB_PATH}")
-
-def sync_to_master(phone_number, item, price, quantity_in_stock, quantity_sold, sale_date):
-    """Syncs a single sale record to the master sales database."""
-    conn = sqlite3.connect(MASTER_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO sales_data (phone_number, item, price, quantity_in_stock, quantity_sold, sale_date)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (phone_number, item, price, quantity_in_stock, quantity_sold, sale_date))
-    conn.commit()
-    conn.close()
-    logging.info(f"Sale synced to master DB for {phone_number}")
-
 # Create per-user sales DB
 def create_user_sales_db(phone_number):
     """Ensures the SQLite database and table for a specific user exist."""
-    db_folder = "user_data"
-    os.makedirs(db_folder, exist_ok=True) # Ensure user_data directory exists
-    db_path = os.path.join(db_folder, f"sales_{phone_number}.db")
-
-    if not os.path.exists(db_path):
-        logging.info(f"Database not found at {db_path}. Creating a new one with the specified schema.")
-        conn = None # Initialize conn to None
-        try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            # Correctly use USER_SALES_TABLE_NAME for the table name
-            cursor.execute(f'''
-                CREATE TABLE IF NOT EXISTS {USER_SALES_TABLE_NAME} (
-                    "id" INTEGER PRIMARY KEY AUTOINCREMENT,
-                    "item" TEXT NOT NULL,
-                    "price" REAL NOT NULL,
-                    "quantity_in_stock" INTEGER,
-                    "quantity_sold" INTEGER,
-                    "sale_date" TEXT
-                );
-            ''')
-            conn.commit()
-            logging.info(f"Empty '{db_path}' created with the specified schema.")
-        except Exception as e:
-            logging.exception(f"Could not create database for {phone_number}:")
-            raise # Re-raise to ensure calling function knows about the failure
-        finally:
-            if conn:
-                conn.close()
+    try:
+        ensure_user_sales_db(phone_number)
+    except Exception as e:
+        logging.exception(f"Could not create database for {phone_number}:")
+        raise # Re-raise to ensure calling function knows about the failure
 
 
 def create_app():
@@ -120,15 +99,39 @@ def create_app():
         website = db.Column(db.String(255))
         gst_no = db.Column(db.String(20))
 
-    # Register the OCR Blueprint
-    app.register_blueprint(ocr_bp, url_prefix='/ocr') # The url_prefix ensures routes like /extract become /ocr/extract
+    # Bring users.db, master_sales.db and every existing user_data/sales_*.db to the
+    # current schema once at startup, so the request path does no schema work.
+    with app.app_context():
+        db.create_all()
+    bootstrap_schemas()
+
+    if METRICS_TRACE_LOGS:
+        install_trace_logging()
 
     @app.before_request
-    def setup_databases():
-        """Ensures all necessary databases and tables are created before the first request."""
-        with app.app_context(): # Ensure app context for db.create_all()
-            db.create_all()
-        create_master_db()
+    def start_request_metrics():
+        g.request_start = time.perf_counter()
+        g.trace_id = new_trace_id(request.headers.get(TRACE_ID_HEADER))
+
+    @app.after_request
+    def record_request_metrics(response):
+        # Streamed bodies (SSE, large row sets) are still being produced at this point, so
+        # for them this is the time to the first byte
+        start = g.get("request_start")
+        if start is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint,
+                                    method=request.method, status=response.status_code)
+        response.headers[TRACE_ID_HEADER] = g.get("trace_id", "")
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Stage and request latency histograms plus cache statistics, in Prometheus text format."""
+        return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+    # Register the OCR Blueprint
+    app.register_blueprint(ocr_bp, url_prefix='/ocr') # The url_prefix ensures routes like /extract become /ocr/extract
 
     @app.route('/register', methods=['POST'])
     def register():
@@ -224,24 +227,66 @@ def create_app():
         if not all([phone_number, item, price, quantity_in_stock, quantity_sold, sale_date]):
             return jsonify({'error': 'Missing sale data'}), 400
 
+        # Store dates in canonical YYYY-MM-DD form so range filters stay index-friendly
+        sale_date = normalize_sale_date(sale_date)
+        if sale_date is None:
+            return jsonify({'error': 'Invalid sale_date. Expected a date such as YYYY-MM-DD'}), 400
+
         create_user_sales_db(phone_number) # Redundant but safe check
 
-        user_db_path = os.path.join("user_data", f"sales_{phone_number}.db")
-        conn = sqlite3.connect(user_db_path)
-        cursor = conn.cursor()
+        # Queue the sale on the user's group-commit writer and wait until it is durable in the
+        # user DB (the master copy follows and is retried if it fails). Live sales are never
+        # deduplicated: two identical sales on the same day are two sales.
+        write_sales(phone_number, [(item, price, quantity_in_stock, quantity_sold, sale_date)])
 
-        # Insert the sale into the user's specific database using USER_SALES_TABLE_NAME
-        cursor.execute(f'''
-            INSERT INTO {USER_SALES_TABLE_NAME} (item, price, quantity_in_stock, quantity_sold, sale_date)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (item, price, quantity_in_stock, quantity_sold, sale_date))
+        return jsonify({'message': 'Sale data added and synced to master'}), 201
 
-        conn.commit()
-        conn.close()
+    @app.route('/add_sales', methods=['POST'])
+    def add_sales():
+        """
+        Batch variant of /add_sale for POS devices. Accepts a JSON object
+        {"phone_number": ..., "sales": [...]}, a bare JSON array, or NDJSON (one sale per line)
+        with phone_number in the query string. The valid rows are written to the user's DB
+        and the master DB in one transaction each; invalid rows are reported by index.
+        """
+        phone_number = request.args.get('phone_number')
+
+        if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+            records = parse_ndjson_sales(request.get_data(as_text=True))
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                phone_number = data.get('phone_number') or phone_number
+                records = data.get('sales')
+            else:
+                records = data
 
-        sync_to_master(phone_number, item, price, quantity_in_stock, quantity_sold, sale_date)
+        if not phone_number:
+            return jsonify({'error': 'Phone number is required'}), 400
+        if not isinstance(records, list) or not records:
+            return jsonify({'error': 'Expected a non-empty array of sales'}), 400
+        if len(records) > MAX_SALES_BATCH_ROWS:
+            return jsonify({'error': f'Batch too large. At most {MAX_SALES_BATCH_ROWS} sales per request'}), 413
 
-        return jsonify({'message': 'Sale data added and synced to master'}), 201
+        try:
+            df_valid, errors = validate_sales_batch(records)
+            if df_valid.empty:
+                return jsonify({'error': 'No valid sales in batch', 'rows_received': len(records), 'errors': errors}), 400
+
+            create_user_sales_db(phone_number)
+            rows_written = ingest_sales_frame(phone_number, df_valid)
+
+            logging.info(f"Batch of {len(records)} sales for {phone_number}: {rows_written} written, {len(errors)} rejected.")
+            return jsonify({
+                'message': f'{rows_written} sales added and synced to master',
+                'rows_received': len(records),
+                'rows_written': rows_written,
+                'rows_rejected': len(errors),
+                'errors': errors
+            }), 201
+        except Exception as e:
+            logging.exception(f"Error adding sales batch for {phone_number}:")
+            return jsonify({'error': str(e)}), 500
 
 
     @app.route('/upload_icr_csv', methods=['POST'])
@@ -255,40 +300,25 @@ def create_app():
 
         csv_file = request.files['file']
 
+        # Optional override of the rows cleaned and committed per chunk
+        chunk_rows = request.form.get('chunk_rows', type=int)
+
         try:
-            df = pd.read_csv(csv_file, parse_dates=['date'])
-            df['date'] = pd.to_datetime(df['date'])
-
-            df_cleaned = pd.DataFrame()
-            df_cleaned['item'] = df['product_name']
-            df_cleaned['price'] = df['price']
-            df_cleaned['quantity_in_stock'] = df['stock'].fillna(0)
-            df_cleaned['quantity_sold'] = df['units_sold']
-            df_cleaned['sale_date'] = df['date'].dt.strftime('%Y-%m-%d')
-
-            DB_FOLDER = "user_data"
-            DB_PATH = os.path.join(DB_FOLDER, f"sales_{phone_number}.db")
-            
             create_user_sales_db(phone_number)
 
-            conn = sqlite3.connect(DB_PATH)
-            # Use USER_SALES_TABLE_NAME for the table name when uploading CSV
-            df_cleaned.to_sql(USER_SALES_TABLE_NAME, conn, if_exists='append', index=False)
-            conn.commit()
-            conn.close()
-
-            for _, row in df_cleaned.iterrows():
-                sync_to_master(
-                    phone_number=phone_number,
-                    item=row['item'],
-                    price=row['price'],
-                    quantity_in_stock=row['quantity_in_stock'],
-                    quantity_sold=row['quantity_sold'],
-                    sale_date=row['sale_date']
-                )
-
-            logging.info(f"Successfully uploaded {len(df_cleaned)} OCR records to DB for {phone_number}.")
-            return jsonify({"status": "success", "message": f"{len(df_cleaned)} records uploaded successfully."}), 200
+            # Stream the upload in bounded chunks; each chunk is committed to the
+            # user's DB and the master DB in one transaction each.
+            result = stream_csv_upload(phone_number, csv_file.stream, chunk_rows=chunk_rows)
+
+            if result['duplicate_upload']:
+                return jsonify({"status": "success", "message": "This file was already uploaded. No new records added.", "duplicate_upload": True, "rows_skipped": 0}), 200
+
+            logging.info(f"Successfully uploaded {result['rows_written']} CSV records to DB for {phone_number}.")
+            return jsonify({
+                "status": "success",
+                "message": f"{result['rows_written']} records uploaded successfully, {result['rows_skipped']} duplicates skipped.",
+                "rows_skipped": result['rows_skipped']
+            }), 200
 
         except Exception as e:
             logging.exception("Error during CSV upload:")
@@ -315,6 +345,63 @@ def create_app():
             logging.exception("Error processing insights request:")
             return jsonify({"error": str(e)}), 500
 
+    @app.route('/insights/stream', methods=['GET', 'POST'])
+    def insights_stream():
+        """
+        Streaming variant of /insights: server-sent events for the planner result, the fetched
+        rows, the insight text as it is generated, the final answer and chart, then the audio
+        handle.
+        GET takes phone_number and question as query arguments, for EventSource clients.
+        """
+        data = request.get_json(silent=True) if request.method == 'POST' else request.args
+        data = data or {}
+        phone_number = data.get("phone_number")
+
+        if not phone_number:
+            return jsonify({"error": "Phone number is required"}), 400
+
+        question = data.get("question", "Provide me with key sales insights and a relevant chart for my business in Nepal.")
+        return stream_events_response(iter_ai_insight_events(question, phone_number))
+
+    @app.route('/insights/audio/<audio_id>', methods=['GET'])
+    def insight_audio(audio_id):
+        """
+        Serves the speech for an insight answer, by the audio_id returned from /insights, as
+        audio/mpeg. Range requests get 206 partial content, so players can start before the
+        whole file arrives, and the id doubles as a strong ETag (If-None-Match gives 304).
+        While the audio is still being synthesized, by this or another worker process, the
+        response is 202; pass ?wait=<seconds> to block until it is ready instead, up to a
+        server-side cap (only when this worker is the one synthesizing it).
+        """
+        if not is_valid_audio_id(audio_id):
+            return jsonify({"error": "Unknown or expired audio id"}), 404
+        try:
+            wait_seconds = float(request.args.get("wait", 0))
+        except ValueError:
+            return jsonify({"error": "wait must be a number of seconds"}), 400
+
+        job = audio_jobs.get(audio_id, wait_seconds)
+        if job is not None and job.status == AUDIO_PENDING:
+            return jsonify({"status": job.status}), 202, {"Retry-After": "1", "Cache-Control": "no-store"}
+        if job is not None and job.status == AUDIO_FAILED:
+            return jsonify({"status": job.status, "error": job.error}), 500
+
+        # Prefer the cached file; the cache checks the directory too, so audio synthesized by
+        # another worker process is served here even though this process never saw the job
+        send_options = dict(mimetype=AUDIO_MIMETYPE, conditional=True, etag=audio_id,
+                            max_age=AUDIO_MAX_AGE_SECONDS, download_name=f"{audio_id}.mp3")
+        if audio_id in audio_cache:
+            try:
+                return send_file(os.path.abspath(audio_cache.path(audio_id)), **send_options)
+            except FileNotFoundError:
+                pass # Evicted in the meantime
+        if job is None:
+            # Still being synthesized by another worker: ?wait only blocks on this process's jobs, so poll
+            if audio_cache.is_pending(audio_id):
+                return jsonify({"status": AUDIO_PENDING}), 202, {"Retry-After": "1", "Cache-Control": "no-store"}
+            return jsonify({"error": "Unknown or expired audio id"}), 404
+        return send_file(BytesIO(job.audio), **send_options)
+
     @app.route("/api/dynamic-chart-data", methods=["POST"])
     def get_dynamic_chart_data():
         request_data = request.json
@@ -324,47 +411,14 @@ def create_app():
         if not phone_number:
             return jsonify({"error": "Phone number is required for chart data"}), 400
 
-        sales_df = fetch_dynamic_chart_data(chart_params, phone_number)
-        
-        if sales_df is None or sales_df.empty:
+        # Sorting and limiting happen in SQL; rows come back ready to serialize
+        chart_result = fetch_dynamic_chart_data(chart_params, phone_number)
+
+        if chart_result is None or not chart_result.rows:
             logging.error(f"No data available for charts for user {phone_number} based on the provided parameters.")
             return jsonify({"error": "No data available for charts."}), 500
 
-        df_columns = sales_df.columns.tolist()
-        sort_by_param = chart_params.get("sort_by")
-        sort_by = None
-        if sort_by_param:
-            for col in df_columns:
-                if col.lower() == sort_by_param.lower():
-                    sort_by = col
-                    break
-            
-        if not sort_by and chart_params.get("y_axis"):
-            y_axis_param = chart_params.get("y_axis")
-            for col in df_columns:
-                if col.lower() == y_axis_param.lower():
-                    sort_by = col
-                    break
-            if y_axis_param.lower() == 'price' and chart_params.get('aggregation') == 'sum' and 'total_sales' in df_columns:
-                sort_by = 'total_sales'
-
-        sort_order = True if chart_params.get("sort_order", "desc") == "asc" else False
-        limit = chart_params.get("limit")
-
-        if sort_by and sort_by in sales_df.columns:
-            sales_df = sales_df.sort_values(by=sort_by, ascending=sort_order)
-        else:
-            logging.warning(f"Sort by column '{sort_by_param}' not found in fetched data or not applicable. Skipping sort.")
-
-        if limit is not None:
-            try:
-                limit_int = int(limit)
-                if limit_int >= 0:
-                    sales_df = sales_df.head(limit_int)
-            except ValueError:
-                logging.warning(f"Invalid limit value '{limit}'. Ignoring limit for chart data.")
-
-        return jsonify(sales_df.to_dict(orient='records'))
+        return rows_response(chart_result.columns, chart_result.rows, wants_columnar())
 
     @app.route("/api/upload-ocr-data", methods=["POST"])
     def upload_ocr_data_to_db():
@@ -378,73 +432,39 @@ def create_app():
             return jsonify({"status": "error", "error": "CSV data is required."}), 400
 
         try:
-            from io import StringIO
+            # Ensure user's sales DB exists
+            create_user_sales_db(phone_number)
+
+            # Re-submitting the exact same OCR output is a no-op
+            content_hash = hash_upload(csv_data)
+            if find_upload(phone_number, content_hash):
+                logging.info(f"Skipping duplicate OCR upload for {phone_number}.")
+                return jsonify({"status": "success", "message": "This data was already uploaded. No new records added.", "duplicate_upload": True, "rows_skipped": 0}), 200
+
             # Read the CSV data directly. With the new prompt, headers should match.
             df = pd.read_csv(StringIO(csv_data))
 
-            # --- Simplified Data Cleaning and Validation ---
-            # Ensure column names are lowercase (if not already from Gemini's output)
-            df.columns = [col.lower() for col in df.columns]
-
-            # Rename columns if Gemini still outputs slight variations, but ideally it won't
-            # This is a fallback, less extensive than before.
-            df.rename(columns={
-                'product_name': 'item', # In case Gemini defaults to this
-                'date': 'sale_date'     # In case Gemini defaults to this
-            }, inplace=True)
-
-            # Ensure all required columns are present, fill missing with None/NaN
-            # This is still a good safety net
-            required_db_cols = ['item', 'price', 'quantity_in_stock', 'quantity_sold', 'sale_date']
-            for col in required_db_cols:
-                if col not in df.columns:
-                    df[col] = None # Add missing columns
-
-            # Select only the columns relevant to your database schema in the correct order
-            df_cleaned = df[required_db_cols].copy()
-
-            # Type conversion and handling missing values
-            df_cleaned['item'] = df_cleaned['item'].astype(str)
-            df_cleaned['price'] = pd.to_numeric(df_cleaned['price'], errors='coerce').fillna(0)
-            df_cleaned['quantity_in_stock'] = pd.to_numeric(df_cleaned['quantity_in_stock'], errors='coerce').fillna(0).astype(int)
-            df_cleaned['quantity_sold'] = pd.to_numeric(df_cleaned['quantity_sold'], errors='coerce').fillna(0).astype(int)
-            
-            # Convert sale_date to YYYY-MM-DD format, handle errors
-            df_cleaned['sale_date'] = pd.to_datetime(df_cleaned['sale_date'], errors='coerce').dt.strftime('%Y-%m-%d')
-            
-            # Drop rows where essential data (item or sale_date) is missing after cleaning
-            initial_rows = len(df_cleaned)
-            df_cleaned.dropna(subset=['item', 'sale_date'], inplace=True)
-            if len(df_cleaned) < initial_rows:
-                logging.warning(f"Dropped {initial_rows - len(df_cleaned)} rows due to missing essential 'item' or 'sale_date' after cleaning.")
+            # Shared cleaning: lowercases headers, maps variations such as product_name/date,
+            # coerces types and drops rows missing an item or a valid sale_date
+            df_cleaned = clean_sales_frame(df)
+            if len(df_cleaned) < len(df):
+                logging.warning(f"Dropped {len(df) - len(df_cleaned)} rows due to missing essential 'item' or 'sale_date' after cleaning.")
 
             if df_cleaned.empty:
                 return jsonify({"status": "error", "error": "No valid data rows found after processing OCR CSV. Please ensure the CSV contains 'item' and 'sale_date' data."}), 400
 
-            # Ensure user's sales DB exists
-            create_user_sales_db(phone_number)
+            # Insert into the user's specific database and sync to master DB (one transaction each)
+            with UploadLineCounter() as line_counter:
+                rows_written = ingest_sales_frame(phone_number, df_cleaned, line_counter)
+            rows_skipped = len(df_cleaned) - rows_written
+            record_upload(phone_number, content_hash, "ocr", rows_written, rows_skipped)
 
-            user_db_path = os.path.join("user_data", f"sales_{phone_number}.db")
-            conn = sqlite3.connect(user_db_path)
-            
-            # Insert data into the user's specific database
-            df_cleaned.to_sql(USER_SALES_TABLE_NAME, conn, if_exists='append', index=False)
-            conn.commit()
-            conn.close()
-
-            # Also sync to master DB
-            for _, row in df_cleaned.iterrows():
-                sync_to_master(
-                    phone_number=phone_number,
-                    item=row['item'],
-                    price=row['price'],
-                    quantity_in_stock=row['quantity_in_stock'],
-                    quantity_sold=row['quantity_sold'],
-                    sale_date=row['sale_date']
-                )
-
-            logging.info(f"Successfully uploaded {len(df_cleaned)} OCR records to DB for {phone_number}.")
-            return jsonify({"status": "success", "message": f"{len(df_cleaned)} records uploaded successfully."}), 200
+            logging.info(f"Successfully uploaded {rows_written} OCR records to DB for {phone_number}.")
+            return jsonify({
+                "status": "success",
+                "message": f"{rows_written} records uploaded successfully, {rows_skipped} duplicates skipped.",
+                "rows_skipped": rows_skipped
+            }), 200
 
         except Exception as e:
             logging.exception("Error processing OCR data upload to DB:")
@@ -459,15 +479,49 @@ def create_app():
             return jsonify({"error": "Phone number is required"}), 400
 
         try:
-            df = fetch_recent_sales_for_table(phone_number)
-            if df is None or df.empty:
+            columns, rows = fetch_recent_sales(phone_number)
+            if not rows:
                 logging.info(f"No recent sales data found for user {phone_number}.")
                 return jsonify({"message": "No recent sales data available"}), 200
-            return jsonify(df.to_dict(orient='records')), 200
+            return rows_response(columns, rows, wants_columnar())
         except Exception as e:
             logging.exception(f"Error fetching recent sales data for user {phone_number}:")
             return jsonify({"error": str(e)}), 500
 
+    @app.route("/api/sales-ledger", methods=["POST"])
+    def get_sales_ledger():
+        """
+        One keyset-paginated page of the user's full sales ledger.
+        Body: phone_number, optional cursor (next_cursor of the previous page), page_size,
+        item, start_date, end_date (inclusive), order ("desc" default or "asc") and format.
+        """
+        data = request.get_json(silent=True) or {}
+        phone_number = data.get('phone_number')
+        if not phone_number:
+            return jsonify({"error": "Phone number is required"}), 400
+
+        try:
+            page = fetch_ledger_page(
+                phone_number,
+                cursor=data.get('cursor'),
+                page_size=data.get('page_size'),
+                item=data.get('item'),
+                start_date=data.get('start_date'),
+                end_date=data.get('end_date'),
+                order=data.get('order', 'desc'),
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            logging.exception(f"Error fetching sales ledger for user {phone_number}:")
+            return jsonify({"error": str(e)}), 500
+
+        payload = rows_payload(page["columns"], page["rows"], wants_columnar())
+        if isinstance(payload, list):
+            payload = {"data": payload}
+        payload["next_cursor"] = page["next_cursor"]
+        return json_response(payload)
+
     # New API endpoints for Dashboard data
     @app.route("/api/dashboard-summary", methods=["POST"])
     def dashboard_summary():
@@ -477,7 +531,7 @@ def create_app():
             return jsonify({"error": "Phone number is required"}), 400
         try:
             summary_data = get_dashboard_summary(phone_number)
-            return jsonify(summary_data), 200
+            return json_response(summary_data)
         except Exception as e:
             logging.exception(f"Error fetching dashboard summary for {phone_number}:")
             return jsonify({"error": str(e)}), 500
@@ -490,7 +544,7 @@ def create_app():
             return jsonify({"error": "Phone number is required"}), 400
         try:
             trend_data = get_sales_trend_data(phone_number)
-            return jsonify(trend_data), 200
+            return json_response(trend_data)
         except Exception as e:
             logging.exception(f"Error fetching sales trend for {phone_number}:")
             return jsonify({"error": str(e)}), 500
@@ -503,11 +557,27 @@ def create_app():
             return jsonify({"error": "Phone number is required"}), 400
         try:
             inventory_data = get_inventory_distribution_data(phone_number)
-            return jsonify(inventory_data), 200
+            return json_response(inventory_data)
         except Exception as e:
             logging.exception(f"Error fetching inventory distribution for {phone_number}:")
             return jsonify({"error": str(e)}), 500
 
+    @app.route("/api/dashboard-bundle", methods=["POST"])
+    def dashboard_bundle():
+        """Summary, sales trend, inventory distribution and recent sales in one response."""
+        data = request.json
+        phone_number = data.get('phone_number')
+        if not phone_number:
+            return jsonify({"error": "Phone number is required"}), 400
+        try:
+            bundle = get_dashboard_bundle(phone_number)
+            if not bundle:
+                return jsonify({"error": "Failed to load dashboard data"}), 500
+            return json_response(bundle)
+        except Exception as e:
+            logging.exception(f"Error fetching dashboard bundle for {phone_number}:")
+            return jsonify({"error": str(e)}), 500
+
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,354 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from gtts import gTTS
+
+from metrics_module import time_stage, register_stats_collector
+
+logging.basicConfig(level=logging.INFO)
+
+# gTTS is a network round trip per utterance; these threads keep it off the request path
+AUDIO_WORKERS = int(os.environ.get("AUDIO_WORKERS", 4))
+
+# Finished jobs kept for clients to fetch, bounded by count and by total MP3 bytes
+AUDIO_JOB_MAX_ENTRIES = int(os.environ.get("AUDIO_JOB_MAX_ENTRIES", 256))
+AUDIO_JOB_MAX_BYTES = int(os.environ.get("AUDIO_JOB_MAX_BYTES", 32 * 1024 * 1024))
+
+# Content-addressed MP3 files of everything synthesized so far, shared by worker processes
+AUDIO_CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR", "audio_cache")
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# A "<audio_id>.pending" marker older than this is left over from a worker that died mid-synthesis
+AUDIO_PENDING_STALE_SECONDS = float(os.environ.get("AUDIO_PENDING_STALE_SECONDS", 120))
+
+# Longest a client may block waiting for a pending job (?wait=)
+AUDIO_MAX_WAIT_SECONDS = float(os.environ.get("AUDIO_MAX_WAIT_SECONDS", 20))
+
+AUDIO_URL_PREFIX = "/insights/audio"
+AUDIO_MIMETYPE = "audio/mpeg"
+
+# Content-addressed files never change, so clients may keep them for as long as they like
+AUDIO_MAX_AGE_SECONDS = 365 * 24 * 3600
+
+_AUDIO_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+AUDIO_PENDING = "pending"
+AUDIO_READY = "ready"
+AUDIO_FAILED = "failed"
+
+def detect_answer_language(question: str) -> str:
+    """gTTS language for an answer: Nepali when the question asks for it, English otherwise."""
+    question = (question or "").lower()
+    return "ne" if "नेपाली" in question or "nepali" in question else "en"
+
+def audio_id_for(text: str, lang: str = "en", slow: bool = False) -> str:
+    """Content address of an utterance, so the same text is only ever synthesized once at a time."""
+    return hashlib.sha256(f"{lang}\0{int(bool(slow))}\0{text}".encode("utf-8")).hexdigest()[:32]
+
+def is_valid_audio_id(audio_id: str) -> bool:
+    """True for ids shaped like audio_id_for() output; anything else never touches the cache directory."""
+    return bool(_AUDIO_ID_PATTERN.fullmatch(audio_id or ""))
+
+def audio_url(audio_id: str) -> str:
+    return f"{AUDIO_URL_PREFIX}/{audio_id}"
+
+def synthesize_speech(text: str, lang: str = "en", slow: bool = False) -> bytes:
+    """Synthesizes text with gTTS and returns the MP3 bytes. Raises on failure."""
+    with time_stage("tts"):
+        tts = gTTS(text=text, lang=lang, slow=slow)
+        audio_bytes = BytesIO()
+        tts.write_to_fp(audio_bytes)
+    return audio_bytes.getvalue()
+
+class AudioFileCache:
+    """
+    On-disk cache of synthesized speech, one "<audio_id>.mp3" file per utterance. An
+    in-memory index (loaded from the directory on first use, oldest modification first)
+    tracks sizes and recency so the directory is kept under max_bytes by deleting the
+    least recently used files; hits touch the file so recency survives restarts. Files
+    written by other worker processes are picked up on the first lookup that misses the
+    index, and "<audio_id>.pending" markers tell them which audio is still being synthesized.
+    """
+
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max(1, int(max_bytes))
+        self._index = None # audio_id -> size in bytes, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, audio_id: str) -> str:
+        return os.path.join(self.directory, f"{audio_id}.mp3")
+
+    def pending_path(self, audio_id: str) -> str:
+        return os.path.join(self.directory, f"{audio_id}.pending")
+
+    def _load_index_locked(self):
+        if self._index is not None:
+            return
+        self._index = OrderedDict()
+        self._bytes = 0
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".tmp"):
+                    os.remove(entry.path) # Left behind by a write that never finished
+                elif entry.name.endswith(".pending"):
+                    if time.time() - entry.stat().st_mtime > AUDIO_PENDING_STALE_SECONDS:
+                        os.remove(entry.path) # Another worker may still own a fresh one
+                elif entry.name.endswith(".mp3"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-len(".mp3")], stat.st_size))
+            for _, audio_id, size in sorted(entries):
+                self._index[audio_id] = size
+                self._bytes += size
+        except OSError as e:
+            logging.error(f"Could not load the audio cache index from {self.directory}: {e}")
+        self._evict_locked()
+
+    def _evict_locked(self):
+        while self._bytes > self.max_bytes and self._index:
+            audio_id, size = self._index.popitem(last=False)
+            self._bytes -= size
+            try:
+                os.remove(self.path(audio_id))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.error(f"Could not evict cached audio {audio_id}: {e}")
+
+    def _lookup_locked(self, audio_id: str) -> bool:
+        """True when audio_id is cached; an index miss falls back to the directory, where another worker may have written it."""
+        self._load_index_locked()
+        if audio_id in self._index:
+            return True
+        try:
+            size = os.path.getsize(self.path(audio_id))
+        except OSError:
+            return False
+        self._index[audio_id] = size
+        self._bytes += size
+        self._evict_locked()
+        return audio_id in self._index
+
+    def __contains__(self, audio_id: str) -> bool:
+        with self._lock:
+            return self._lookup_locked(audio_id)
+
+    def get(self, audio_id: str) -> bytes | None:
+        """Returns the cached MP3 bytes, or None on a miss."""
+        with self._lock:
+            if not self._lookup_locked(audio_id):
+                self.misses += 1
+                return None
+            self._index.move_to_end(audio_id)
+        path = self.path(audio_id)
+        try:
+            with open(path, "rb") as audio_file:
+                audio = audio_file.read()
+            os.utime(path)
+        except OSError:
+            with self._lock: # Removed behind our back (another process evicted it)
+                size = self._index.pop(audio_id, None)
+                if size is not None:
+                    self._bytes -= size
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return audio
+
+    def put(self, audio_id: str, audio: bytes):
+        """Stores MP3 bytes under audio_id, evicting the least recently used files past max_bytes."""
+        if not audio or len(audio) > self.max_bytes:
+            return
+        path = self.path(audio_id)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            self._load_index_locked()
+        try:
+            with open(temp_path, "wb") as audio_file:
+                audio_file.write(audio)
+            os.replace(temp_path, path) # Readers never see a partial file
+        except OSError as e:
+            logging.error(f"Could not cache audio {audio_id}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._bytes -= self._index.pop(audio_id, 0)
+            self._index[audio_id] = len(audio)
+            self._bytes += len(audio)
+            self._evict_locked()
+
+    def mark_pending(self, audio_id: str):
+        """Records that this process is synthesizing audio_id, so other workers answer 202 instead of 404."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.pending_path(audio_id), "wb"):
+                pass
+        except OSError as e:
+            logging.error(f"Could not mark audio {audio_id} as pending: {e}")
+
+    def clear_pending(self, audio_id: str):
+        try:
+            os.remove(self.pending_path(audio_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"Could not clear the pending marker of audio {audio_id}: {e}")
+
+    def is_pending(self, audio_id: str) -> bool:
+        """True while some worker process is synthesizing audio_id (its marker is not stale)."""
+        try:
+            return time.time() - os.path.getmtime(self.pending_path(audio_id)) <= AUDIO_PENDING_STALE_SECONDS
+        except OSError:
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._index or ()),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+# Shared by every request in this process
+audio_cache = AudioFileCache()
+register_stats_collector("audio_cache", audio_cache.stats)
+
+class AudioJob:
+    """One utterance being synthesized (or already synthesized) in the background."""
+
+    def __init__(self, audio_id: str, text: str, lang: str, slow: bool):
+        self.audio_id = audio_id
+        self.text = text
+        self.lang = lang
+        self.slow = slow
+        self.status = AUDIO_PENDING
+        self.audio = b""
+        self.error = None
+        self.done = threading.Event()
+
+class AudioJobQueue:
+    """
+    Runs speech synthesis on a small thread pool and keeps the results for clients to fetch
+    by audio id. Jobs are keyed on audio_id_for(), so concurrent requests for the same text
+    share one synthesis, and text found in the audio cache is ready without one. Finished
+    jobs are evicted oldest first beyond the entry and byte limits; pending jobs are never
+    evicted.
+    """
+
+    def __init__(self, workers: int = AUDIO_WORKERS, max_entries: int = AUDIO_JOB_MAX_ENTRIES,
+                 max_bytes: int = AUDIO_JOB_MAX_BYTES):
+        self.workers = max(1, int(workers))
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self._jobs = OrderedDict() # audio_id -> AudioJob, oldest first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, text: str, lang: str = "en", slow: bool = False) -> str | None:
+        """Queues text for synthesis unless it is already queued or done; returns its audio id."""
+        if not text or not text.strip():
+            return None
+        audio_id = audio_id_for(text, lang, slow)
+        with self._lock:
+            job = self._jobs.get(audio_id)
+            if job is not None and job.status != AUDIO_FAILED:
+                self._jobs.move_to_end(audio_id)
+                return audio_id
+
+        # Spoken before: one file read instead of a TTS round trip, no worker needed
+        cached_audio = audio_cache.get(audio_id)
+
+        with self._lock:
+            job = self._jobs.get(audio_id)
+            if job is not None and job.status != AUDIO_FAILED:
+                return audio_id
+            job = AudioJob(audio_id, text, lang, slow)
+            self._jobs[audio_id] = job
+            self._jobs.move_to_end(audio_id)
+            if cached_audio is not None:
+                job.audio = cached_audio
+                job.status = AUDIO_READY
+                job.done.set()
+                self._bytes += len(cached_audio)
+                self._trim_locked()
+                return audio_id
+            self._trim_locked()
+            audio_cache.mark_pending(audio_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tts")
+            self._executor.submit(self._run, job)
+        return audio_id
+
+    def _run(self, job: AudioJob):
+        try:
+            audio = synthesize_speech(job.text, job.lang, job.slow) # submit() already checked the cache
+            audio_cache.put(job.audio_id, audio)
+        except Exception as e:
+            logging.error(f"Error generating TTS audio {job.audio_id}: {e}")
+            job.error = str(e)
+            job.status = AUDIO_FAILED
+        else:
+            job.audio = audio
+            job.status = AUDIO_READY
+            with self._lock:
+                if self._jobs.get(job.audio_id) is job:
+                    self._bytes += len(audio)
+                self._trim_locked()
+        finally:
+            audio_cache.clear_pending(job.audio_id) # After put(): other workers go from 202 straight to the file
+            job.done.set()
+
+    def _trim_locked(self):
+        for audio_id in list(self._jobs):
+            if len(self._jobs) <= self.max_entries and self._bytes <= self.max_bytes:
+                return
+            job = self._jobs[audio_id]
+            if job.status == AUDIO_PENDING:
+                continue
+            del self._jobs[audio_id]
+            self._bytes -= len(job.audio)
+
+    def get(self, audio_id: str, wait_seconds: float = 0) -> AudioJob | None:
+        """Returns the job for audio_id, after waiting up to wait_seconds for it to finish; None if unknown."""
+        with self._lock:
+            job = self._jobs.get(audio_id)
+            if job is not None:
+                self._jobs.move_to_end(audio_id)
+        if job is not None and wait_seconds > 0:
+            job.done.wait(min(wait_seconds, AUDIO_MAX_WAIT_SECONDS))
+        return job
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status == AUDIO_PENDING)
+            return {"jobs": len(self._jobs), "pending": pending, "bytes": self._bytes}
+
+# Shared by every request in this process
+audio_jobs = AudioJobQueue()
+register_stats_collector("audio_jobs", audio_jobs.stats)
+
+def request_speech(text: str, lang: str = "en") -> dict:
+    """
+    Starts background synthesis of text and returns the handle sent to clients:
+    {"audio_id", "audio_url"}, both None when there is nothing to speak.
+    """
+    audio_id = audio_jobs.submit(text, lang)
+    return {"audio_id": audio_id, "audio_url": audio_url(audio_id) if audio_id else None}
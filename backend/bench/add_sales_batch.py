@@ -0,0 +1,40 @@
+"""
+Throughput of one-sale-per-request writes (what /add_sale does per call) against one
+validated batch (what /add_sales does per call), both through the tenant write queue.
+
+    python bench/add_sales_batch.py [--single 200] [--batch 2000]
+"""
+import time
+import argparse
+
+from common import BENCH_PHONE_NUMBER, setup_workdir
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--single", type=int, default=200, help="sales written one request at a time")
+    parser.add_argument("--batch", type=int, default=2000, help="sales written in one batch request")
+    args = parser.parse_args()
+
+    setup_workdir()
+    from ingest_module import validate_sales_batch, ingest_sales_frame
+    from write_queue_module import write_sales
+
+    start = time.perf_counter()
+    for i in range(args.single):
+        write_sales(BENCH_PHONE_NUMBER, [(f"single{i}", 1.0, 1, 1, "2026-01-01")])
+    single_rate = args.single / (time.perf_counter() - start)
+
+    records = [{"item": f"batch{i}", "price": 1, "quantity_in_stock": 1, "quantity_sold": 1, "sale_date": "2026-01-01"}
+               for i in range(args.batch)]
+    start = time.perf_counter()
+    df_valid, errors = validate_sales_batch(records)
+    written = ingest_sales_frame(BENCH_PHONE_NUMBER, df_valid)
+    batch_rate = args.batch / (time.perf_counter() - start)
+
+    assert written == args.batch and not errors
+    print(f"single: {single_rate:,.0f} rows/s ({args.single} sales)")
+    print(f"batch:  {batch_rate:,.0f} rows/s ({args.batch} sales, validation included)")
+    print(f"speedup: {batch_rate / single_rate:.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Cost of turning a chart query's rows into the response: the old pandas path
+(DataFrame + sort_values + head + to_dict) against building dicts straight from the
+cursor, plus the end-to-end run_chart_query() time that both sit behind.
+
+    python bench/chart_postprocessing.py [--rows 50000] [--limit 25] [--repeat 200]
+"""
+import argparse
+
+import pandas as pd
+
+from common import BENCH_PHONE_NUMBER, random_sales, setup_workdir, time_per_call
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000, help="sales rows in the tenant DB")
+    parser.add_argument("--limit", type=int, default=25, help="rows in the chart result")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_workdir()
+    from chart_query_module import run_chart_query
+    from write_queue_module import write_sales
+
+    write_sales(BENCH_PHONE_NUMBER, random_sales(args.rows))
+    params = {"x_axis": "item", "y_axis": "total_sales", "sort_by": "total_sales", "sort_order": "asc", "limit": args.limit}
+    today = pd.Timestamp.now()
+
+    result = run_chart_query(params, BENCH_PHONE_NUMBER, today, chart=True)
+    columns, rows = result.columns, result.rows
+
+    pandas_seconds = time_per_call(
+        lambda: pd.DataFrame.from_records(rows, columns=columns).sort_values(by="total_sales").head(args.limit).to_dict(orient="records"),
+        args.repeat)
+    cursor_seconds = time_per_call(lambda: [dict(zip(columns, row)) for row in rows], args.repeat)
+    query_seconds = time_per_call(lambda: run_chart_query(params, BENCH_PHONE_NUMBER, today, chart=True), args.repeat)
+
+    print(f"{args.rows} sales, {len(rows)}-row result")
+    print(f"post-processing: pandas {pandas_seconds * 1e6:,.0f} us, cursor rows {cursor_seconds * 1e6:,.0f} us")
+    print(f"run_chart_query end to end: {query_seconds * 1e3:.2f} ms")
+
+if __name__ == "__main__":
+    main()
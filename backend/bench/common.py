@@ -0,0 +1,37 @@
+"""Shared setup for the scripts in this directory: run them from backend/ or anywhere else."""
+import os
+import sys
+import time
+import random
+import logging
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+BENCH_PHONE_NUMBER = "9800000000"
+
+def setup_workdir() -> str:
+    """Moves into a fresh temporary directory so user_data/ and master_sales.db are throwaway."""
+    logging.disable(logging.WARNING) # Per-commit INFO logs would dominate the timings
+    workdir = tempfile.mkdtemp(prefix="insightgenie-bench-")
+    os.chdir(workdir)
+    from schema_module import migrate_master_db, migrate_user_db
+    migrate_master_db()
+    migrate_user_db(BENCH_PHONE_NUMBER)
+    return workdir
+
+def random_sales(count: int, items: int = 200, seed: int = 1) -> list:
+    """count SALE_COLUMNS tuples spread over items products and the current year."""
+    rng = random.Random(seed)
+    return [(f"item{rng.randrange(items)}", float(rng.randint(10, 500)), rng.randint(0, 50), rng.randint(0, 9),
+             f"2026-{rng.randint(1, 10):02d}-{rng.randint(1, 28):02d}") for _ in range(count)]
+
+def time_per_call(function, repeat: int) -> float:
+    """Seconds per call of function(), after one warm-up call."""
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
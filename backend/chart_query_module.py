@@ -0,0 +1,292 @@
+import os
+import copy
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from db_connection_module import read_connection
+from schema_module import USER_SALES_TABLE_NAME, resolve_sales_column
+from time_period_module import get_time_period_bounds
+from metrics_module import observe_stage, register_stats_collector
+from prompt_data_module import summarize_query
+
+logging.basicConfig(level=logging.INFO)
+
+# Number of compiled plan shapes kept; the SQL text of a shape is shared by every request with that shape
+CHART_PLAN_CACHE_SIZE = int(os.environ.get("CHART_PLAN_CACHE_SIZE", 256))
+
+# Aggregations accepted in data_parameters and the SQL function each maps to
+AGGREGATIONS = {"sum": "SUM", "count": "COUNT", "average": "AVG"}
+
+# Derived measure for "total_sales" (and "price" with sum): revenue per group
+TOTAL_SALES_ALIAS = "total_sales"
+TOTAL_SALES_EXPRESSION = 'SUM("price" * "quantity_sold")'
+
+# Derived x axis "month": sale_date truncated to its calendar month (YYYY-MM)
+MONTH_ALIAS = "month"
+MONTH_EXPRESSION = 'substr("sale_date", 1, 7)'
+
+# Row cap for /api/dynamic-chart-data when the request gives no limit, and the largest limit honoured
+CHART_DEFAULT_LIMIT = 10
+CHART_MAX_LIMIT = int(os.environ.get("CHART_MAX_LIMIT", 1000))
+
+class ChartPlan:
+    """
+    Canonical form of a data_parameters dict: column names resolved against the tenant's
+    schema, aggregation and sort order normalized, and literal values (filter value, date
+    bounds, limit) separated from the structure so they can be bound as parameters.
+    """
+
+    def __init__(self, x_axis, measure, aggregation, grouped, filter_column, filter_value,
+                 period_bounds, sort_by, sort_order, limit):
+        self.x_axis = x_axis # Exact column name, MONTH_ALIAS or None
+        self.measure = measure # TOTAL_SALES_ALIAS or an exact column name
+        self.aggregation = aggregation # Key of AGGREGATIONS or "none"
+        self.grouped = grouped
+        self.filter_column = filter_column
+        self.filter_value = filter_value
+        self.period_bounds = period_bounds
+        self.sort_by = sort_by # Output column to order by, or None
+        self.sort_order = sort_order # "ASC" or "DESC"
+        self.limit = limit
+
+    def shape(self) -> tuple:
+        """Everything that affects the SQL text; plans with the same shape share one compiled query."""
+        return (
+            self.x_axis,
+            self.measure,
+            self.aggregation,
+            self.grouped,
+            self.filter_column if self.filter_value is not None else None,
+            self.period_bounds is not None,
+            self.sort_by,
+            self.sort_order,
+            self.limit is not None,
+        )
+
+    def params(self) -> list:
+        """Bound parameters in the order their placeholders appear in the compiled SQL."""
+        params = []
+        if self.period_bounds is not None:
+            params.extend(self.period_bounds)
+        if self.filter_column and self.filter_value is not None:
+            params.append(self.filter_value)
+        if self.limit is not None:
+            params.append(self.limit)
+        return params
+
+class ChartQueryResult:
+    """
+    Rows of an executed chart plan plus compile/execute timings for profiling. When the
+    query was capped (run_chart_query(max_rows=...)), row_count is the size of the full
+    result and summary its aggregates (see prompt_data_module.summarize_query()).
+    """
+
+    def __init__(self, columns: list, rows: list, sql: str, params: list,
+                 compile_seconds: float, execute_seconds: float, plan_cache_hit: bool,
+                 row_count: int | None = None, summary: dict | None = None):
+        self.columns = columns
+        self.rows = rows
+        self.row_count = len(rows) if row_count is None else row_count
+        self.summary = summary
+        self.sql = sql
+        self.params = params
+        self.compile_seconds = compile_seconds
+        self.execute_seconds = execute_seconds
+        self.plan_cache_hit = plan_cache_hit
+
+    @property
+    def truncated(self) -> bool:
+        return len(self.rows) < self.row_count
+
+def _parse_limit(limit) -> int | None:
+    if limit is None or limit == "":
+        return None
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        logging.warning(f"Invalid limit value '{limit}'. Ignoring limit.")
+        return None
+    return limit if limit >= 0 else None
+
+def normalize_chart_params(params: dict, phone_number: str, today: pd.Timestamp, chart: bool = False) -> ChartPlan | None:
+    """
+    Builds the canonical ChartPlan for LLM- or frontend-provided data_parameters, validating
+    column names against the tenant's cached schema. Returns None when no valid measure is
+    given. Without an x axis an aggregation yields a single scalar row (e.g. SUM over the period).
+
+    chart=True is the /api/dynamic-chart-data flavour: both axes are required (None is returned
+    otherwise), rows are always grouped by the x axis and ordered by the measure or the x axis
+    (the measure when sort_by names neither), and the limit defaults to CHART_DEFAULT_LIMIT
+    and is capped at CHART_MAX_LIMIT.
+    """
+    def resolve(name):
+        if not name:
+            return None
+        column = resolve_sales_column(phone_number, name)
+        if column is None:
+            logging.warning(f"Invalid column '{name}' suggested. Not found in DB schema for {phone_number}.")
+        return column
+
+    raw_y_axis = str(params.get("y_axis") or "").lower()
+    aggregation = str(params.get("aggregation") or "none").lower()
+    if aggregation not in AGGREGATIONS:
+        aggregation = "none"
+
+    raw_x_axis = params.get("x_axis")
+    x_axis = MONTH_ALIAS if str(raw_x_axis or "").lower() == MONTH_ALIAS else resolve(raw_x_axis)
+    if raw_y_axis == TOTAL_SALES_ALIAS or (raw_y_axis == "price" and aggregation == "sum"):
+        measure = TOTAL_SALES_ALIAS
+        grouped = x_axis is not None
+    else:
+        measure = resolve(params.get("y_axis"))
+        grouped = x_axis is not None and (chart or aggregation != "none")
+    if measure is None or (chart and x_axis is None):
+        logging.warning(f"Insufficient valid columns for {'dynamic chart' if chart else 'insight'} data. x_axis: {x_axis}, y_axis: {measure}")
+        return None
+
+    try:
+        period_bounds = get_time_period_bounds(params.get("time_period"), today)
+    except ValueError as e:
+        logging.warning(f"{e}. Ignoring time filter.")
+        period_bounds = None
+
+    filter_column = resolve(params.get("filter_column"))
+    filter_value = params.get("filter_value") if filter_column else None
+
+    raw_sort_by = str(params.get("sort_by") or "").lower()
+    if raw_sort_by and measure and raw_sort_by in (raw_y_axis, measure.lower()):
+        sort_by = measure # Sorting by the y axis means sorting by the (possibly aggregated) measure
+    elif chart:
+        sort_by = x_axis if raw_sort_by == x_axis.lower() else measure
+    elif x_axis and raw_sort_by == x_axis.lower():
+        sort_by = x_axis
+    else:
+        sort_by = resolve(params.get("sort_by"))
+    sort_order = "ASC" if str(params.get("sort_order") or "desc").lower() == "asc" else "DESC"
+    limit = _parse_limit(params.get("limit"))
+    if chart:
+        limit = CHART_DEFAULT_LIMIT if limit is None else min(limit, CHART_MAX_LIMIT)
+
+    return ChartPlan(x_axis, measure, aggregation, grouped, filter_column, filter_value,
+                     period_bounds, sort_by, sort_order, limit)
+
+def _compile_sql(plan: ChartPlan) -> str:
+    if plan.x_axis == MONTH_ALIAS:
+        select_parts = [f'{MONTH_EXPRESSION} AS "{MONTH_ALIAS}"']
+    else:
+        select_parts = [f'"{plan.x_axis}"'] if plan.x_axis else []
+    if plan.measure == TOTAL_SALES_ALIAS:
+        select_parts.append(f'{TOTAL_SALES_EXPRESSION} AS "{TOTAL_SALES_ALIAS}"')
+    elif plan.aggregation != "none":
+        # Grouped by the x axis, or a single scalar row when there is none
+        select_parts.append(f'{AGGREGATIONS[plan.aggregation]}("{plan.measure}") AS "{plan.measure}"')
+    else:
+        select_parts.append(f'"{plan.measure}"')
+
+    # Half-open sargable range on the canonical sale_date column
+    where_clauses = []
+    if plan.period_bounds is not None:
+        where_clauses.append('"sale_date" >= ? AND "sale_date" < ?')
+    if plan.filter_column and plan.filter_value is not None:
+        where_clauses.append(f'"{plan.filter_column}" = ?')
+
+    clauses = [f"SELECT {', '.join(select_parts)} FROM {USER_SALES_TABLE_NAME}"]
+    if where_clauses:
+        clauses.append(f"WHERE {' AND '.join(where_clauses)}")
+    if plan.grouped:
+        clauses.append(f'GROUP BY "{plan.x_axis}"')
+    if plan.sort_by:
+        clauses.append(f'ORDER BY "{plan.sort_by}" {plan.sort_order}')
+    if plan.limit is not None:
+        clauses.append("LIMIT ?")
+    return " ".join(clauses)
+
+class ChartPlanCache:
+    """
+    LRU of compiled SQL text per plan shape. Because the text for a shape is always identical
+    (values are bound), each pooled connection's sqlite3 statement cache also reuses the
+    prepared statement instead of re-parsing it.
+    """
+
+    def __init__(self, max_entries: int = CHART_PLAN_CACHE_SIZE):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, plan: ChartPlan) -> tuple[str, bool]:
+        """Returns the SQL for plan and whether it came from the cache."""
+        shape = plan.shape()
+        with self._lock:
+            sql = self._entries.get(shape)
+            if sql is not None:
+                self._entries.move_to_end(shape)
+                self.hits += 1
+                return sql, True
+            self.misses += 1
+        sql = _compile_sql(plan)
+        with self._lock:
+            self._entries[shape] = sql
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return sql, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+# Shared by the insight and dynamic chart paths
+chart_plan_cache = ChartPlanCache()
+register_stats_collector("chart_plan_cache", chart_plan_cache.stats)
+
+def run_chart_query(params: dict, phone_number: str, today: pd.Timestamp, chart: bool = False,
+                    max_rows: int | None = None) -> ChartQueryResult | None:
+    """
+    Normalizes, compiles (through the plan cache) and executes data_parameters against the
+    tenant's sales table. Returns None when the parameters do not describe a valid query.
+
+    max_rows caps the rows fetched in SQL. When the full result is larger, only its first
+    max_rows rows are returned (the most recent first for date axes without a sort order),
+    along with its row_count and a summary aggregated over every row by SQLite.
+    """
+    compile_start = time.perf_counter()
+    plan = normalize_chart_params(params, phone_number, today, chart=chart)
+    if plan is None:
+        return None
+    summary_plan = None
+    if max_rows is not None and (plan.limit is None or plan.limit > max_rows):
+        summary_plan = copy.copy(plan)
+        if plan.limit is None:
+            summary_plan.sort_by = None # Order is irrelevant to aggregates over every row
+        if plan.sort_by is None and plan.x_axis in ("sale_date", MONTH_ALIAS):
+            plan.sort_by, plan.sort_order = plan.x_axis, "DESC"
+        plan.limit = max_rows + 1 # One extra row tells whether anything was left out
+    sql, plan_cache_hit = chart_plan_cache.compile(plan)
+    sql_params = plan.params()
+    compile_seconds = time.perf_counter() - compile_start
+
+    logging.info(f"Executing SQL Query: {sql} for {phone_number} with params: {sql_params}")
+    execute_start = time.perf_counter()
+    row_count = summary = None
+    with read_connection(phone_number) as conn:
+        cursor = conn.execute(sql, sql_params)
+        columns = [description[0] for description in cursor.description]
+        rows = cursor.fetchall()
+        if summary_plan is not None and len(rows) > max_rows:
+            rows = rows[:max_rows]
+            summary_sql, _ = chart_plan_cache.compile(summary_plan)
+            row_count, summary = summarize_query(conn, summary_sql, summary_plan.params(), columns, rows, plan.measure)
+    execute_seconds = time.perf_counter() - execute_start
+    observe_stage("sql_compile", compile_seconds)
+    observe_stage("sql_execute", execute_seconds)
+
+    logging.info(f"Chart query for {phone_number}: compile {compile_seconds * 1000:.2f}ms "
+                 f"(plan cache {'hit' if plan_cache_hit else 'miss'}), execute {execute_seconds * 1000:.2f}ms, {len(rows)} rows"
+                 f"{f' of {row_count} (summarized in SQL)' if summary is not None else ''}")
+    return ChartQueryResult(columns, rows, sql, sql_params, compile_seconds, execute_seconds, plan_cache_hit,
+                            row_count=row_count, summary=summary)
@@ -2,75 +2,139 @@ import pandas as pd
 import sqlite3
 import os
 import logging
-from datetime import datetime, timedelta
+import functools
+from datetime import datetime
+
+from db_connection_module import get_user_db_path, read_connection
+from time_period_module import SALE_DATE_FORMAT, get_trailing_months
+from recent_sales_module import fetch_recent_sales_rows
+from data_version_module import get_data_version, add_data_version_listener
+from result_cache_module import ResultCache
+from metrics_module import register_stats_collector
 
 logging.basicConfig(level=logging.INFO)
 
 USER_SALES_TABLE_NAME = 'sales'
-USER_DATA_DIR = 'user_data'
 
-def get_dashboard_summary(phone_number: str) -> dict:
+# Bounds of the in-memory cache of dashboard results
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.environ.get("DASHBOARD_CACHE_MAX_ENTRIES", 4096))
+DASHBOARD_CACHE_MAX_BYTES = int(os.environ.get("DASHBOARD_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Dashboard results keyed on (phone_number, endpoint, day, data version). Every write bumps the
+# version stored in the tenant DB, so polls between writes cost one row read instead of the
+# dashboard queries, in every worker process.
+dashboard_cache = ResultCache("dashboard", DASHBOARD_CACHE_MAX_ENTRIES, DASHBOARD_CACHE_MAX_BYTES)
+register_stats_collector("dashboard_cache", dashboard_cache.stats)
+
+# Entries under an older version can never be hit again; free them as soon as a write in this
+# process changes the data (other processes' stale entries age out of their LRU)
+add_data_version_listener(lambda phone_number, version: dashboard_cache.invalidate(phone_number))
+
+def _cached_dashboard_result(endpoint: str):
     """
-    Fetches summary statistics for the dashboard.
+    Caches a dashboard fetcher's result per tenant and data version. The day is part of the
+    key because the trend window moves with the calendar. Empty (error) results are not cached.
     """
-    db_path = os.path.join(USER_DATA_DIR, f'sales_{phone_number}.db')
-    if not os.path.exists(db_path):
-        logging.error(f"User database not found at {db_path} for dashboard summary.")
-        return {
-            "totalSales": 0,
-            "totalOrders": 0,
-            "inventoryValue": 0,
-            "lowStockItems": 0,
-            "customerGrowth": 0, # Placeholder, as customer data is not in sales table
-            "topSelling": "N/A"
-        }
+    def decorator(fetch):
+        @functools.wraps(fetch)
+        def wrapper(phone_number: str):
+            # Read the version before computing: a write racing with the query then lands
+            # under a newer version instead of being hidden behind this result.
+            key = (phone_number, endpoint, datetime.now().strftime(SALE_DATE_FORMAT), get_data_version(phone_number))
+            result = dashboard_cache.get(key)
+            if result is not None:
+                return result
+            result = fetch(phone_number)
+            if result:
+                dashboard_cache.put(key, result)
+            return result
+        return wrapper
+    return decorator
 
-    conn = None
-    try:
-        conn = sqlite3.connect(db_path)
-        
-        # Total Sales
-        total_sales_query = f'SELECT SUM(price * quantity_sold) FROM {USER_SALES_TABLE_NAME}'
-        total_sales = conn.execute(total_sales_query).fetchone()[0] or 0.0
-
-        # Total Orders (assuming each row is an order or distinct sale_date for simplicity)
-        # More accurately, you'd need an 'order_id' column for distinct orders.
-        # For now, let's count distinct sale_dates as a proxy for 'orders' or just total sales records.
-        total_orders_query = f'SELECT COUNT(DISTINCT sale_date) FROM {USER_SALES_TABLE_NAME}'
-        total_orders = conn.execute(total_orders_query).fetchone()[0] or 0
-
-        # Inventory Value (sum of price * quantity_in_stock)
-        inventory_value_query = f'SELECT SUM(price * quantity_in_stock) FROM {USER_SALES_TABLE_NAME}'
-        inventory_value = conn.execute(inventory_value_query).fetchone()[0] or 0.0
-
-        # Low Stock Items (assuming a reorder level of 5 for demonstration)
-        # In a real scenario, 'reorder_level' would be a column in the table or configurable.
-        low_stock_query = f'SELECT COUNT(DISTINCT item) FROM {USER_SALES_TABLE_NAME} WHERE quantity_in_stock <= 5'
-        low_stock_items = conn.execute(low_stock_query).fetchone()[0] or 0
-
-        # Top Selling Item (by total sales value)
-        top_selling_query = f"""
-            SELECT item, SUM(price * quantity_sold) AS total_item_sales
-            FROM {USER_SALES_TABLE_NAME}
-            GROUP BY item
-            ORDER BY total_item_sales DESC
-            LIMIT 1
-        """
-        top_selling_result = conn.execute(top_selling_query).fetchone()
-        top_selling_item = top_selling_result[0] if top_selling_result else "N/A"
+# Items at or below this stock level count as low stock (there is no per-item reorder level yet)
+LOW_STOCK_THRESHOLD = 5
+
+# Number of items shown in the inventory distribution pie chart
+INVENTORY_DISTRIBUTION_ITEMS = 5
 
+# Every summary metric plus the inventory distribution in one statement: per_item is a single
+# GROUP BY item pass over idx_sales_item_ledger, the window aggregates fold it into the summary
+# totals, and the distinct-date count is one more pass over idx_sales_ledger (the IS NOT NULL
+# range steers it there, where dates arrive in order and need no temp b-tree to deduplicate).
+DASHBOARD_ROLLUP_QUERY = f"""
+    WITH per_item AS (
+        SELECT
+            item,
+            SUM(price * quantity_sold) AS item_sales,
+            SUM(price * quantity_in_stock) AS item_inventory_value,
+            MAX(quantity_in_stock <= ?) AS item_low_stock,
+            SUM(quantity_in_stock) AS item_stock
+        FROM {USER_SALES_TABLE_NAME}
+        GROUP BY item
+    )
+    SELECT
+        item,
+        item_stock,
+        SUM(item_sales) OVER () AS total_sales,
+        SUM(item_inventory_value) OVER () AS inventory_value,
+        SUM(item_low_stock) OVER () AS low_stock_items,
+        FIRST_VALUE(item) OVER (ORDER BY item_sales DESC) AS top_selling,
+        (SELECT COUNT(DISTINCT sale_date) FROM {USER_SALES_TABLE_NAME} WHERE sale_date IS NOT NULL) AS total_orders
+    FROM per_item
+    ORDER BY item_stock DESC
+    LIMIT ?;
+"""
+
+def _empty_summary() -> dict:
+    return {
+        "totalSales": 0,
+        "totalOrders": 0,
+        "inventoryValue": 0,
+        "lowStockItems": 0,
+        "customerGrowth": 0, # Placeholder, as customer data is not in sales table
+        "topSelling": "N/A"
+    }
+
+def _fetch_dashboard_rollup(conn) -> tuple[dict, list]:
+    """
+    Runs DASHBOARD_ROLLUP_QUERY on an open connection.
+    Returns the summary dict and the inventory distribution list.
+    """
+    rows = conn.execute(DASHBOARD_ROLLUP_QUERY, (LOW_STOCK_THRESHOLD, INVENTORY_DISTRIBUTION_ITEMS)).fetchall()
+    if not rows:
+        return _empty_summary(), []
+
+    # The window columns carry the same totals on every row
+    _, _, total_sales, inventory_value, low_stock_items, top_selling, total_orders = rows[0]
+    summary = {
+        "totalSales": total_sales or 0.0,
+        # Distinct sale_dates are a proxy for orders until there is an order_id column
+        "totalOrders": total_orders or 0,
+        "inventoryValue": inventory_value or 0.0,
+        "lowStockItems": low_stock_items or 0,
         # Customer Growth: This data is not available in the sales table.
         # It would require a 'customers' table or similar. Returning 0 for now.
-        customer_growth = 0.0 
+        "customerGrowth": 0.0,
+        "topSelling": top_selling if top_selling is not None else "N/A"
+    }
+    # Format for Recharts PieChart: { name: 'Electronics', value: 400 }
+    distribution = [{"name": item, "value": item_stock} for item, item_stock, *_ in rows]
+    return summary, distribution
 
-        return {
-            "totalSales": total_sales,
-            "totalOrders": total_orders,
-            "inventoryValue": inventory_value,
-            "lowStockItems": low_stock_items,
-            "customerGrowth": customer_growth,
-            "topSelling": top_selling_item
-        }
+@_cached_dashboard_result("summary")
+def get_dashboard_summary(phone_number: str) -> dict:
+    """
+    Fetches summary statistics for the dashboard in a single query.
+    """
+    db_path = get_user_db_path(phone_number)
+    if not os.path.exists(db_path):
+        logging.error(f"User database not found at {db_path} for dashboard summary.")
+        return _empty_summary()
+
+    try:
+        with read_connection(phone_number) as conn:
+            summary, _ = _fetch_dashboard_rollup(conn)
+        return summary
 
     except sqlite3.Error as e:
         logging.error(f"SQLite error fetching dashboard summary for {phone_number}: {e}")
@@ -78,66 +142,60 @@ def get_dashboard_summary(phone_number: str) -> dict:
     except Exception as e:
         logging.exception(f"An unexpected error occurred fetching dashboard summary for {phone_number}:")
         return {} # Return empty dict on error
-    finally:
-        if conn:
-            conn.close()
 
+# sale_date is stored as canonical YYYY-MM-DD, so the month is its 7-char prefix
+# and the half-open range below is a covering seek on idx_sales_ledger.
+SALES_TREND_QUERY = f"""
+    SELECT
+        substr(sale_date, 1, 7) AS month,
+        SUM(price * quantity_sold) AS total_sales
+    FROM {USER_SALES_TABLE_NAME}
+    WHERE sale_date >= ? AND sale_date < ?
+    GROUP BY month
+    ORDER BY month ASC;
+"""
+
+def _fetch_sales_trend(conn, today: datetime) -> list:
+    """Monthly sales for the 7 calendar months up to today, in Recharts line-chart format."""
+    months = get_trailing_months(today, 7)
+    start_date = months[0].start_time.strftime(SALE_DATE_FORMAT)
+    end_date = (months[-1] + 1).start_time.strftime(SALE_DATE_FORMAT)
+
+    df = pd.read_sql_query(SALES_TREND_QUERY, conn, params=[start_date, end_date])
+
+    # Fill in missing months with 0 sales for a complete trend line
+    full_df = pd.DataFrame({'month': [month.strftime('%Y-%m') for month in months]})
+
+    # Merge with fetched data, filling NaN sales with 0
+    merged_df = pd.merge(full_df, df, on='month', how='left').fillna(0)
+
+    # Format for Recharts: { name: 'Jan', sales: 40000, target: 35000 }
+    # We don't have 'target' data, so we'll omit it or use a placeholder.
+    # Let's just return 'month' as 'name' and 'total_sales' as 'sales'.
+    formatted_data = []
+    for index, row in merged_df.iterrows():
+        # Convert month string to short month name (e.g., '2023-01' to 'Jan')
+        month_name = datetime.strptime(row['month'], '%Y-%m').strftime('%b')
+        formatted_data.append({
+            "name": month_name,
+            "sales": row['total_sales'],
+            "target": row['total_sales'] * 1.1 # Simple placeholder target (10% higher than actual sales)
+        })
+    return formatted_data
+
+@_cached_dashboard_result("sales_trend")
 def get_sales_trend_data(phone_number: str) -> list:
     """
     Fetches monthly sales trend data for the last 7 months.
     """
-    db_path = os.path.join(USER_DATA_DIR, f'sales_{phone_number}.db')
+    db_path = get_user_db_path(phone_number)
     if not os.path.exists(db_path):
         logging.error(f"User database not found at {db_path} for sales trend.")
         return []
 
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        
-        # Get current date and calculate start date for the last 7 months
-        today = datetime.now()
-        start_date = (today - timedelta(days=7 * 30)).strftime('%Y-%m-01') # Approx 7 months ago
-
-        query = f"""
-            SELECT
-                strftime('%Y-%m', sale_date) AS month,
-                SUM(price * quantity_sold) AS total_sales
-            FROM {USER_SALES_TABLE_NAME}
-            WHERE sale_date >= '{start_date}'
-            GROUP BY month
-            ORDER BY month ASC;
-        """
-        df = pd.read_sql_query(query, conn)
-        
-        # Fill in missing months with 0 sales for a complete trend line
-        all_months = []
-        for i in range(7): # Last 7 months
-            month_date = today - timedelta(days=i*30)
-            all_months.append(month_date.strftime('%Y-%m'))
-        all_months.reverse() # Order from oldest to newest
-
-        # Create a DataFrame with all months
-        full_df = pd.DataFrame({'month': all_months})
-        df['month'] = pd.to_datetime(df['month']).dt.strftime('%Y-%m') # Ensure consistent format
-        
-        # Merge with fetched data, filling NaN sales with 0
-        merged_df = pd.merge(full_df, df, on='month', how='left').fillna(0)
-        
-        # Format for Recharts: { name: 'Jan', sales: 40000, target: 35000 }
-        # We don't have 'target' data, so we'll omit it or use a placeholder.
-        # Let's just return 'month' as 'name' and 'total_sales' as 'sales'.
-        formatted_data = []
-        for index, row in merged_df.iterrows():
-            # Convert month string to short month name (e.g., '2023-01' to 'Jan')
-            month_name = datetime.strptime(row['month'], '%Y-%m').strftime('%b')
-            formatted_data.append({
-                "name": month_name,
-                "sales": row['total_sales'],
-                "target": row['total_sales'] * 1.1 # Simple placeholder target (10% higher than actual sales)
-            })
-
-        return formatted_data
+        with read_connection(phone_number) as conn:
+            return _fetch_sales_trend(conn, datetime.now())
 
     except sqlite3.Error as e:
         logging.error(f"SQLite error fetching sales trend for {phone_number}: {e}")
@@ -145,23 +203,18 @@ def get_sales_trend_data(phone_number: str) -> list:
     except Exception as e:
         logging.exception(f"An unexpected error occurred fetching sales trend for {phone_number}:")
         return []
-    finally:
-        if conn:
-            conn.close()
 
+@_cached_dashboard_result("inventory_distribution")
 def get_inventory_distribution_data(phone_number: str) -> list:
     """
     Fetches inventory distribution data by item.
     """
-    db_path = os.path.join(USER_DATA_DIR, f'sales_{phone_number}.db')
+    db_path = get_user_db_path(phone_number)
     if not os.path.exists(db_path):
         logging.error(f"User database not found at {db_path} for inventory distribution.")
         return []
 
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        
         query = f"""
             SELECT item, SUM(quantity_in_stock) AS total_stock
             FROM {USER_SALES_TABLE_NAME}
@@ -169,7 +222,8 @@ def get_inventory_distribution_data(phone_number: str) -> list:
             ORDER BY total_stock DESC
             LIMIT 5; -- Get top 5 items by stock
         """
-        df = pd.read_sql_query(query, conn)
+        with read_connection(phone_number) as conn:
+            df = pd.read_sql_query(query, conn)
         
         # Format for Recharts PieChart: { name: 'Electronics', value: 400 }
         formatted_data = df.rename(columns={'item': 'name', 'total_stock': 'value'}).to_dict(orient='records')
@@ -182,7 +236,35 @@ def get_inventory_distribution_data(phone_number: str) -> list:
     except Exception as e:
         logging.exception(f"An unexpected error occurred fetching inventory distribution for {phone_number}:")
         return []
-    finally:
-        if conn:
-            conn.close()
 
+
+@_cached_dashboard_result("bundle")
+def get_dashboard_bundle(phone_number: str) -> dict:
+    """
+    Fetches everything the dashboard page shows (summary, sales trend, inventory distribution
+    and recent sales) on one read connection: the summary and distribution share a single
+    rollup query, and the trend and recent sales are index range reads.
+    """
+    db_path = get_user_db_path(phone_number)
+    if not os.path.exists(db_path):
+        logging.error(f"User database not found at {db_path} for dashboard bundle.")
+        return {"summary": _empty_summary(), "salesTrend": [], "inventory": [], "recentSales": []}
+
+    try:
+        with read_connection(phone_number) as conn:
+            summary, distribution = _fetch_dashboard_rollup(conn)
+            sales_trend = _fetch_sales_trend(conn, datetime.now())
+            recent_sales = fetch_recent_sales_rows(conn)
+        return {
+            "summary": summary,
+            "salesTrend": sales_trend,
+            "inventory": distribution,
+            "recentSales": recent_sales,
+        }
+
+    except sqlite3.Error as e:
+        logging.error(f"SQLite error fetching dashboard bundle for {phone_number}: {e}")
+        return {}
+    except Exception as e:
+        logging.exception(f"An unexpected error occurred fetching dashboard bundle for {phone_number}:")
+        return {}
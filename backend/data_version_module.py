@@ -0,0 +1,46 @@
+import sqlite3
+import logging
+
+from db_connection_module import read_connection, user_db_exists
+from schema_module import DATA_VERSION_TABLE_NAME
+
+logging.basicConfig(level=logging.INFO)
+
+# Callbacks run as listener(phone_number, new_version) after a write in this process commits
+_listeners = []
+
+def get_data_version(phone_number: str) -> int:
+    """
+    Returns the tenant's current data version. Results derived from the sales table can be
+    cached under this value: every committed write that changes the data increments it in the
+    same transaction, so all worker processes agree on it. One indexed row read per call.
+    """
+    if not user_db_exists(phone_number):
+        return 0
+    try:
+        with read_connection(phone_number) as conn:
+            row = conn.execute(f"SELECT version FROM {DATA_VERSION_TABLE_NAME} WHERE id = 1").fetchone()
+    except sqlite3.OperationalError: # Not migrated yet
+        return 0
+    return row[0] if row else 0
+
+def bump_data_version(conn) -> int:
+    """
+    Increments the data version on an open write connection, inside the transaction that
+    changes the sales data, and returns the new version. Call notify_data_version() once
+    that transaction has committed.
+    """
+    conn.execute(f"UPDATE {DATA_VERSION_TABLE_NAME} SET version = version + 1 WHERE id = 1")
+    return conn.execute(f"SELECT version FROM {DATA_VERSION_TABLE_NAME} WHERE id = 1").fetchone()[0]
+
+def notify_data_version(phone_number: str, version: int):
+    """Tells this process's listeners that the tenant's data changed (other processes see the new version on read)."""
+    for listener in list(_listeners):
+        try:
+            listener(phone_number, version)
+        except Exception:
+            logging.exception(f"Data version listener failed for {phone_number}:")
+
+def add_data_version_listener(listener):
+    """Registers a callback invoked with (phone_number, new_version) whenever a tenant's data changes."""
+    _listeners.append(listener)
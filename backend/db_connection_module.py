@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO)
+
+USER_DATA_DIR = 'user_data'
+
+# Upper bound on open tenant handles (readers and writers combined) before LRU eviction kicks in
+TENANT_DB_MAX_CONNECTIONS = int(os.environ.get("TENANT_DB_MAX_CONNECTIONS", 64))
+
+# Prepared statements kept per pooled connection; repeated chart/dashboard queries skip re-parsing
+TENANT_DB_CACHED_STATEMENTS = int(os.environ.get("TENANT_DB_CACHED_STATEMENTS", 256))
+
+# Applied once to every new tenant connection. busy_timeout goes first so the
+# journal_mode switch waits politely if another process holds the file.
+TENANT_DB_PRAGMAS = (
+    ("busy_timeout", 5000),
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"), # Survives app crashes in WAL mode (not power loss), fsyncs only at checkpoints
+    ("temp_store", "MEMORY"),
+    ("cache_size", -8000), # ~8 MB page cache per connection
+)
+
+# Extra PRAGMAs for read connections only. Writers skip mmap so a large streamed
+# upload does not map (and keep resident) the whole file in the worker.
+TENANT_DB_READ_PRAGMAS = (
+    ("mmap_size", 268435456), # 256 MB of memory-mapped reads
+    ("query_only", "ON"),
+)
+
+# Extra PRAGMAs for pooled write connections only. Sales writes resolve their callers'
+# futures at commit, so every commit is fsynced and survives power loss too; the writer's
+# group commit keeps that to one fsync per batch.
+TENANT_DB_WRITE_PRAGMAS = (
+    ("synchronous", "FULL"),
+)
+
+def get_user_db_path(phone_number: str) -> str:
+    """Returns the path of the per-user sales database for a phone number."""
+    return os.path.join(USER_DATA_DIR, f"sales_{phone_number}.db")
+
+def user_db_exists(phone_number: str) -> bool:
+    """Checks whether the per-user sales database file exists."""
+    return os.path.exists(get_user_db_path(phone_number))
+
+def apply_connection_pragmas(conn: sqlite3.Connection, mode: str | None = None):
+    """Applies the tuned PRAGMAs to a freshly opened connection, plus the extras for a "read" or "write" pool mode."""
+    extra_pragmas = {"read": TENANT_DB_READ_PRAGMAS, "write": TENANT_DB_WRITE_PRAGMAS}.get(mode, ())
+    pragmas = TENANT_DB_PRAGMAS + extra_pragmas
+    for name, value in pragmas:
+        conn.execute(f"PRAGMA {name}={value};")
+
+class _PooledConnection:
+    """
+    An open SQLite handle plus the lock that serializes its use across request threads.
+    users counts the requests that checked it out and have not released it yet; the pool
+    never closes a handle while it is non-zero.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.lock = threading.RLock()
+        self.users = 0
+        self.retired = False # Removed from the pool; closed when the last user releases it
+
+class TenantConnectionManager:
+    """
+    Caches open SQLite connections to the per-user sales databases.
+    Each tenant gets a separate read and write connection so that, with WAL enabled,
+    dashboard reads never queue behind an upload. Least recently used handles that no
+    request has checked out are closed once max_connections is exceeded.
+    """
+
+    def __init__(self, max_connections: int = TENANT_DB_MAX_CONNECTIONS):
+        self.max_connections = max(2, int(max_connections))
+        self._pool = OrderedDict() # (phone_number, mode) -> _PooledConnection, oldest first
+        self._pool_lock = threading.Lock()
+
+    def _open(self, phone_number: str, mode: str) -> _PooledConnection:
+        os.makedirs(USER_DATA_DIR, exist_ok=True)
+        conn = sqlite3.connect(get_user_db_path(phone_number), check_same_thread=False,
+                               cached_statements=TENANT_DB_CACHED_STATEMENTS)
+        apply_connection_pragmas(conn, mode)
+        logging.info(f"Opened pooled {mode} connection for {phone_number}")
+        return _PooledConnection(conn)
+
+    def _evict_locked(self):
+        """Closes unused least-recently-used handles until the pool is within its limit."""
+        for key in list(self._pool.keys()):
+            if len(self._pool) <= self.max_connections:
+                break
+            pooled = self._pool[key]
+            if pooled.users:
+                continue # Checked out by a request; try the next oldest
+            del self._pool[key]
+            pooled.conn.close()
+            logging.info(f"Closed idle {key[1]} connection for {key[0]} (pool limit {self.max_connections})")
+
+    def _checkout(self, phone_number: str, mode: str) -> _PooledConnection:
+        """Returns the tenant's handle, pinned (users + 1) while _pool_lock is still held."""
+        key = (phone_number, mode)
+        with self._pool_lock:
+            pooled = self._pool.get(key)
+            if pooled is None:
+                pooled = self._open(phone_number, mode)
+                self._pool[key] = pooled
+            pooled.users += 1
+            self._pool.move_to_end(key)
+            self._evict_locked()
+            return pooled
+
+    def _release(self, pooled: _PooledConnection):
+        """Unpins a handle; the last user closes it if it was retired or the pool is over its limit."""
+        with self._pool_lock:
+            pooled.users -= 1
+            if pooled.users:
+                return
+            if pooled.retired:
+                pooled.conn.close()
+            elif len(self._pool) > self.max_connections:
+                self._evict_locked()
+
+    @contextmanager
+    def _use(self, phone_number: str, mode: str):
+        pooled = self._checkout(phone_number, mode)
+        try:
+            with pooled.lock:
+                yield pooled.conn
+        finally:
+            self._release(pooled)
+
+    @contextmanager
+    def read(self, phone_number: str):
+        """Yields the tenant's read-only connection."""
+        with self._use(phone_number, "read") as conn:
+            yield conn
+
+    @contextmanager
+    def write(self, phone_number: str):
+        """Yields the tenant's write connection; commits on success and rolls back on error."""
+        with self._use(phone_number, "write") as conn:
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def close(self, phone_number: str | None = None):
+        """
+        Closes the pooled handles for one tenant, or for every tenant when phone_number is None.
+        Handles still checked out are closed by their last user instead.
+        """
+        with self._pool_lock:
+            keys = [key for key in self._pool if phone_number is None or key[0] == phone_number]
+            for key in keys:
+                pooled = self._pool.pop(key)
+                pooled.retired = True
+                if not pooled.users:
+                    pooled.conn.close()
+
+# Shared manager used by every module that touches the per-user sales databases
+tenant_connections = TenantConnectionManager()
+
+def read_connection(phone_number: str):
+    """Shortcut for tenant_connections.read(phone_number)."""
+    return tenant_connections.read(phone_number)
+
+def write_connection(phone_number: str):
+    """Shortcut for tenant_connections.write(phone_number)."""
+    return tenant_connections.write(phone_number)
@@ -0,0 +1,308 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import logging
+
+import pandas as pd
+
+from db_connection_module import read_connection, write_connection
+from schema_module import SALE_COLUMNS, SOURCE_HASH_COLUMN, UPLOADS_TABLE_NAME, ensure_user_sales_db
+from write_queue_module import write_sales
+from time_period_module import normalize_sale_dates
+
+logging.basicConfig(level=logging.INFO)
+
+# Rows read, cleaned and committed per chunk when streaming an upload
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", 10000))
+
+# Largest batch accepted by /add_sales in one request
+MAX_SALES_BATCH_ROWS = int(os.environ.get("MAX_SALES_BATCH_ROWS", 5000))
+
+# Block size used when hashing an upload stream
+UPLOAD_HASH_BLOCK_SIZE = 1024 * 1024
+
+# Bytes of each line's SHA-256 kept by UploadLineCounter; collisions are negligible at 16
+LINE_DIGEST_BYTES = 16
+
+# Digests looked up per SELECT ... IN (...) statement, under SQLite's bound-parameter limit
+LINE_COUNTER_BATCH = 500
+
+# POS export / OCR header variations mapped onto the sales table columns
+SALE_COLUMN_MAPPING = {
+    'product_name': 'item',
+    'stock': 'quantity_in_stock',
+    'units_sold': 'quantity_sold',
+    'date': 'sale_date',
+}
+
+def clean_sales_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Maps raw upload columns onto the sales schema and coerces types.
+    Rows without an item or a parseable sale_date are dropped (the caller can compare lengths).
+    """
+    df = df.rename(columns={col: str(col).strip().lower() for col in df.columns})
+    df = df.rename(columns=SALE_COLUMN_MAPPING)
+
+    # Ensure all required columns are present, fill missing with None/NaN
+    for col in SALE_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+
+    df_cleaned = df[SALE_COLUMNS].copy()
+    df_cleaned['price'] = pd.to_numeric(df_cleaned['price'], errors='coerce').fillna(0)
+    df_cleaned['quantity_in_stock'] = pd.to_numeric(df_cleaned['quantity_in_stock'], errors='coerce').fillna(0).astype(int)
+    df_cleaned['quantity_sold'] = pd.to_numeric(df_cleaned['quantity_sold'], errors='coerce').fillna(0).astype(int)
+    df_cleaned['sale_date'] = normalize_sale_dates(df_cleaned['sale_date'])
+
+    # Drop rows where essential data (item or sale_date) is missing before stringifying items
+    df_cleaned = df_cleaned.dropna(subset=['item', 'sale_date'])
+    df_cleaned['item'] = df_cleaned['item'].astype(str).str.strip()
+    df_cleaned = df_cleaned[df_cleaned['item'] != '']
+    return df_cleaned
+
+def source_line(item, price, quantity_in_stock, quantity_sold, sale_date) -> str:
+    """
+    Canonical text of one cleaned sale, the input of its source hash. Each field is formatted
+    from its value alone (pandas may hold a chunk's prices as int64 or float64 depending on
+    the other rows), so the same line hashes the same in any upload.
+    """
+    return "\x1f".join((str(item), repr(float(price)), str(int(quantity_in_stock)), str(int(quantity_sold)), str(sale_date)))
+
+class UploadLineCounter:
+    """
+    How many times each line has been seen so far in one upload, carried across its chunks.
+    Counts live in a private temporary SQLite database (spilled to a file SQLite deletes on
+    close, not the tenant DB) keyed by a short digest of the line, so memory stays flat
+    however many distinct lines the file has. Use as a context manager, one per upload.
+    """
+
+    def __init__(self):
+        self._conn = sqlite3.connect("") # Empty name: private temporary on-disk database
+        self._conn.execute("CREATE TABLE line_counts (digest BLOB PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID;")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def occurrences(self, lines: list) -> list:
+        """
+        For each line, how many identical lines came before it in this upload (earlier chunks
+        and earlier in lines), and records lines as seen.
+        """
+        digests = [hashlib.sha256(line.encode("utf-8")).digest()[:LINE_DIGEST_BYTES] for line in lines]
+        chunk_counts = {}
+        for digest in digests:
+            chunk_counts[digest] = chunk_counts.get(digest, 0) + 1
+
+        distinct = list(chunk_counts)
+        seen = {}
+        for start in range(0, len(distinct), LINE_COUNTER_BATCH):
+            batch = distinct[start:start + LINE_COUNTER_BATCH]
+            seen.update(self._conn.execute(
+                f"SELECT digest, count FROM line_counts WHERE digest IN ({', '.join('?' * len(batch))});", batch))
+        with self._conn:
+            self._conn.executemany('''
+                INSERT INTO line_counts (digest, count) VALUES (?, ?)
+                ON CONFLICT (digest) DO UPDATE SET count = count + excluded.count
+            ''', chunk_counts.items())
+
+        occurrences = []
+        for digest in digests:
+            occurrence = seen.get(digest, 0)
+            seen[digest] = occurrence + 1
+            occurrences.append(occurrence)
+        return occurrences
+
+def add_source_hashes(df_cleaned: pd.DataFrame, line_counter: UploadLineCounter) -> pd.DataFrame:
+    """
+    Tags each cleaned upload row with a source hash: the SHA-256 of its source_line() plus how
+    many identical rows came before it in the same upload, as counted by line_counter.
+    Re-ingesting an overlapping export skips the lines already stored, while identical lines
+    within one file (equal sales on the same day) are all kept.
+    """
+    lines = [source_line(*row) for row in df_cleaned[SALE_COLUMNS].itertuples(index=False, name=None)]
+    occurrences = line_counter.occurrences(lines)
+    df_cleaned = df_cleaned.copy()
+    df_cleaned[SOURCE_HASH_COLUMN] = [hashlib.sha256(f"{line}\x1e{occurrence}".encode("utf-8")).hexdigest()
+                                      for line, occurrence in zip(lines, occurrences)]
+    return df_cleaned
+
+def ingest_sales_frame(phone_number: str, df_cleaned: pd.DataFrame, line_counter: UploadLineCounter | None = None) -> int:
+    """
+    Writes one cleaned chunk to the tenant DB and the master DB through the tenant's
+    group-commit writer, and waits until it is committed. File uploads pass the upload's
+    line_counter (see add_source_hashes()) so lines ingested before are skipped; POS batches
+    do not, and every row is written.
+    Returns the number of rows inserted; len(df_cleaned) minus this is the duplicates skipped.
+    """
+    if df_cleaned.empty:
+        return 0
+    if line_counter is not None:
+        df_cleaned = add_source_hashes(df_cleaned, line_counter)
+    return write_sales(phone_number, df_cleaned)
+
+def hash_upload(source) -> str:
+    """
+    Returns the SHA-256 hex digest of an upload's content. source may be bytes, str or a
+    seekable file object; file objects are read in blocks and rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        digest.update(source.encode("utf-8"))
+    elif isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    else:
+        position = source.tell()
+        while True:
+            block = source.read(UPLOAD_HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block.encode("utf-8") if isinstance(block, str) else block)
+        source.seek(position)
+    return digest.hexdigest()
+
+def find_upload(phone_number: str, content_hash: str) -> dict | None:
+    """Returns the record of a previously ingested upload with this content hash, if any."""
+    with read_connection(phone_number) as conn:
+        row = conn.execute(f'''
+            SELECT source, rows_written, rows_skipped, uploaded_at FROM {UPLOADS_TABLE_NAME}
+            WHERE content_hash = ?
+        ''', (content_hash,)).fetchone()
+    if row is None:
+        return None
+    return {"source": row[0], "rows_written": row[1], "rows_skipped": row[2], "uploaded_at": row[3]}
+
+def record_upload(phone_number: str, content_hash: str, source: str, rows_written: int, rows_skipped: int):
+    """Remembers an ingested upload so the identical file is a no-op next time."""
+    with write_connection(phone_number) as conn:
+        conn.execute(f'''
+            INSERT INTO {UPLOADS_TABLE_NAME} (content_hash, source, rows_written, rows_skipped)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (content_hash) DO NOTHING
+        ''', (content_hash, source, rows_written, rows_skipped))
+
+def stream_csv_upload(phone_number: str, csv_source, chunk_rows: int | None = None, source: str = "csv") -> dict:
+    """
+    Streams a CSV upload into the tenant and master DBs in bounded chunks, so peak memory
+    depends on chunk_rows rather than the file size. csv_source is a seekable file object
+    (an uploaded file stream or a StringIO). A file whose content hash was already ingested
+    for this tenant is skipped without being parsed.
+    Returns a dict with rows read, written, dropped during cleaning and skipped as duplicates,
+    the chunk count and whether the whole upload was a duplicate.
+    """
+    chunk_rows = int(chunk_rows) if chunk_rows else INGEST_CHUNK_ROWS
+    if chunk_rows <= 0:
+        raise ValueError(f"chunk_rows must be positive, got {chunk_rows}")
+
+    ensure_user_sales_db(phone_number)
+
+    content_hash = hash_upload(csv_source)
+    previous = find_upload(phone_number, content_hash)
+    if previous:
+        logging.info(f"Skipping duplicate {source} upload for {phone_number} (first ingested {previous['uploaded_at']}).")
+        return {
+            "rows_read": 0,
+            "rows_written": 0,
+            "rows_dropped": 0,
+            "rows_skipped": 0,
+            "chunks": 0,
+            "seconds": 0.0,
+            "duplicate_upload": True,
+        }
+
+    start = time.perf_counter()
+    rows_read = rows_valid = rows_written = chunks = 0
+    # dtype=str keeps each chunk's parsing independent of what earlier chunks contained
+    with UploadLineCounter() as line_counter:
+        for raw_chunk in pd.read_csv(csv_source, chunksize=chunk_rows, dtype=str):
+            chunks += 1
+            rows_read += len(raw_chunk)
+            df_cleaned = clean_sales_frame(raw_chunk)
+            rows_valid += len(df_cleaned)
+            rows_written += ingest_sales_frame(phone_number, df_cleaned, line_counter)
+
+    elapsed = time.perf_counter() - start
+    rows_dropped = rows_read - rows_valid
+    rows_skipped = rows_valid - rows_written
+    if rows_dropped:
+        logging.warning(f"Dropped {rows_dropped} rows missing a valid 'item' or 'sale_date' during upload for {phone_number}.")
+    record_upload(phone_number, content_hash, source, rows_written, rows_skipped)
+    logging.info(f"Streamed {rows_written} rows ({rows_skipped} duplicates skipped) in {chunks} chunks for {phone_number} in {elapsed:.3f}s")
+    return {
+        "rows_read": rows_read,
+        "rows_written": rows_written,
+        "rows_dropped": rows_dropped,
+        "rows_skipped": rows_skipped,
+        "chunks": chunks,
+        "seconds": elapsed,
+        "duplicate_upload": False,
+    }
+
+def validate_sales_batch(records: list) -> tuple[pd.DataFrame, list]:
+    """
+    Validates a batch of sale objects (as posted by POS devices) column-wise.
+    Returns a DataFrame of the valid rows in SALE_COLUMNS form and a list of
+    {"index": position in the batch, "errors": [...]} entries for the rejected ones.
+    """
+    row_errors = {}
+    objects = []
+    positions = []
+    for position, record in enumerate(records):
+        if isinstance(record, dict):
+            objects.append(record)
+            positions.append(position)
+        else:
+            row_errors[position] = ["expected a JSON object"]
+
+    df = pd.DataFrame.from_records(objects, index=positions, columns=SALE_COLUMNS)
+    items = df['item'].where(df['item'].notna(), '').astype(str).str.strip()
+    prices = pd.to_numeric(df['price'], errors='coerce')
+    stock = pd.to_numeric(df['quantity_in_stock'], errors='coerce')
+    sold = pd.to_numeric(df['quantity_sold'], errors='coerce')
+    sale_dates = normalize_sale_dates(df['sale_date'])
+
+    checks = [
+        (items == '', "item is required"),
+        (prices.isna() | (prices < 0), "price must be a non-negative number"),
+        (stock.isna() | (stock < 0) | (stock % 1 != 0), "quantity_in_stock must be a non-negative integer"),
+        (sold.isna() | (sold < 0) | (sold % 1 != 0), "quantity_sold must be a non-negative integer"),
+        (sale_dates.isna(), "sale_date must be a valid date such as YYYY-MM-DD"),
+    ]
+    invalid = pd.Series(False, index=df.index)
+    for mask, message in checks:
+        invalid |= mask
+        for position in mask.index[mask]:
+            row_errors.setdefault(position, []).append(message)
+
+    valid = ~invalid
+    df_valid = pd.DataFrame({
+        'item': items[valid],
+        'price': prices[valid].astype(float),
+        'quantity_in_stock': stock[valid].astype(int),
+        'quantity_sold': sold[valid].astype(int),
+        'sale_date': sale_dates[valid],
+    }, columns=SALE_COLUMNS)
+    errors = [{"index": position, "errors": row_errors[position]} for position in sorted(row_errors)]
+    return df_valid, errors
+
+def parse_ndjson_sales(text: str) -> list:
+    """
+    Parses newline-delimited JSON into a list of sale objects. Blank lines are ignored and
+    malformed lines become None, so validate_sales_batch() reports them at their position.
+    """
+    records = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            records.append(None)
+    return records
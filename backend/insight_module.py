@@ -3,14 +3,24 @@ import re
 import pandas as pd
 import sqlite3
 import google.generativeai as genai
-from io import BytesIO
 import os
 import dotenv
-import base64
+import time
 import logging
+import hashlib
 from datetime import datetime
 import pytz
-from gtts import gTTS
+
+from db_connection_module import get_user_db_path
+from schema_module import ensure_user_sales_db
+from chart_query_module import ChartQueryResult, run_chart_query
+from planner_cache_module import planner_cache, hash_planner_context, normalize_question
+from intent_planner_module import plan_fast_path, fast_path_stats
+from data_version_module import get_data_version, add_data_version_listener
+from result_cache_module import ResultCache
+from metrics_module import observe_stage, time_stage, register_stats_collector
+from prompt_data_module import PROMPT_DATA_MAX_ROWS, compact_rows_for_prompt
+from audio_module import detect_answer_language, request_speech
 
 logging.basicConfig(level=logging.INFO)
 dotenv.load_dotenv()
@@ -21,6 +31,22 @@ MODEL_INSIGHT = "gemini-2.0-flash"
 
 USER_SALES_TABLE_NAME = 'sales'
 
+NEPAL_TIMEZONE = 'Asia/Kathmandu'
+
+# Rows of fetched data previewed in the "data" event; the answer LLM works from its own compacted copy
+INSIGHT_STREAM_DATA_MAX_ROWS = int(os.environ.get("INSIGHT_STREAM_DATA_MAX_ROWS", 50))
+
+# Finished insight results (answer text, chart spec and speech language)
+INSIGHT_CACHE_MAX_ENTRIES = int(os.environ.get("INSIGHT_CACHE_MAX_ENTRIES", 512))
+INSIGHT_CACHE_MAX_BYTES = int(os.environ.get("INSIGHT_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+
+insight_cache = ResultCache("insight", INSIGHT_CACHE_MAX_ENTRIES, INSIGHT_CACHE_MAX_BYTES)
+register_stats_collector("insight_cache", insight_cache.stats)
+
+# Version-keyed answers can never be hit again once the tenant's data changes. Fingerprint-keyed
+# ones stay: they are only hit when the data sent to the answer LLM is byte-for-byte the same.
+add_data_version_listener(lambda phone_number, version: insight_cache.invalidate(phone_number, kind="version"))
+
 DATABASE_SCHEMA = f"""
 Table Name: {USER_SALES_TABLE_NAME}
 
@@ -46,9 +72,9 @@ def generate_data_planner_prompt(question: str, db_schema: str) -> str:
 
     {{
       "data_parameters": {{
-        "x_axis": "column_name_for_x_axis", // Required if aggregation or specific grouping is needed
+        "x_axis": "column_name_for_x_axis", // Required for grouping; "month" groups sale_date by calendar month (YYYY-MM). Omit it with an aggregation for a single total
         "y_axis": "column_name_for_y_axis", // Required if aggregation is needed (e.g., 'quantity_sold', 'price')
-        "aggregation": "sum" | "count" | "average" | "none", // 'none' for fetching raw rows
+        "aggregation": "sum" | "count" | "average" | "none", // 'none' for fetching raw y_axis values
         "filter_column": "column_name_to_filter",
         "filter_value": "value_to_filter_by",
         "sort_by": "column_name_to_sort",
@@ -66,6 +92,9 @@ def generate_data_planner_prompt(question: str, db_schema: str) -> str:
     User Question: {question}
     """
 
+# Everything besides the question that the planner output depends on; part of the planner cache key
+PLANNER_CONTEXT_HASH = hash_planner_context(MODEL_PLANNER, generate_data_planner_prompt("", DATABASE_SCHEMA))
+
 def generate_answer_generator_prompt(question: str, specific_data_json: str) -> str:
     """
     Generates the prompt for the Gemini LLM to provide insights and chart instructions,
@@ -100,7 +129,9 @@ def generate_answer_generator_prompt(question: str, specific_data_json: str) ->
     If a visualization is not directly applicable or data is insufficient, set "chart.type" to "none".
     Only provide parameters that are relevant to the chart type and question. For example, if no filtering is needed, omit "filter_column" and "filter_value".
 
-    Here is the specific sales data relevant to the question:
+    Here is the specific sales data relevant to the question. It is JSON with "columns" and "rows" (one array per row,
+    values in column order). When "summary" is present, "rows" is only a sample of "row_count" rows and the summary
+    (totals, min/max/mean, top values, per-period rollups) covers all of them; base totals and rankings on the summary.
     {specific_data_json}
 
     Question: {question}
@@ -111,183 +142,37 @@ def get_nepal_current_date() -> pd.Timestamp:
     """
     Returns the current date in Nepal Standard Time (NPT) as a pandas Timestamp.
     """
-    nepal_tz = pytz.timezone('Asia/Kathmandu')
+    nepal_tz = pytz.timezone(NEPAL_TIMEZONE)
     return pd.Timestamp(datetime.now(nepal_tz).date())
 
-def get_valid_db_column_name(col_name: str | None, phone_number: str) -> str | None:
+def get_planner_cache_ttl(question: str, data_parameters: dict) -> float | None:
     """
-    Validates if a column name exists in the database table (case-insensitive)
-    and returns its exact casing from the DB schema if found.
-    It now takes phone_number to connect to the correct user's database.
+    TTL for a cached plan. An explicit "YYYY-MM-DD to YYYY-MM-DD" range inferred from a relative
+    question ("last 7 days") is only right today, so it expires at the next Nepal midnight;
+    anything else uses the cache default (None).
     """
-    if not col_name:
+    time_period = str((data_parameters or {}).get("time_period") or "")
+    if " to " not in time_period:
         return None
-    
-    # Dynamically build the db_path using the provided phone_number
-    db_path = f"user_data/sales_{phone_number}.db"
-    if not os.path.exists(db_path):
-        logging.error(f"User database not found at {db_path} when validating column '{col_name}'.")
-        return None # Cannot validate if database doesn't exist
+    if all(part.strip() in question for part in time_period.split(" to ", 1)):
+        return None # The question spelled out the dates itself
+    tomorrow = get_nepal_current_date() + pd.Timedelta(days=1)
+    return max(0.0, (tomorrow.tz_localize(NEPAL_TIMEZONE) - pd.Timestamp.now(tz=NEPAL_TIMEZONE)).total_seconds())
 
-    conn = None
-    try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute(f"PRAGMA table_info({USER_SALES_TABLE_NAME});")
-        db_columns_info = cursor.fetchall()
-        conn.close()
-
-        for col_info in db_columns_info:
-            db_col_name = col_info[1]
-            if db_col_name.lower() == col_name.lower():
-                return db_col_name # Return the exact casing from the DB
-        logging.warning(f"Invalid column '{col_name}' suggested. Not found in DB schema for {phone_number}.")
-        return None
-    except sqlite3.Error as e:
-        logging.error(f"SQLite error querying database schema for {phone_number}: {e}")
-        return None
-    except Exception as e:
-        logging.exception(f"An unexpected error occurred while validating column name '{col_name}' for {phone_number}:")
-        return None
-    finally:
-        if conn:
-            conn.close()
-
-def fetch_specific_data_for_llm_analysis(params: dict, phone_number: str) -> pd.DataFrame | None:
+def fetch_specific_data_result(params: dict, phone_number: str) -> ChartQueryResult | None:
     """
     Fetches specific, filtered, and aggregated data from SQLite based on LLM-provided parameters.
-    Returns a Pandas DataFrame.
+    The parameters are compiled by the shared chart query compiler, and at most the prompt's
+    row budget is fetched; larger results come with a summary aggregated in SQL.
+    Returns the query result, or None when the data could not be fetched.
     """
-    db_path = f"user_data/sales_{phone_number}.db"
+    db_path = get_user_db_path(phone_number)
     if not os.path.exists(db_path):
         logging.error(f"User database not found at {db_path}.")
         return None
 
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        
-        x_axis = get_valid_db_column_name(params.get("x_axis"), phone_number)
-        y_axis = get_valid_db_column_name(params.get("y_axis"), phone_number)
-        filter_column = get_valid_db_column_name(params.get("filter_column"), phone_number)
-        sort_by = get_valid_db_column_name(params.get("sort_by"), phone_number)
-
-        aggregation = params.get("aggregation", "none").lower()
-        filter_value = params.get("filter_value")
-        time_period = params.get("time_period")
-        sort_order = params.get("sort_order", "desc").upper()
-        limit = params.get("limit")
-
-        select_parts = []
-        group_by_clause = ""
-        order_by_clause = ""
-        where_clauses = []
-        sql_params = []
-
-        effective_y_axis = y_axis
-
-        # Construct SELECT and GROUP BY clauses
-        if y_axis and (y_axis.lower() == 'total_sales' or (y_axis.lower() == 'price' and aggregation == 'sum')):
-            if x_axis:
-                select_parts.append(f'"{x_axis}"')
-            select_parts.append(f'SUM("price" * "quantity_sold") AS "total_sales"')
-            if x_axis:
-                group_by_clause = f'GROUP BY "{x_axis}"'
-            effective_y_axis = "total_sales"
-        elif aggregation != "none" and x_axis and y_axis:
-            select_parts.append(f'"{x_axis}"')
-            if aggregation == "sum":
-                select_parts.append(f'SUM("{y_axis}") AS "{y_axis}"')
-            elif aggregation == "count":
-                select_parts.append(f'COUNT("{y_axis}") AS "{y_axis}"')
-            elif aggregation == "average":
-                select_parts.append(f'AVG("{y_axis}") AS "{y_axis}"')
-            group_by_clause = f'GROUP BY "{x_axis}"'
-            effective_y_axis = y_axis
-        elif x_axis and y_axis:
-            select_parts.append(f'"{x_axis}"')
-            select_parts.append(f'"{y_axis}"')
-            effective_y_axis = y_axis
-        else:
-            select_parts.append("*")
-            effective_y_axis = None
-
-        select_clause = f"SELECT {', '.join(select_parts)}"
-
-        # Construct WHERE clauses
-        if time_period:
-            current_date_nepal = get_nepal_current_date()
-
-            if time_period == "this_month":
-                where_clauses.append(f'"sale_date" BETWEEN ? AND ?')
-                sql_params.extend([current_date_nepal.strftime('%Y-%m-01'), (current_date_nepal + pd.DateOffset(months=1, days=-1)).strftime('%Y-%m-%d')])
-            elif time_period == "last_month":
-                last_month_start = (current_date_nepal - pd.DateOffset(months=1)).strftime('%Y-%m-01')
-                last_month_end = (current_date_nepal.replace(day=1) - pd.DateOffset(days=1)).strftime('%Y-%m-%d')
-                where_clauses.append(f'"sale_date" BETWEEN ? AND ?')
-                sql_params.extend([last_month_start, last_month_end])
-            elif time_period == "this_quarter":
-                q = current_date_nepal.quarter
-                y = current_date_nepal.year
-                start_q_month = (q - 1) * 3 + 1
-                end_q_month = q * 3
-                start_q = pd.Timestamp(year=y, month=start_q_month, day=1).strftime('%Y-%m-%d')
-                end_q = pd.Timestamp(year=y, month=end_q_month, day=pd.Timestamp(year=y, month=end_q_month, day=1).days_in_month).strftime('%Y-%m-%d')
-                where_clauses.append(f'"sale_date" BETWEEN ? AND ?')
-                sql_params.extend([start_q, end_q])
-            elif time_period == "last_quarter":
-                last_q_date = current_date_nepal - pd.DateOffset(months=3)
-                q = last_q_date.quarter
-                y = last_q_date.year
-                start_q_month = (q - 1) * 3 + 1
-                end_q_month = q * 3
-                start_q = pd.Timestamp(year=y, month=start_q_month, day=1).strftime('%Y-%m-%d')
-                end_q = pd.Timestamp(year=y, month=end_q_month, day=pd.Timestamp(year=y, month=end_q_month, day=1).days_in_month).strftime('%Y-%m-%d')
-                where_clauses.append(f'"sale_date" BETWEEN ? AND ?')
-                sql_params.extend([start_q, end_q])
-            elif time_period == "ytd":
-                where_clauses.append(f'STRFTIME("%Y", "sale_date") = ?')
-                sql_params.append(str(current_date_nepal.year))
-            elif " to " in time_period:
-                try:
-                    start_date_str, end_date_str = time_period.split(" to ")
-                    pd.to_datetime(start_date_str, errors='raise')
-                    pd.to_datetime(end_date_str, errors='raise')
-                    where_clauses.append(f'"sale_date" BETWEEN ? AND ?')
-                    sql_params.extend([start_date_str, end_date_str])
-                except ValueError:
-                    logging.warning(f"Invalid date range format '{time_period}'. Ignoring time filter.")
-            elif time_period == "all_time":
-                pass
-            else:
-                logging.warning(f"Unsupported time_period '{time_period}'. Ignoring time filter.")
-
-        if filter_column and filter_value is not None:
-            where_clauses.append(f'"{filter_column}" = ?')
-            sql_params.append(filter_value)
-
-        where_clause_str = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
-
-        # Construct ORDER BY clause
-        if sort_by:
-            if effective_y_axis and sort_by.lower() == y_axis.lower():
-                order_by_clause = f'ORDER BY "{effective_y_axis}" {sort_order}'
-            else:
-                order_by_clause = f'ORDER BY "{sort_by}" {sort_order}'
-
-        # Construct LIMIT clause
-        limit_clause = f"LIMIT {int(limit)}" if limit is not None and int(limit) >= 0 else ""
-
-        query = f"{select_clause} FROM {USER_SALES_TABLE_NAME} {where_clause_str} {group_by_clause} {order_by_clause} {limit_clause}".strip()
-
-        logging.info(f"Executing SQL Query: {query} for {phone_number} with params: {sql_params}")
-
-        df = pd.read_sql_query(query, conn, params=sql_params)
-
-        if 'sale_date' in df.columns:
-            df['sale_date'] = pd.to_datetime(df['sale_date'], errors='coerce').dt.strftime('%Y-%m-%d')
-            
-        return df
+        return run_chart_query(params, phone_number, get_nepal_current_date(), max_rows=PROMPT_DATA_MAX_ROWS)
 
     except sqlite3.Error as e:
         logging.error(f"SQLite error during specific data fetch for {phone_number}: {e}")
@@ -295,77 +180,214 @@ def fetch_specific_data_for_llm_analysis(params: dict, phone_number: str) -> pd.
     except Exception as e:
         logging.exception(f"An unexpected error occurred during specific data fetch for {phone_number}: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
 
+class InsightTextStream:
+    """
+    Pulls the value of the "insight" field out of the answer LLM's JSON while it is still
+    being generated, so the text can be shown before the rest of the JSON has arrived.
+    """
 
-def get_ai_insights_and_chart_data(question: str, phone_number: str) -> dict:
+    _INSIGHT_START = re.compile(r'"insight"\s*:\s*"')
+
+    def __init__(self):
+        self._buffer = ""
+        self._started = False
+        self.finished = False
+
+    def feed(self, chunk: str) -> str:
+        """Adds a chunk of LLM output and returns the newly decoded insight text, if any."""
+        if self.finished:
+            return ""
+        self._buffer += chunk
+        if not self._started:
+            match = self._INSIGHT_START.search(self._buffer)
+            if not match:
+                return ""
+            self._started = True
+            self._buffer = self._buffer[match.end():]
+
+        raw = self._buffer
+        i = 0
+        high_surrogate_at = None # A \uD800-\uDBFF escape must be decoded together with the next one
+        while i < len(raw):
+            if raw[i] == '"':
+                self.finished = True
+                break
+            if raw[i] != "\\":
+                high_surrogate_at = None
+                i += 1
+                continue
+            width = 6 if raw[i + 1:i + 2] == "u" else 2
+            if i + width > len(raw):
+                break # Escape sequence split across chunks
+            is_high_surrogate = width == 6 and raw[i + 2:i + 3] in "dD" and raw[i + 3:i + 4] in "89abAB"
+            high_surrogate_at = i if is_high_surrogate else None
+            i += width
+
+        end = i if self.finished or high_surrogate_at is None else high_surrogate_at
+        self._buffer = "" if self.finished else raw[end:]
+        try:
+            return json.loads(f'"{raw[:end]}"', strict=False)
+        except json.JSONDecodeError:
+            return raw[:end]
+
+def _error_events(error_msg: str):
+    yield "error", {"full_answer": error_msg, "chart_data": {"type": "none"}}
+    yield "audio", request_speech(error_msg, "en")
+
+def _result_events(result: dict):
+    yield "insight", {"full_answer": result["full_answer"], "chart_data": result["chart_data"]}
+    # Re-requesting is free while the audio is still held, and re-synthesizes it otherwise
+    yield "audio", request_speech(result["full_answer"], result["audio_lang"])
+
+def iter_ai_insight_events(question: str, phone_number: str):
     """
-    Centralized function to get AI insights, audio, and chart data for a given question.
-    This encapsulates the two-step LLM process (data planning and answer generation).
+    Runs the insight pipeline for a question and yields (event, payload) pairs as each stage
+    finishes, so callers can stream them:
+
+    - "planner": {"data_parameters", "source"}, source being "fast_path", "cache" or "llm"
+    - "data": {"columns", "data", "row_count", "truncated"}, a preview of the rows fetched
+      for the question (at most INSIGHT_STREAM_DATA_MAX_ROWS of them)
+    - "token": {"text"}, the next piece of the insight text while the answer LLM generates it
+    - "insight": {"full_answer", "chart_data"}, the final answer
+    - "error": {"full_answer", "chart_data"}, in place of "insight" when a stage failed
+    - "audio": {"audio_id", "audio_url"}, always last: a handle for the speech being
+      synthesized in the background (see audio_module), not the audio itself
+
+    Finished results are cached per tenant under the normalized question plus the data
+    version and a fingerprint of the data sent to the answer LLM; a cache hit yields only
+    "insight" and "audio".
     """
-    user_db_path = f"user_data/sales_{phone_number}.db"
+    user_db_path = get_user_db_path(phone_number)
 
     if not os.path.exists(user_db_path):
         error_msg = "User sales data not found. Please ensure you have added sales data for this phone number."
         logging.warning(error_msg)
-        return {
-            "full_answer": error_msg,
-            "chart_data": {"type": "none"},
-            "audio_base64": text_to_audio_base64(error_msg)
-        }
-    
-    data_planner_prompt = generate_data_planner_prompt(question, DATABASE_SCHEMA)
+        yield from _error_events(error_msg)
+        return
+
+    # Same question against unchanged data gives the same answer. Relative periods ("this
+    # month") move with the date, so the version key includes today; the fingerprint key
+    # below also catches repeats whose data happens to be unchanged across versions.
+    today = get_nepal_current_date()
+    question_key = normalize_question(question)
+    version_key = (phone_number, "version", question_key, get_data_version(phone_number), today.strftime('%Y-%m-%d'))
+    cached_result = insight_cache.get(version_key)
+    if cached_result is not None:
+        logging.info(f"Insight cache hit for '{question_key}' (data version)")
+        yield from _result_events(cached_result)
+        return
+
     data_planner_text = ""
     try:
-        data_planner_response = genai.GenerativeModel(MODEL_PLANNER).generate_content(
-            contents=data_planner_prompt
-        )
-        data_planner_text = data_planner_response.text.strip()
-        logging.info(f"Data Planner LLM Raw Response: {data_planner_text}")
-
-        json_match = re.search(r'\{.*\}', data_planner_text, re.DOTALL)
-        if not json_match:
-            logging.error("Data Planner LLM did not return valid JSON. Fallback to general error.")
-            return {"full_answer": "AI could not plan data retrieval. Please rephrase.", "chart_data": {"type": "none"}, "audio_base64": text_to_audio_base64("AI could not plan data retrieval. Please rephrase.")}
-
-        parsed_data_planner_response = json.loads(json_match.group(0))
-        data_params_for_fetch = parsed_data_planner_response.get("data_parameters", {})
+        # Common question shapes are planned locally; the plan otherwise depends only on the
+        # question and the schema, so repeated questions skip the LLM as well
+        planner_source = "fast_path"
+        data_params_for_fetch = plan_fast_path(question, today)
+        if data_params_for_fetch is None:
+            planner_source = "cache"
+            data_params_for_fetch = planner_cache.get(question, PLANNER_CONTEXT_HASH)
+            if data_params_for_fetch is not None:
+                logging.info(f"Data Planner cache hit: {data_params_for_fetch}")
+        if data_params_for_fetch is None:
+            planner_source = "llm"
+            data_planner_prompt = generate_data_planner_prompt(question, DATABASE_SCHEMA)
+            planner_start = time.perf_counter()
+            data_planner_response = genai.GenerativeModel(MODEL_PLANNER).generate_content(
+                contents=data_planner_prompt
+            )
+            planner_seconds = time.perf_counter() - planner_start
+            fast_path_stats.record_llm_call(planner_seconds)
+            observe_stage("planner_llm", planner_seconds)
+            data_planner_text = data_planner_response.text.strip()
+            logging.info(f"Data Planner LLM Raw Response: {data_planner_text}")
+
+            json_match = re.search(r'\{.*\}', data_planner_text, re.DOTALL)
+            if not json_match:
+                logging.error("Data Planner LLM did not return valid JSON. Fallback to general error.")
+                yield from _error_events("AI could not plan data retrieval. Please rephrase.")
+                return
+
+            parsed_data_planner_response = json.loads(json_match.group(0))
+            data_params_for_fetch = parsed_data_planner_response.get("data_parameters", {})
+            planner_cache.put(question, PLANNER_CONTEXT_HASH, data_params_for_fetch,
+                              ttl_seconds=get_planner_cache_ttl(question, data_params_for_fetch))
+
+        yield "planner", {"data_parameters": data_params_for_fetch, "source": planner_source}
 
         specific_data_json_str = ""
         if not data_params_for_fetch:
             logging.info("Data Planner LLM returned empty data_parameters. Proceeding with limited data.")
             specific_data_json_str = json.dumps({"status": "no_params", "message": "No specific data parameters identified for this query."})
         else:
-            specific_data_df = fetch_specific_data_for_llm_analysis(data_params_for_fetch, phone_number)
+            specific_data_result = fetch_specific_data_result(data_params_for_fetch, phone_number)
 
-            if specific_data_df is None or specific_data_df.empty:
+            if specific_data_result is None or not specific_data_result.rows:
                 logging.warning("Failed to retrieve specific sales data or data is empty.")
                 specific_data_json_str = json.dumps({"status": "no_data_found", "message": "No relevant sales data found for your query based on current data."})
             else:
-                specific_data_json_str = specific_data_df.to_json(orient='records', date_format='iso')
+                rows = specific_data_result.rows
+                yield "data", {
+                    "columns": specific_data_result.columns,
+                    "data": rows[:INSIGHT_STREAM_DATA_MAX_ROWS],
+                    "row_count": specific_data_result.row_count,
+                    "truncated": specific_data_result.row_count > INSIGHT_STREAM_DATA_MAX_ROWS,
+                }
+                # Bounded by row and token budgets however large the result is; capped
+                # results were already ordered and summarized in SQL
+                with time_stage("prompt_data"):
+                    specific_data_json_str = compact_rows_for_prompt(
+                        specific_data_result.columns, rows,
+                        ordered=specific_data_result.truncated or bool(data_params_for_fetch.get("sort_by")),
+                        row_count=specific_data_result.row_count,
+                        summary=specific_data_result.summary,
+                    ).text
 
     except json.JSONDecodeError as e:
         logging.error(f"JSON parsing error from Data Planner LLM: {e}")
-        error_msg = f"AI response parsing error. Raw LLM response: {data_planner_text[:200]}..."
-        return {"full_answer": error_msg, "chart_data": {"type": "none"}, "audio_base64": text_to_audio_base64(error_msg)}
+        yield from _error_events(f"AI response parsing error. Raw LLM response: {data_planner_text[:200]}...")
+        return
     except genai.types.APIError as e:
         logging.error(f"Gemini API error during Data Planner call: {e}")
-        error_msg = f"AI service error during data planning: {e.args[0] if e.args else 'Unknown API Error'}"
-        return {"full_answer": error_msg, "chart_data": {"type": "none"}, "audio_base64": text_to_audio_base64(error_msg)}
+        yield from _error_events(f"AI service error during data planning: {e.args[0] if e.args else 'Unknown API Error'}")
+        return
     except Exception as e:
         logging.exception("An unexpected error occurred during data planning/fetching:")
-        error_msg = f"An unexpected error occurred: {str(e)}"
-        return {"full_answer": error_msg, "chart_data": {"type": "none"}, "audio_base64": text_to_audio_base64(error_msg)}
+        yield from _error_events(f"An unexpected error occurred: {str(e)}")
+        return
+
+    data_fingerprint = hashlib.sha256(specific_data_json_str.encode("utf-8")).hexdigest()
+    fingerprint_key = (phone_number, "data", question_key, data_fingerprint)
+    cached_result = insight_cache.get(fingerprint_key)
+    if cached_result is not None:
+        logging.info(f"Insight cache hit for '{question_key}' (data fingerprint)")
+        insight_cache.put(version_key, cached_result)
+        yield from _result_events(cached_result)
+        return
 
     answer_generator_prompt = generate_answer_generator_prompt(question, specific_data_json_str)
     full_llm_response_text = ""
     try:
+        answer_start = time.perf_counter()
         answer_generator_response = genai.GenerativeModel(MODEL_INSIGHT).generate_content(
-            contents=answer_generator_prompt
+            contents=answer_generator_prompt, stream=True
         )
-        full_llm_response_text = answer_generator_response.text.strip()
+        insight_text_stream = InsightTextStream()
+        response_chunks = []
+        for chunk in answer_generator_response:
+            try:
+                chunk_text = chunk.text
+            except ValueError:
+                continue # A chunk without text parts (e.g. only finish metadata)
+            if not response_chunks:
+                observe_stage("answer_llm_first_chunk", time.perf_counter() - answer_start)
+            response_chunks.append(chunk_text)
+            insight_text = insight_text_stream.feed(chunk_text)
+            if insight_text:
+                yield "token", {"text": insight_text}
+        # For /insights/stream this also covers handing each token to the client
+        full_llm_response_text = "".join(response_chunks).strip()
+        observe_stage("answer_llm", time.perf_counter() - answer_start)
         logging.info(f"Answer Generator LLM Raw Response: {full_llm_response_text}")
 
         parsed_response = {}
@@ -381,158 +403,68 @@ def get_ai_insights_and_chart_data(question: str, phone_number: str) -> dict:
             full_answer = full_llm_response_text
             logging.warning("Answer Generator LLM response did not contain a valid JSON block. Using full text as answer.")
 
-        audio_base64 = ""
-        try:
-            lang = "ne" if "नेपाली" in question.lower() or "nepali" in question.lower() else "en"
-            tts = gTTS(text=full_answer, lang=lang, slow=False)
-            audio_bytes = BytesIO()
-            tts.write_to_fp(audio_bytes)
-            audio_bytes.seek(0)
-            audio_base64 = base64.b64encode(audio_bytes.read()).decode("utf-8")
-        except ImportError:
-            logging.warning("gTTS not installed. Skipping audio generation.")
-        except Exception as tts_e:
-            logging.error(f"Error generating TTS audio: {tts_e}")
-
-        return {
+        yield "insight", {"full_answer": full_answer, "chart_data": chart_data_for_frontend}
+
+        audio_lang = detect_answer_language(question)
+        result = {
             "full_answer": full_answer,
-            "audio_base64": audio_base64,
-            "chart_data": chart_data_for_frontend
+            "chart_data": chart_data_for_frontend,
+            "audio_lang": audio_lang
         }
+        insight_cache.put(fingerprint_key, result)
+        insight_cache.put(version_key, result)
+        yield "audio", request_speech(full_answer, audio_lang)
 
     except genai.types.APIError as e:
         logging.error(f"Gemini API error during Answer Generator call: {e}")
-        error_msg = f"AI service error during insight generation: {e.args[0] if e.args else 'Unknown API Error'}"
-        return {"full_answer": error_msg, "chart_data": {"type": "none"}, "audio_base64": text_to_audio_base64(error_msg)}
+        yield from _error_events(f"AI service error during insight generation: {e.args[0] if e.args else 'Unknown API Error'}")
     except Exception as e:
-        logging.exception("Error during LLM processing or TTS:")
-        error_msg = f"An unexpected error occurred: {str(e)}"
-        return {"full_answer": error_msg, "chart_data": {"type": "none"}, "audio_base64": text_to_audio_base64(error_msg)}
+        logging.exception("Error during LLM processing:")
+        yield from _error_events(f"An unexpected error occurred: {str(e)}")
 
-def text_to_audio_base64(text: str) -> str:
+def get_ai_insights_and_chart_data(question: str, phone_number: str) -> dict:
     """
-    Converts text to speech and returns a base64 encoded audio string.
+    Centralized function to get AI insights, an audio handle, and chart data for a given
+    question. This encapsulates the two-step LLM process (data planning and answer generation)
+    by collecting the events of iter_ai_insight_events() into one result.
     """
-    try:
-        tts = gTTS(text=text, lang='en', slow=False)
-        audio_bytes = BytesIO()
-        tts.write_to_fp(audio_bytes)
-        audio_bytes.seek(0)
-        return base64.b64encode(audio_bytes.read()).decode("utf-8")
-    except Exception as e:
-        logging.error(f"Error in text_to_audio_base64: {e}")
-        return ""
+    result = {"full_answer": "", "chart_data": {"type": "none"}, "audio_id": None, "audio_url": None}
+    for event, payload in iter_ai_insight_events(question, phone_number):
+        if event in ("insight", "error", "audio"):
+            result.update(payload)
+    return result
 
 def initialize_database(phone_number: str):
     """
     Ensures the SQLite database and table for a specific user exist.
+    Delegates to the shared migration runner so every tenant DB has the same schema.
     """
-    user_db_dir = "user_data"
-    os.makedirs(user_db_dir, exist_ok=True)
-    user_db_path = os.path.join(user_db_dir, f"sales_{phone_number}.db")
+    try:
+        ensure_user_sales_db(phone_number)
+    except Exception as e:
+        logging.exception(f"Could not create database for {phone_number}:")
+        raise
 
-    if not os.path.exists(user_db_path):
-        logging.info(f"Database not found at {user_db_path}. Creating a new one with the specified schema.")
-        try:
-            conn = sqlite3.connect(user_db_path)
-            cursor = conn.cursor()
-            cursor.execute(f"""
-                CREATE TABLE {USER_SALES_TABLE_NAME} (
-                    "item" TEXT,
-                    "price" REAL,
-                    "quantity_in_stock" INTEGER,
-                    "quantity_sold" INTEGER,
-                    "sale_date" TEXT
-                );
-            """)
-            conn.commit()
-            conn.close()
-            logging.info(f"Empty '{user_db_path}' created with the specified schema.")
-        except Exception as e:
-            logging.exception(f"Could not create database for {phone_number}:")
-            raise
-
-
-def fetch_dynamic_chart_data(chart_parameters: dict, phone_number: str) -> pd.DataFrame:
+
+def fetch_dynamic_chart_data(chart_parameters: dict, phone_number: str) -> ChartQueryResult | None:
     """
-    Fetches raw data for dynamic chart generation based on direct parameters from frontend.
-    This is designed for the /api/dynamic-chart-data endpoint.
+    Fetches chart rows based on direct parameters from frontend.
+    This is designed for the /api/dynamic-chart-data endpoint: sort_by, sort_order and
+    limit are applied in SQL, and the result's columns and cursor rows are serialized as is.
+    Returns None when there is no data or the parameters are invalid.
     """
-    db_path = f"user_data/sales_{phone_number}.db"
+    db_path = get_user_db_path(phone_number)
     if not os.path.exists(db_path):
         logging.error(f"User database not found at {db_path} for chart data.")
-        return pd.DataFrame()
+        return None
 
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        
-        # Get raw parameters from LLM suggestion
-        raw_x_axis = chart_parameters.get("x_axis")
-        raw_y_axis = chart_parameters.get("y_axis")
-        aggregation = chart_parameters.get("aggregation", "none").lower()
-        
-        # Validate x_axis against DB schema (it should be a physical column for grouping)
-        x_axis_col = get_valid_db_column_name(raw_x_axis, phone_number)
-        
-        # Determine the actual y-axis column name in the query result
-        # This can be a physical column or a derived alias like 'total_sales'
-        y_axis_col_in_query = None
-        if raw_y_axis and (raw_y_axis.lower() == 'total_sales' or (raw_y_axis.lower() == 'price' and aggregation == 'sum')):
-            y_axis_col_in_query = "total_sales"
-        else:
-            # If not 'total_sales' or 'price' with sum, validate it as a regular column
-            y_axis_col_in_query = get_valid_db_column_name(raw_y_axis, phone_number)
-
-        # Ensure we have valid columns to proceed
-        # If x_axis_col or y_axis_col_in_query is None, we cannot build a meaningful query
-        if not x_axis_col or not y_axis_col_in_query:
-            logging.warning(f"Insufficient valid columns for dynamic chart data. x_axis_col: {x_axis_col}, y_axis_col_in_query: {y_axis_col_in_query}")
-            return pd.DataFrame()
-
-        select_parts = []
-        group_by_clause = ""
-        
-        # Always select the x_axis column
-        select_parts.append(f'"{x_axis_col}"')
-
-        # Determine how to select the y-axis, handling aggregation and aliases
-        if y_axis_col_in_query == "total_sales":
-            select_parts.append(f'SUM("price" * "quantity_sold") AS "total_sales"')
-        elif aggregation == "sum":
-            select_parts.append(f'SUM("{y_axis_col_in_query}") AS "{y_axis_col_in_query}"')
-        elif aggregation == "count":
-            select_parts.append(f'COUNT("{y_axis_col_in_query}") AS "{y_axis_col_in_query}"')
-        elif aggregation == "average":
-            select_parts.append(f'AVG("{y_axis_col_in_query}") AS "{y_axis_col_in_query}"')
-        else: # No aggregation, direct selection of the y_axis column
-            select_parts.append(f'"{y_axis_col_in_query}"')
-
-        # Group by the x_axis column for aggregated queries
-        group_by_clause = f'GROUP BY "{x_axis_col}"'
-
-        # Order by the actual y-axis column name in the query result
-        order_by_clause = f'ORDER BY "{y_axis_col_in_query}" DESC LIMIT 10'
-
-        query = f"SELECT {', '.join(select_parts)} FROM {USER_SALES_TABLE_NAME} {group_by_clause} {order_by_clause}".strip()
-
-        logging.info(f"Executing dynamic chart SQL Query: {query} for {phone_number}")
-        
-        df = pd.read_sql_query(query, conn)
-        
-        # Ensure sale_date is in YYYY-MM-DD format if it's an x_axis
-        if x_axis_col and x_axis_col.lower() == 'sale_date' and 'sale_date' in df.columns:
-            df['sale_date'] = pd.to_datetime(df['sale_date'], errors='coerce').dt.strftime('%Y-%m-%d')
-
-        return df
+        # Both axes are required here; rows are grouped by the x axis
+        return run_chart_query(chart_parameters, phone_number, get_nepal_current_date(), chart=True)
 
     except sqlite3.Error as e:
         logging.error(f"SQLite error during dynamic chart data fetch for {phone_number}: {e}")
-        return pd.DataFrame()
+        return None
     except Exception as e:
         logging.exception(f"An unexpected error occurred during dynamic chart data fetch for {phone_number}:")
-        return pd.DataFrame()
-    finally:
-        if conn:
-            conn.close()
-
+        return None
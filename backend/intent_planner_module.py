@@ -0,0 +1,265 @@
+import time
+import logging
+import threading
+
+import pandas as pd
+
+from planner_cache_module import normalize_question
+from time_period_module import SALE_DATE_FORMAT
+from metrics_module import observe_stage, register_stats_collector
+
+logging.basicConfig(level=logging.INFO)
+
+# Default N for "top items" style questions that do not give one
+FAST_PATH_DEFAULT_LIMIT = 5
+FAST_PATH_MAX_LIMIT = 50
+
+# Devanagari digits -> ASCII, so "शीर्ष ५ सामान" reads like "top 5 items"
+_DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+
+# Case markers and plural suffixes glued onto Nepali words ("महिनाको", "सामानहरू")
+_NEPALI_SUFFIXES = ("हरूको", "हरूमा", "हरू", "लाई", "को", "का", "की", "मा", "ले")
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "twenty": 20,
+    "एक": 1, "दुई": 2, "तीन": 3, "चार": 4, "पाँच": 5, "पाच": 5, "छ": 6, "सात": 7, "आठ": 8, "नौ": 9, "दस": 10,
+}
+
+# Phrases are matched on normalized tokens, longest first. Values are planner time_period
+# keywords; "today" and "yesterday" become explicit single-day ranges.
+_TIME_PHRASES = {
+    "this_month": ["this month", "current month", "यो महिना", "यस महिना", "yo mahina"],
+    "last_month": ["last month", "previous month", "गत महिना", "अघिल्लो महिना", "गएको महिना", "gata mahina", "agillo mahina"],
+    "this_quarter": ["this quarter", "current quarter", "यो त्रैमास", "यो त्रैमासिक"],
+    "last_quarter": ["last quarter", "previous quarter", "गत त्रैमास", "अघिल्लो त्रैमास"],
+    "ytd": ["this year", "year to date", "ytd", "so far this year", "यो वर्ष", "यो साल", "yo barsa", "yo sal"],
+    "all_time": ["all time", "ever", "overall", "till now", "so far", "हालसम्म", "अहिलेसम्म", "sadhai"],
+    "today": ["today", "आज", "aaja", "aja"],
+    "yesterday": ["yesterday", "हिजो", "hijo"],
+}
+
+_INTENT_PHRASES = {
+    "top_items": [
+        "top selling", "best selling", "best sellers", "best seller", "most sold", "most selling",
+        "highest selling", "top", "best", "popular", "most popular",
+        "सबैभन्दा बढी बिक्री", "सबैभन्दा धेरै बिक्री", "बढी बिक्री", "धेरै बिक्री", "धेरै बिकेको", "शीर्ष",
+        "sabai bhanda badhi bikri", "sabaibhanda badhi bikri", "badhi bikri", "dherai bikri", "dherai bikeko",
+    ],
+    "bottom_items": [
+        "least selling", "least sold", "worst selling", "lowest selling", "slow moving", "slowest selling",
+        "सबैभन्दा कम बिक्री", "कम बिक्री", "कम बिकेको", "sabai bhanda kam bikri", "kam bikri", "kam bikeko",
+    ],
+    "total_sales": [
+        "total sales", "total revenue", "total earnings", "how much did i sell", "how much did we sell",
+        "how much revenue", "कुल बिक्री", "जम्मा बिक्री", "कति बिक्री", "kul bikri", "jamma bikri", "kati bikri",
+    ],
+    "sales_trend": [
+        "sales trend", "daily sales", "trend", "बिक्री प्रवृत्ति", "प्रवृत्ति", "ट्रेन्ड", "दैनिक बिक्री", "bikri trend",
+    ],
+    "low_stock": [
+        "low stock", "low on stock", "low in stock", "out of stock", "running out", "running low",
+        "stock levels", "stock level",
+        "कम स्टक", "स्टक कम", "स्टक सकिन", "kam stock", "stock kam",
+    ],
+}
+
+# Asking for a trend bucketed by calendar month instead of by day
+_MONTHLY_PHRASES = [
+    "monthly", "month wise", "month by month", "per month", "each month", "every month",
+    "महिनावारी", "महिना अनुसार", "मासिक", "mahinawari", "mahina anusar", "masik",
+]
+
+# Asking for units instead of revenue
+_QUANTITY_PHRASES = ["quantity", "units", "unit", "qty", "how many", "pieces", "कति वटा", "वटा", "संख्या", "kati wata"]
+
+# Words that carry no planning information; anything else left over means "not sure, ask the LLM"
+_FILLER_WORDS = set("""
+    what which who are is was were the my our me us show list give tell of in for on during by
+    items item products product goods things sales sale sold selling sell revenue earnings
+    i we did do does have has had shop store please a an to from with and so far how much
+    what's whats can you let see get find display their its this that these those been be
+    के कुन कुनकुन हुन् हो छ छन् थियो थिए भयो भए भएको मेरो हाम्रो मलाई देखाउनुहोस् देखाउ देखाऊ
+    बताउनुहोस् बताउ भन सामान वस्तु बिक्री बिकेको बिके पसल कृपया र मा कति
+    ke kun hun ho cha chan thiyo bhayo bhaeko mero hamro malai dekhau batau saman samaan bikri pasal
+    kati ko ma le lai ra
+""".split())
+
+def _tokenize(question: str) -> list:
+    tokens = []
+    for token in normalize_question(question).translate(_DEVANAGARI_DIGITS).split():
+        for suffix in _NEPALI_SUFFIXES:
+            if token.endswith(suffix) and len(token) > len(suffix) + 1:
+                token = token[:-len(suffix)]
+                break
+        tokens.append(token)
+    return tokens
+
+def _compile_phrases(phrases: list) -> list:
+    """Tokenizes phrases the same way as questions, longest first."""
+    return sorted((tuple(_tokenize(phrase)) for phrase in phrases), key=len, reverse=True)
+
+_TIME_PATTERNS = {name: _compile_phrases(phrases) for name, phrases in _TIME_PHRASES.items()}
+_INTENT_PATTERNS = {name: _compile_phrases(phrases) for name, phrases in _INTENT_PHRASES.items()}
+_MONTHLY_PATTERNS = _compile_phrases(_MONTHLY_PHRASES)
+_QUANTITY_PATTERNS = _compile_phrases(_QUANTITY_PHRASES)
+
+def _consume(tokens: list, used: list, patterns: list) -> bool:
+    """Marks the first (longest) pattern found among the unused tokens as used."""
+    for words in patterns:
+        for start in range(len(tokens) - len(words) + 1):
+            window = range(start, start + len(words))
+            if all(not used[i] and tokens[i] == word for i, word in zip(window, words)):
+                for i in window:
+                    used[i] = True
+                return True
+    return False
+
+def _match_group(tokens: list, used: list, groups: dict) -> str | None:
+    matched = None
+    for name, patterns in groups.items():
+        if _consume(tokens, used, patterns):
+            if matched is not None and matched != name:
+                return "ambiguous"
+            matched = name
+    return matched
+
+def match_data_parameters(question: str, today: pd.Timestamp) -> dict | None:
+    """
+    Deterministically maps common questions (top/bottom N items, total sales, daily or monthly
+    trend, low stock; English, Nepali and romanized Nepali) onto the same data_parameters the LLM
+    planner would emit. Returns None whenever any part of the question is not understood.
+    """
+    tokens = _tokenize(question)
+    if not tokens:
+        return None
+    used = [False] * len(tokens)
+
+    time_period = _match_group(tokens, used, _TIME_PATTERNS)
+    intent = _match_group(tokens, used, _INTENT_PATTERNS)
+    if _consume(tokens, used, _MONTHLY_PATTERNS):
+        # "monthly sales", "monthly total sales" and "monthly trend" all mean revenue per month
+        if intent not in (None, "total_sales", "sales_trend"):
+            return None
+        intent = "monthly_trend"
+    if intent in (None, "ambiguous") or time_period == "ambiguous":
+        return None
+    by_quantity = _consume(tokens, used, _QUANTITY_PATTERNS)
+
+    limit = None
+    for i, token in enumerate(tokens):
+        if used[i]:
+            continue
+        number = int(token) if token.isdigit() else _NUMBER_WORDS.get(token)
+        if number is not None:
+            if limit is not None or not 0 < number <= FAST_PATH_MAX_LIMIT:
+                return None
+            limit = number
+            used[i] = True
+
+    leftovers = [token for i, token in enumerate(tokens) if not used[i] and token not in _FILLER_WORDS]
+    if leftovers:
+        return None # e.g. a specific item, a category or a comparison the rules do not cover
+
+    if time_period in ("today", "yesterday"):
+        day = pd.Timestamp(today) - pd.Timedelta(days=1 if time_period == "yesterday" else 0)
+        time_period = f"{day.strftime(SALE_DATE_FORMAT)} to {day.strftime(SALE_DATE_FORMAT)}"
+    time_period = time_period or "all_time"
+    measure = "quantity_sold" if by_quantity else "total_sales"
+
+    if intent in ("top_items", "bottom_items"):
+        return {
+            "x_axis": "item",
+            "y_axis": measure,
+            "aggregation": "sum",
+            "sort_by": measure,
+            "sort_order": "desc" if intent == "top_items" else "asc",
+            "limit": limit or FAST_PATH_DEFAULT_LIMIT,
+            "time_period": time_period,
+        }
+    if limit is not None:
+        return None # A count makes no sense for the remaining intents
+    if intent == "total_sales":
+        return {"y_axis": measure, "aggregation": "sum", "time_period": time_period}
+    if intent in ("sales_trend", "monthly_trend"):
+        bucket = "month" if intent == "monthly_trend" else "sale_date"
+        return {
+            "x_axis": bucket,
+            "y_axis": measure,
+            "aggregation": "sum",
+            "sort_by": bucket,
+            "sort_order": "asc",
+            "time_period": time_period,
+        }
+    if by_quantity:
+        return None
+    return {
+        "x_axis": "item",
+        "y_axis": "quantity_in_stock",
+        "aggregation": "sum",
+        "sort_by": "quantity_in_stock",
+        "sort_order": "asc",
+        "limit": FAST_PATH_DEFAULT_LIMIT,
+    }
+
+class FastPathStats:
+    """
+    Hit rate of the rule-based planner and the latency it saves, estimated from the average
+    duration of the LLM planner calls it replaces.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.match_seconds = 0.0
+
+    def record_match(self, hit: bool, seconds: float):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.match_seconds += seconds
+
+    def record_llm_call(self, seconds: float):
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += seconds
+
+    def average_llm_seconds(self) -> float:
+        with self._lock:
+            return self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            average_llm = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+            average_match = self.match_seconds / lookups if lookups else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "average_match_ms": average_match * 1000,
+                "average_llm_planner_ms": average_llm * 1000,
+                "estimated_saved_ms_per_hit": max(0.0, average_llm - average_match) * 1000,
+                "estimated_saved_seconds_total": max(0.0, average_llm - average_match) * self.hits,
+            }
+
+# Shared by every /insights request in this process
+fast_path_stats = FastPathStats()
+register_stats_collector("fast_path_planner", fast_path_stats.stats)
+
+def plan_fast_path(question: str, today: pd.Timestamp) -> dict | None:
+    """match_data_parameters() plus hit-rate and latency bookkeeping."""
+    start = time.perf_counter()
+    data_parameters = match_data_parameters(question, today)
+    elapsed = time.perf_counter() - start
+    fast_path_stats.record_match(data_parameters is not None, elapsed)
+    observe_stage("planner_fast_path", elapsed)
+    if data_parameters is not None:
+        saved_ms = max(0.0, fast_path_stats.average_llm_seconds() - elapsed) * 1000
+        logging.info(f"Fast-path plan in {elapsed * 1000:.2f}ms (saves ~{saved_ms:.0f}ms of LLM planning): {data_parameters}")
+    return data_parameters
@@ -0,0 +1,116 @@
+import os
+import base64
+import logging
+from datetime import timedelta
+
+import pandas as pd
+
+from db_connection_module import read_connection, user_db_exists
+from schema_module import USER_SALES_TABLE_NAME
+from time_period_module import SALE_DATE_FORMAT, normalize_sale_date
+
+logging.basicConfig(level=logging.INFO)
+
+# Page size used when the request does not give one, and the largest page served
+LEDGER_DEFAULT_PAGE_SIZE = int(os.environ.get("LEDGER_DEFAULT_PAGE_SIZE", 50))
+LEDGER_MAX_PAGE_SIZE = int(os.environ.get("LEDGER_MAX_PAGE_SIZE", 500))
+
+LEDGER_COLUMNS = ['id', 'item', 'price', 'quantity_in_stock', 'quantity_sold', 'sale_date']
+
+def encode_ledger_cursor(sale_date: str, sale_id: int) -> str:
+    """Opaque, URL-safe cursor pointing just past the row (sale_date, id)."""
+    return base64.urlsafe_b64encode(f"{sale_date}|{sale_id}".encode("utf-8")).decode("ascii")
+
+def decode_ledger_cursor(cursor: str) -> tuple[str, int]:
+    """Inverse of encode_ledger_cursor(); raises ValueError for a malformed cursor."""
+    try:
+        sale_date, sale_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return sale_date, int(sale_id)
+    except Exception:
+        raise ValueError("Invalid ledger cursor")
+
+def _parse_page_size(page_size) -> int:
+    if page_size in (None, ""):
+        return LEDGER_DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(page_size)
+    except (TypeError, ValueError):
+        raise ValueError(f"page_size must be an integer, got '{page_size}'")
+    if page_size <= 0:
+        raise ValueError("page_size must be positive")
+    return min(page_size, LEDGER_MAX_PAGE_SIZE)
+
+def _parse_date(value, name: str) -> str | None:
+    if value in (None, ""):
+        return None
+    date = normalize_sale_date(value)
+    if date is None:
+        raise ValueError(f"{name} must be a valid date such as YYYY-MM-DD")
+    return date
+
+def build_ledger_query(cursor: str | None = None, page_size=None, item: str | None = None,
+                       start_date=None, end_date=None, order: str = "desc") -> tuple[str, list, int]:
+    """
+    Compiles one ledger page request (see fetch_ledger_page()) into its SQL, bound parameters
+    and page size. Raises ValueError for invalid paging or filter arguments.
+    """
+    page_size = _parse_page_size(page_size)
+    descending = str(order or "desc").lower() != "asc"
+    start_date = _parse_date(start_date, "start_date")
+    end_date = _parse_date(end_date, "end_date")
+
+    where_clauses = ['"sale_date" IS NOT NULL']
+    params = []
+    if item:
+        where_clauses.append('"item" = ?')
+        params.append(item)
+    if start_date:
+        where_clauses.append('"sale_date" >= ?')
+        params.append(start_date)
+    if end_date:
+        end_exclusive = (pd.Timestamp(end_date) + timedelta(days=1)).strftime(SALE_DATE_FORMAT)
+        where_clauses.append('"sale_date" < ?')
+        params.append(end_exclusive)
+    if cursor:
+        # Row-value comparison: SQLite turns this into a seek on the index, no OFFSET scan
+        where_clauses.append(f'("sale_date", "id") {"<" if descending else ">"} (?, ?)')
+        params.extend(decode_ledger_cursor(cursor))
+
+    direction = "DESC" if descending else "ASC"
+    query = f"""
+        SELECT {', '.join(f'"{column}"' for column in LEDGER_COLUMNS)}
+        FROM {USER_SALES_TABLE_NAME}
+        WHERE {' AND '.join(where_clauses)}
+        ORDER BY "sale_date" {direction}, "id" {direction}
+        LIMIT ?
+    """
+    params.append(page_size + 1) # One extra row tells us whether another page exists
+    return query, params, page_size
+
+def fetch_ledger_page(phone_number: str, cursor: str | None = None, page_size=None, item: str | None = None,
+                      start_date=None, end_date=None, order: str = "desc") -> dict:
+    """
+    Returns one page of the tenant's sales ledger ordered by (sale_date, id), newest first
+    unless order is "asc". Pagination is keyset based: pass the previous page's next_cursor
+    to continue, so every page is an index seek on idx_sales_ledger (or idx_sales_item_ledger
+    when filtering by item) no matter how deep it is. start_date and end_date are inclusive.
+    Rows without a sale_date are not part of the ledger.
+
+    Returns {"columns", "rows", "next_cursor"}; next_cursor is None on the last page.
+    Raises ValueError for invalid paging or filter arguments.
+    """
+    query, params, page_size = build_ledger_query(cursor, page_size, item, start_date, end_date, order)
+
+    if not user_db_exists(phone_number):
+        logging.error(f"User database not found for {phone_number} for ledger data.")
+        return {"columns": LEDGER_COLUMNS, "rows": [], "next_cursor": None}
+
+    with read_connection(phone_number) as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_ledger_cursor(last[LEDGER_COLUMNS.index('sale_date')], last[0])
+    return {"columns": LEDGER_COLUMNS, "rows": rows, "next_cursor": next_cursor}
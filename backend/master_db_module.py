@@ -0,0 +1,72 @@
+import sqlite3
+import time
+import logging
+
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+
+# Master DB setup
+MASTER_DB_PATH = "master_sales.db"
+MASTER_TABLE_NAME = "sales_data"
+
+# Columns written to the master table for every synced sale, in insert order
+MASTER_SALE_COLUMNS = ['item', 'price', 'quantity_in_stock', 'quantity_sold', 'sale_date', 'source_hash']
+
+# Default number of rows bound per executemany() call during a bulk sync
+DEFAULT_MASTER_SYNC_CHUNK_SIZE = 5000
+
+def _master_rows(phone_number: str, rows, chunk_size: int):
+    """
+    Yields lists of parameter tuples for the master INSERT, chunk_size rows at a time.
+    itertuples() hands back plain Python scalars, so sqlite3 can bind them directly.
+    Rows without a source_hash (live sales) bind it as NULL.
+    """
+    if isinstance(rows, pd.DataFrame):
+        columns = [column for column in MASTER_SALE_COLUMNS if column in rows.columns]
+        rows = rows[columns].itertuples(index=False, name=None)
+    padding = (None,) * len(MASTER_SALE_COLUMNS)
+    chunk = []
+    for row in rows:
+        chunk.append((phone_number, *row, *padding[len(row):]))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def bulk_sync_to_master(phone_number: str, df, chunk_size: int | None = None) -> dict:
+    """
+    Syncs every row of a cleaned sales DataFrame (or a list of MASTER_SALE_COLUMNS tuples, the
+    trailing source_hash being optional) to the master sales database in a single transaction
+    (one commit instead of one per row).
+    Rows are bound with executemany() in chunks of chunk_size to keep the parameter lists small.
+    Returns a dict with the rows received, inserted and skipped as duplicates, elapsed seconds and rows per second.
+    """
+    chunk_size = int(chunk_size) if chunk_size else DEFAULT_MASTER_SYNC_CHUNK_SIZE
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+
+    if df is None or len(df) == 0:
+        return {"rows": 0, "inserted": 0, "skipped": 0, "seconds": 0.0, "rows_per_second": 0.0}
+
+    start = time.perf_counter()
+    inserted = 0
+    conn = sqlite3.connect(MASTER_DB_PATH)
+    try:
+        with conn: # Commits once on success, rolls the whole batch back on error
+            for chunk in _master_rows(phone_number, df, chunk_size):
+                # Ingested lines already present under their source hash are skipped
+                inserted += conn.executemany(f'''
+                    INSERT INTO {MASTER_TABLE_NAME} (phone_number, item, price, quantity_in_stock, quantity_sold, sale_date, source_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT DO NOTHING
+                ''', chunk).rowcount
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    rows = len(df)
+    rows_per_second = rows / elapsed if elapsed > 0 else float(rows)
+    logging.info(f"Bulk synced {rows} sales ({rows - inserted} duplicates skipped) to master DB for {phone_number} in {elapsed:.3f}s ({rows_per_second:.0f} rows/s)")
+    return {"rows": rows, "inserted": inserted, "skipped": rows - inserted, "seconds": elapsed, "rows_per_second": rows_per_second}
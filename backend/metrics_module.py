@@ -0,0 +1,179 @@
+import os
+import time
+import uuid
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO)
+
+METRICS_PREFIX = "insightgenie"
+
+# Set to 1 to prefix every log line with the trace id of the request that emitted it
+METRICS_TRACE_LOGS = os.environ.get("METRICS_TRACE_LOGS", "0").lower() in ("1", "true", "yes")
+
+TRACE_ID_HEADER = "X-Request-ID"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds, from sub-millisecond SQL to multi-second LLM and TTS calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Every Histogram created, in creation order; all of them are rendered at /metrics
+_histograms = []
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus sense, one series per combination of label
+    values. observe() is a bisect plus a few additions under a lock, cheap enough for every
+    request. Observations are seconds for timers but may be any unit (e.g. tokens).
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _histograms.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the with-block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        """{label values: (cumulative bucket counts, sum, count)}"""
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        snapshot = {}
+        for key, values in series.items():
+            cumulative, running = [], 0
+            for count in values[:len(self.buckets)]:
+                running += count
+                cumulative.append(running)
+            snapshot[key] = (cumulative, values[-2], values[-1])
+        return snapshot
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (cumulative, total, count) in sorted(self.snapshot().items()):
+            labels = dict(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, cumulative):
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(float(bound))})} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+# Time spent in each stage of the insight, chart, TTS and OCR pipelines
+STAGE_SECONDS = Histogram(
+    f"{METRICS_PREFIX}_stage_duration_seconds",
+    "Duration of individual pipeline stages (LLM calls, SQL, serialization, TTS, OCR).",
+    ("stage",),
+)
+
+# Wall time per endpoint; for streamed responses this ends when the body starts streaming
+REQUEST_SECONDS = Histogram(
+    f"{METRICS_PREFIX}_http_request_duration_seconds",
+    "HTTP request latency by endpoint, method and status.",
+    ("endpoint", "method", "status"),
+)
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+def time_stage(stage: str):
+    """with time_stage("answer_llm"): ... records the block under that stage."""
+    return STAGE_SECONDS.time(stage=stage)
+
+# component name -> zero-argument callable returning a dict of numeric stats
+_stats_collectors = {}
+
+def register_stats_collector(component: str, stats):
+    """
+    Exports a component's stats() dict (cache hits, entries, bytes, ...) as gauges named
+    <prefix>_<component>_<stat>, read when /metrics is scraped.
+    """
+    _stats_collectors[component] = stats
+
+def _render_stats_collectors() -> list:
+    lines = []
+    for component, stats in sorted(_stats_collectors.items()):
+        try:
+            values = stats()
+        except Exception as e:
+            logging.error(f"Metrics collector for {component} failed: {e}")
+            continue
+        for stat, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{METRICS_PREFIX}_{component}_{stat}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+    return lines
+
+def render_metrics() -> str:
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = [line for histogram in list(_histograms) for line in histogram.render()]
+    lines += _render_stats_collectors()
+    return "\n".join(lines) + "\n"
+
+# Trace id of the request being handled, carried into every log line when enabled
+_trace_id = contextvars.ContextVar("trace_id", default="-")
+
+def new_trace_id(incoming: str | None = None) -> str:
+    """Uses the caller's X-Request-ID when it is sane, a fresh random id otherwise."""
+    trace_id = incoming if incoming and len(incoming) <= 64 and incoming.isprintable() else uuid.uuid4().hex[:16]
+    _trace_id.set(trace_id)
+    return trace_id
+
+def get_trace_id() -> str:
+    return _trace_id.get()
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current request's trace id to each record as record.trace_id."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = _trace_id.get()
+        return True
+
+def install_trace_logging():
+    """Prefixes the root handlers' log lines with [trace_id] (see METRICS_TRACE_LOGS)."""
+    for handler in logging.getLogger().handlers:
+        if any(isinstance(existing, TraceIdFilter) for existing in handler.filters):
+            continue
+        handler.addFilter(TraceIdFilter())
+        handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:[%(trace_id)s] %(message)s"))
@@ -9,6 +9,8 @@ import fitz  # PyMuPDF
 import traceback
 import logging
 
+from metrics_module import time_stage
+
 # Configure logging for the module
 # Set to DEBUG to see all detailed logs
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -76,7 +78,8 @@ Instructions:
                 continue
             
             logging.debug(f"Sending image {img_file.filename} to Gemini model.")
-            response = model.generate_content([prompt, img], stream=False)
+            with time_stage("ocr_image_llm"):
+                response = model.generate_content([prompt, img], stream=False)
             extracted = response.text.strip()
             logging.debug(f"Raw extracted from image {img_file.filename}: \n---\n{extracted}\n---")
 
@@ -116,14 +119,16 @@ Instructions:
                     for i, page in enumerate(doc):
                         logging.info(f"Processing page {i+1} of PDF.")
                         try:
-                            pix = page.get_pixmap(dpi=300)
-                            img = Image.open(BytesIO(pix.tobytes())).convert("RGB")
+                            with time_stage("ocr_page_render"):
+                                pix = page.get_pixmap(dpi=300)
+                                img = Image.open(BytesIO(pix.tobytes())).convert("RGB")
                         except Exception as page_e:
                             logging.error(f"Error processing page {i+1} of PDF: {page_e}")
                             continue
 
                         logging.debug(f"Sending PDF page {i+1} to Gemini model.")
-                        response = model.generate_content([prompt, img], stream=False)
+                        with time_stage("ocr_page_llm"):
+                            response = model.generate_content([prompt, img], stream=False)
                         extracted = response.text.strip()
                         logging.debug(f"Raw extracted from PDF page {i+1}: \n---\n{extracted}\n---")
 
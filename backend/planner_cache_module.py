@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from db_connection_module import apply_connection_pragmas
+from metrics_module import register_stats_collector
+
+logging.basicConfig(level=logging.INFO)
+
+# Local SQLite store that keeps planner results across restarts and worker processes
+PLANNER_CACHE_DB_PATH = os.environ.get("PLANNER_CACHE_DB_PATH", "planner_cache.db")
+PLANNER_CACHE_TABLE_NAME = "planner_cache"
+
+# How long a planner result stays valid
+PLANNER_CACHE_TTL_SECONDS = float(os.environ.get("PLANNER_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+
+# Entries kept in the in-memory tier and in the SQLite tier
+PLANNER_CACHE_MEMORY_ENTRIES = int(os.environ.get("PLANNER_CACHE_MEMORY_ENTRIES", 1024))
+PLANNER_CACHE_MAX_ENTRIES = int(os.environ.get("PLANNER_CACHE_MAX_ENTRIES", 50000))
+
+# The SQLite tier is trimmed to its size limit once every this many stores
+PLANNER_CACHE_TRIM_EVERY = 100
+
+def normalize_question(question: str) -> str:
+    """
+    Folds case, Unicode form, punctuation and whitespace so trivially different phrasings of
+    the same question ("Top selling items this month?" / "top  selling items this month")
+    share a cache entry. Devanagari vowel signs are marks, not punctuation, and are kept.
+    """
+    text = unicodedata.normalize("NFKC", question or "").casefold()
+    text = "".join(" " if unicodedata.category(char).startswith("P") else char for char in text)
+    return " ".join(text.split())
+
+def hash_planner_context(*parts: str) -> str:
+    """Hashes everything besides the question that determines the planner output (schema, prompt, model)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class PlannerCache:
+    """
+    Two-tier cache of data-planner results keyed on the normalized question and a context
+    hash: an in-memory LRU in front of a local SQLite table, both bounded, with a TTL.
+    Values are JSON-serializable (the planner's data_parameters dict).
+    """
+
+    def __init__(self, db_path: str = PLANNER_CACHE_DB_PATH, ttl_seconds: float = PLANNER_CACHE_TTL_SECONDS,
+                 memory_entries: int = PLANNER_CACHE_MEMORY_ENTRIES, max_entries: int = PLANNER_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = max(1, int(memory_entries))
+        self.max_entries = max(1, int(max_entries))
+        self._memory = OrderedDict() # key -> (value, expires_at), oldest first
+        self._lock = threading.Lock()
+        self._conn = None
+        self._stores = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily under self._lock; the cache must never take the request down, so
+        # callers treat sqlite3 errors as misses.
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            apply_connection_pragmas(conn)
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {PLANNER_CACHE_TABLE_NAME} (
+                    "key" TEXT PRIMARY KEY,
+                    "question" TEXT,
+                    "value" TEXT NOT NULL,
+                    "expires_at" REAL NOT NULL,
+                    "last_used_at" REAL NOT NULL
+                );
+            ''')
+            conn.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_{PLANNER_CACHE_TABLE_NAME}_last_used_at
+                ON {PLANNER_CACHE_TABLE_NAME} (last_used_at);
+            ''')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(question: str, context_hash: str) -> str:
+        return hashlib.sha256(f"{context_hash}\0{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, value, expires_at: float):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, question: str, context_hash: str):
+        """Returns the cached value, or None on a miss or an expired entry."""
+        key = self.make_key(question, context_hash)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            try:
+                conn = self._connection()
+                row = conn.execute(f'''
+                    SELECT value, expires_at FROM {PLANNER_CACHE_TABLE_NAME} WHERE key = ?
+                ''', (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    conn.execute(f"UPDATE {PLANNER_CACHE_TABLE_NAME} SET last_used_at = ? WHERE key = ?", (now, key))
+                    conn.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.disk_hits += 1
+                    return value
+            except (sqlite3.Error, ValueError) as e:
+                logging.error(f"Planner cache lookup failed: {e}")
+
+            self.misses += 1
+            return None
+
+    def put(self, question: str, context_hash: str, value, ttl_seconds: float | None = None):
+        """Caches value for the question; ttl_seconds overrides the default TTL for this entry."""
+        key = self.make_key(question, context_hash)
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            try:
+                conn = self._connection()
+                conn.execute(f'''
+                    INSERT INTO {PLANNER_CACHE_TABLE_NAME} (key, question, value, expires_at, last_used_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        value = excluded.value, expires_at = excluded.expires_at, last_used_at = excluded.last_used_at
+                ''', (key, normalize_question(question), json.dumps(value, ensure_ascii=False), expires_at, now))
+                self._stores += 1
+                if self._stores % PLANNER_CACHE_TRIM_EVERY == 0:
+                    self._trim_locked(conn, now)
+                conn.commit()
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logging.error(f"Planner cache store failed: {e}")
+
+    def _trim_locked(self, conn: sqlite3.Connection, now: float):
+        """Drops expired rows, then the least recently used rows beyond max_entries."""
+        conn.execute(f"DELETE FROM {PLANNER_CACHE_TABLE_NAME} WHERE expires_at <= ?", (now,))
+        conn.execute(f'''
+            DELETE FROM {PLANNER_CACHE_TABLE_NAME} WHERE key IN (
+                SELECT key FROM {PLANNER_CACHE_TABLE_NAME}
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            try:
+                conn = self._connection()
+                conn.execute(f"DELETE FROM {PLANNER_CACHE_TABLE_NAME}")
+                conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Planner cache clear failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+# Shared by every /insights request in this process
+planner_cache = PlannerCache()
+register_stats_collector("planner_cache", planner_cache.stats)
@@ -0,0 +1,262 @@
+import os
+import json
+import math
+import logging
+
+from metrics_module import METRICS_PREFIX, Histogram
+
+logging.basicConfig(level=logging.INFO)
+
+# Budget for the data block of the answer-generator prompt: at most this many rows verbatim...
+PROMPT_DATA_MAX_ROWS = int(os.environ.get("PROMPT_DATA_MAX_ROWS", 200))
+# ...and at most this many (estimated) tokens for the whole block, summary included
+PROMPT_DATA_MAX_TOKENS = int(os.environ.get("PROMPT_DATA_MAX_TOKENS", 4000))
+
+# Entries in each "top values" list of the overflow summary
+PROMPT_DATA_TOP_K = int(os.environ.get("PROMPT_DATA_TOP_K", 10))
+# Monthly rollups are used up to this many months, yearly ones beyond it
+PROMPT_DATA_MAX_PERIODS = 24
+
+# Columns that mean nothing to the model (surrogate keys, ingest line hashes)
+_OMITTED_COLUMNS = {"id", "source_hash"}
+
+DATE_COLUMN = "sale_date"
+
+# Estimated size of the data block sent with each insight question
+PROMPT_DATA_TOKENS = Histogram(
+    f"{METRICS_PREFIX}_prompt_data_tokens",
+    "Estimated tokens of fetched data placed in the answer-generator prompt.",
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap, conservative token estimate: about four ASCII characters per token, and one token
+    per non-ASCII character (Devanagari item names tokenize far worse than English).
+    """
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return math.ceil((len(text) - non_ascii) / 4) + non_ascii
+
+def _dumps(payload) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def _round(value):
+    return round(value, 2) if isinstance(value, float) else value
+
+def _round_rows(rows: list) -> list:
+    return [[_round(value) for value in row] for row in rows]
+
+def _is_number(value) -> bool:
+    return type(value) in (int, float) # Not bool; rows come straight from sqlite3
+
+class PromptData:
+    """The encoded data block plus what it cost, for logging and metrics."""
+
+    def __init__(self, text: str, row_count: int, rows_included: int, estimated_tokens: int):
+        self.text = text
+        self.row_count = row_count
+        self.rows_included = rows_included
+        self.estimated_tokens = estimated_tokens
+
+    @property
+    def truncated(self) -> bool:
+        return self.rows_included < self.row_count
+
+def _summarize(columns: list, rows: list, top_k: int) -> dict:
+    """
+    Aggregates over every row: min/max/mean/sum per numeric column, the top values of each
+    text column by the main measure, and per-period rollups when there is a sale_date column.
+    The main measure is revenue (price * quantity_sold) for raw sales rows, otherwise the
+    first numeric column (e.g. an aggregated total_sales).
+    """
+    numeric = [i for i, column in enumerate(columns)
+               if any(_is_number(row[i]) for row in rows[:100]) and all(row[i] is None or _is_number(row[i]) for row in rows)]
+    text = [i for i in range(len(columns)) if i not in numeric and columns[i] != DATE_COLUMN]
+    date_index = columns.index(DATE_COLUMN) if DATE_COLUMN in columns else None
+
+    if "price" in columns and "quantity_sold" in columns:
+        price, quantity = columns.index("price"), columns.index("quantity_sold")
+        measure_name = "revenue"
+        measure = lambda row: (row[price] or 0) * (row[quantity] or 0)
+    elif numeric:
+        measure_name = columns[numeric[0]]
+        measure = lambda row: row[numeric[0]] or 0
+    else:
+        measure_name = "rows"
+        measure = lambda row: 1
+
+    summary = {"measure": measure_name, "total": _round(float(sum(measure(row) for row in rows)))}
+
+    stats = {}
+    for i in numeric:
+        values = [row[i] for row in rows if row[i] is not None]
+        if values:
+            stats[columns[i]] = {"min": _round(min(values)), "max": _round(max(values)),
+                                 "mean": _round(sum(values) / len(values)), "sum": _round(sum(values))}
+    if stats:
+        summary["numeric"] = stats
+
+    for i in text:
+        totals = {}
+        for row in rows:
+            key = row[i]
+            entry = totals.setdefault(key, [0, 0])
+            entry[0] += measure(row)
+            entry[1] += 1
+        ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+        summary[f"top_{columns[i]}"] = {
+            "distinct": len(totals),
+            "columns": [columns[i], measure_name, "rows"],
+            "rows": [[key, _round(float(total)), count] for key, (total, count) in ranked[:top_k]],
+        }
+
+    if date_index is not None:
+        dates = [str(row[date_index]) for row in rows if row[date_index]]
+        months = {date[:7] for date in dates}
+        width, period = (7, "month") if len(months) <= PROMPT_DATA_MAX_PERIODS else (4, "year")
+        rollup = {}
+        for row in rows:
+            if not row[date_index]:
+                continue
+            entry = rollup.setdefault(str(row[date_index])[:width], [0, 0])
+            entry[0] += measure(row)
+            entry[1] += 1
+        periods = sorted(rollup.items())[-PROMPT_DATA_MAX_PERIODS:]
+        summary[f"by_{period}"] = {
+            "columns": [period, measure_name, "rows"],
+            "rows": [[key, _round(float(total)), count] for key, (total, count) in periods],
+        }
+        if dates:
+            summary["date_range"] = [min(dates), max(dates)]
+    return summary
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+def summarize_query(conn, sql: str, params: list, columns: list, sample: list, measure: str | None,
+                    top_k: int = PROMPT_DATA_TOP_K) -> tuple[int, dict]:
+    """
+    SQL counterpart of _summarize() for results too large to fetch: the same summary, computed
+    by aggregates over the query wrapped as a subquery, so only a few rows per aggregate leave
+    SQLite. Column kinds are inferred from the sample rows; the main measure is the measure
+    column when it is numeric, otherwise the row count. Returns (row_count, summary).
+    """
+    numeric = [column for i, column in enumerate(columns)
+               if any(_is_number(row[i]) for row in sample[:100]) and all(row[i] is None or _is_number(row[i]) for row in sample)]
+    text = [column for column in columns if column not in numeric and column != DATE_COLUMN]
+    source = f"({sql})"
+
+    if measure in numeric:
+        measure_name, measure_sql = measure, f"COALESCE({_quote(measure)}, 0)"
+    else:
+        measure_name, measure_sql = "rows", "1"
+
+    selects = ["COUNT(*)", f"SUM({measure_sql})"]
+    for column in numeric:
+        selects += [f"MIN({_quote(column)})", f"MAX({_quote(column)})", f"AVG({_quote(column)})", f"SUM({_quote(column)})"]
+    selects += [f"COUNT(DISTINCT {_quote(column)})" for column in text]
+    has_date = DATE_COLUMN in columns
+    if has_date:
+        date = f"NULLIF({_quote(DATE_COLUMN)}, '')"
+        selects += [f"MIN({date})", f"MAX({date})", f"COUNT(DISTINCT substr({date}, 1, 7))"]
+    values = list(conn.execute(f"SELECT {', '.join(selects)} FROM {source}", params).fetchone())
+
+    row_count, total = values.pop(0), values.pop(0)
+    summary = {"measure": measure_name, "total": _round(float(total or 0))}
+    stats = {}
+    for column in numeric:
+        low, high, mean, column_sum = values[:4]
+        del values[:4]
+        if low is not None:
+            stats[column] = {"min": _round(low), "max": _round(high), "mean": _round(mean), "sum": _round(column_sum)}
+    if stats:
+        summary["numeric"] = stats
+
+    for column in text:
+        distinct = values.pop(0)
+        ranked = conn.execute(f'''
+            SELECT {_quote(column)}, SUM({measure_sql}) AS total, COUNT(*) FROM {source}
+            GROUP BY {_quote(column)} ORDER BY total DESC LIMIT ?
+        ''', [*params, top_k]).fetchall()
+        summary[f"top_{column}"] = {
+            "distinct": distinct,
+            "columns": [column, measure_name, "rows"],
+            "rows": [[key, _round(float(total or 0)), count] for key, total, count in ranked],
+        }
+
+    if has_date:
+        first, last, months = values
+        width, period = (7, "month") if months <= PROMPT_DATA_MAX_PERIODS else (4, "year")
+        periods = conn.execute(f'''
+            SELECT substr({date}, 1, {width}) AS period, SUM({measure_sql}), COUNT(*) FROM {source}
+            WHERE {date} IS NOT NULL GROUP BY period ORDER BY period DESC LIMIT ?
+        ''', [*params, PROMPT_DATA_MAX_PERIODS]).fetchall()
+        summary[f"by_{period}"] = {
+            "columns": [period, measure_name, "rows"],
+            "rows": [[key, _round(float(total or 0)), count] for key, total, count in reversed(periods)],
+        }
+        if first is not None:
+            summary["date_range"] = [str(first), str(last)]
+    return row_count, summary
+
+def compact_rows_for_prompt(columns: list, rows: list, ordered: bool = True,
+                            max_rows: int = PROMPT_DATA_MAX_ROWS, max_tokens: int = PROMPT_DATA_MAX_TOKENS,
+                            top_k: int = PROMPT_DATA_TOP_K, row_count: int | None = None,
+                            summary: dict | None = None) -> PromptData:
+    """
+    Encodes query rows for the answer-generator prompt within a row and token budget.
+
+    Rows are columnar ({"columns": [...], "rows": [[...], ...]}), so column names appear
+    once instead of once per row. When the rows do not fit, only a sample is kept (the first
+    rows when the query was ordered, the most recent by sale_date otherwise), shrunk until
+    the block fits max_tokens, and a "summary" aggregated over all rows is added.
+
+    When the query was capped in SQL, rows are only its first rows: pass the full row_count
+    and the summary from summarize_query().
+    """
+    keep = [i for i, column in enumerate(columns) if column not in _OMITTED_COLUMNS]
+    if len(keep) < len(columns):
+        columns = [columns[i] for i in keep]
+        rows = [tuple(row[i] for i in keep) for row in rows]
+    row_count = len(rows) if row_count is None else row_count
+
+    if row_count == len(rows) and row_count <= max_rows:
+        text = _dumps({"columns": columns, "row_count": row_count, "rows": _round_rows(rows)})
+        tokens = estimate_tokens(text)
+        if tokens <= max_tokens:
+            return _record(PromptData(text, row_count, row_count, tokens))
+
+    if not ordered and DATE_COLUMN in columns:
+        date_index = columns.index(DATE_COLUMN)
+        sample = sorted(rows, key=lambda row: str(row[date_index] or ""), reverse=True)[:max_rows]
+    else:
+        sample = rows[:max_rows]
+    sample = _round_rows(sample)
+
+    payload = {"columns": columns, "row_count": row_count, "rows_included": 0, "rows": [],
+               "summary": summary if summary is not None else _summarize(columns, rows, top_k)}
+    base_tokens = estimate_tokens(_dumps(payload))
+
+    # Size the sample from the average row cost, then trim until it really fits
+    if sample:
+        per_row = estimate_tokens(_dumps(sample)) / len(sample)
+        sample = sample[:max(0, int((max_tokens - base_tokens) / max(per_row, 1)))]
+    while True:
+        payload["rows"] = sample
+        payload["rows_included"] = len(sample)
+        text = _dumps(payload)
+        tokens = estimate_tokens(text)
+        if tokens <= max_tokens or not sample:
+            break
+        sample = sample[:int(len(sample) * 0.9)]
+
+    if tokens > max_tokens:
+        logging.warning(f"Prompt data summary alone is ~{tokens} tokens, over the {max_tokens}-token budget.")
+    return _record(PromptData(text, row_count, len(sample), tokens))
+
+def _record(prompt_data: PromptData) -> PromptData:
+    PROMPT_DATA_TOKENS.observe(prompt_data.estimated_tokens)
+    logging.info(f"Prompt data: {prompt_data.rows_included}/{prompt_data.row_count} rows, "
+                 f"~{prompt_data.estimated_tokens} tokens, {len(prompt_data.text)} chars"
+                 f"{' (summarized)' if prompt_data.truncated else ''}")
+    return prompt_data
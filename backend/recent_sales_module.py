@@ -1,51 +1,36 @@
-import pandas as pd
-import sqlite3
 import os
 import logging
 
+from db_connection_module import get_user_db_path, read_connection
+
 logging.basicConfig(level=logging.INFO)
 
 USER_SALES_TABLE_NAME = 'sales'
-USER_DATA_DIR = 'user_data'
-
-def fetch_recent_sales_for_table(phone_number: str) -> pd.DataFrame:
-    """
-    Fetches the 10 most recently added sales data for a specific user.
-    This is designed for displaying in a dashboard table.
-    """
-    db_path = os.path.join(USER_DATA_DIR, f'sales_{phone_number}.db')
-    if not os.path.exists(db_path):
-        logging.error(f"User database not found at {db_path} for recent sales data.")
-        return pd.DataFrame() # Return empty DataFrame if DB not found
 
-    conn = None
-    try:
-        conn = sqlite3.connect(db_path)
-        # Assuming 'sale_date' is the column to determine "recently added"
-        # If you have a different column for creation timestamp, use that instead.
-        query = f"""
-            SELECT item, price, quantity_in_stock, quantity_sold, sale_date
-            FROM {USER_SALES_TABLE_NAME}
-            ORDER BY sale_date DESC
-            LIMIT 10;
-        """
-        logging.info(f"Executing recent sales SQL Query: {query} for {phone_number}")
-        
-        df = pd.read_sql_query(query, conn)
-        
-        # Ensure sale_date is in YYYY-MM-DD format for consistency
-        if 'sale_date' in df.columns:
-            df['sale_date'] = pd.to_datetime(df['sale_date'], errors='coerce').dt.strftime('%Y-%m-%d')
+# sale_date is stored as canonical YYYY-MM-DD, so this is a reverse walk of idx_sales_ledger
+RECENT_SALES_QUERY = f"""
+    SELECT item, price, quantity_in_stock, quantity_sold, sale_date
+    FROM {USER_SALES_TABLE_NAME}
+    ORDER BY sale_date DESC
+    LIMIT ?;
+"""
 
-        return df
+def fetch_recent_sales_rows(conn, limit: int = 10) -> list:
+    """Returns the most recent sales as a list of dicts on an already open connection."""
+    cursor = conn.execute(RECENT_SALES_QUERY, (limit,))
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
-    except sqlite3.Error as e:
-        logging.error(f"SQLite error during recent sales data fetch for {phone_number}: {e}")
-        return pd.DataFrame() # Return empty DataFrame on error
-    except Exception as e:
-        logging.exception(f"An unexpected error occurred during recent sales data fetch for {phone_number}:")
-        return pd.DataFrame() # Return empty DataFrame on error
-    finally:
-        if conn:
-            conn.close()
+def fetch_recent_sales(phone_number: str, limit: int = 10) -> tuple[list, list]:
+    """
+    Fetches the most recent sales as (columns, rows) straight from the cursor, for responses
+    that serialize rows without a DataFrame. Returns empty lists when the user has no DB.
+    """
+    if not os.path.exists(get_user_db_path(phone_number)):
+        logging.error(f"User database not found for {phone_number} for recent sales data.")
+        return [], []
 
+    with read_connection(phone_number) as conn:
+        cursor = conn.execute(RECENT_SALES_QUERY, (limit,))
+        columns = [description[0] for description in cursor.description]
+        return columns, cursor.fetchall()
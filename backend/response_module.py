@@ -0,0 +1,66 @@
+import json
+import logging
+
+from flask import Response, request
+
+try:
+    import orjson # Optional: several times faster than json for row-heavy payloads
+except ImportError:
+    orjson = None
+
+logging.basicConfig(level=logging.INFO)
+
+JSON_MIMETYPE = "application/json"
+SSE_MIMETYPE = "text/event-stream"
+
+def _default(value):
+    # numpy/pandas scalars (e.g. float64 from a DataFrame) expose .item(); anything else becomes a string
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+def dumps(payload) -> bytes:
+    """Encodes payload as compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_response(payload, status: int = 200) -> Response:
+    """Drop-in for jsonify(payload), status using the fast encoder."""
+    return Response(dumps(payload), status=status, mimetype=JSON_MIMETYPE)
+
+def wants_columnar() -> bool:
+    """
+    True when the client opted into the columnar row format, via ?format=columnar or
+    "format": "columnar" in the JSON body.
+    """
+    if request.args.get("format") == "columnar":
+        return True
+    body = request.get_json(silent=True)
+    return isinstance(body, dict) and body.get("format") == "columnar"
+
+def rows_payload(columns: list, rows: list, columnar: bool = False):
+    """
+    Shapes cursor rows for a response: a list of {column: value} records by default, or
+    {"columns": [...], "data": [[...], ...]} when columnar, which names each column once.
+    """
+    if columnar:
+        return {"columns": list(columns), "data": list(rows)} # Row tuples encode as JSON arrays as is
+    return [dict(zip(columns, row)) for row in rows]
+
+def rows_response(columns: list, rows: list, columnar: bool = False, status: int = 200) -> Response:
+    return json_response(rows_payload(columns, rows, columnar), status)
+
+def sse_event(event: str, payload) -> bytes:
+    """Encodes one server-sent event; compact JSON never spans lines, so one data: line suffices."""
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(payload) + b"\n\n"
+
+def stream_events_response(events, status: int = 200) -> Response:
+    """Streams (event, payload) pairs as server-sent events, flushing each one as it is produced."""
+    return Response(
+        (sse_event(event, payload) for event, payload in events),
+        status=status,
+        mimetype=SSE_MIMETYPE,
+        # Proxies (nginx) would otherwise buffer the stream and defeat the point
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
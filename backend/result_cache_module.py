@@ -0,0 +1,81 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO)
+
+def estimate_result_size(value) -> int:
+    """Approximates a cached result's footprint by the length of its JSON encoding."""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of computed results, bounded by entry count and by approximate
+    memory. Keys are tuples whose first element is the tenant phone number (and, by
+    convention, whose second element names the kind of entry), so every entry for a tenant,
+    or every entry of one kind, can be dropped at once.
+    """
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int):
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self._entries = OrderedDict() # key -> (value, size), oldest first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: int | None = None):
+        """Caches value under key, evicting least recently used entries to stay within bounds."""
+        size = estimate_result_size(value) if size is None else size
+        if size > self.max_bytes:
+            logging.info(f"{self.name} cache: result of {size} bytes exceeds the {self.max_bytes}-byte cap; not cached.")
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def invalidate(self, phone_number: str | None = None, kind=None):
+        """
+        Drops every entry for one tenant, or the whole cache when phone_number is None.
+        With kind, only the tenant's entries whose key[1] equals kind are dropped.
+        """
+        with self._lock:
+            if phone_number is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for key in [key for key in self._entries
+                        if key[0] == phone_number and (kind is None or key[1] == kind)]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,295 @@
+import os
+import glob
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from db_connection_module import USER_DATA_DIR, get_user_db_path, user_db_exists, apply_connection_pragmas, read_connection
+from master_db_module import MASTER_DB_PATH, MASTER_TABLE_NAME
+from time_period_module import normalize_sale_dates
+
+logging.basicConfig(level=logging.INFO)
+
+USER_SALES_TABLE_NAME = 'sales'
+UPLOADS_TABLE_NAME = 'uploads'
+DATA_VERSION_TABLE_NAME = 'data_version'
+
+# Columns of the per-user sales table written by every ingest path, in insert order
+SALE_COLUMNS = ['item', 'price', 'quantity_in_stock', 'quantity_sold', 'sale_date']
+
+# Optional column carrying an ingested file line's hash; NULL for live POS sales
+SOURCE_HASH_COLUMN = 'source_hash'
+
+# Number of tenant files migrated concurrently during startup bootstrap
+SCHEMA_BOOTSTRAP_WORKERS = int(os.environ.get("SCHEMA_BOOTSTRAP_WORKERS", min(8, (os.cpu_count() or 1) * 2)))
+
+# Phone numbers whose sales DB is known to be at the current schema in this process
+_ready_tenants = set()
+_ready_tenants_lock = threading.Lock()
+
+# phone_number -> {lowercased column name: exact column name} of the tenant's sales table.
+# Filled on first use and dropped whenever a migration changes that tenant's schema.
+_sales_columns = {}
+
+def _normalize_sale_dates(table_name: str):
+    """
+    Builds a migration that rewrites every sale_date in table_name to canonical YYYY-MM-DD,
+    so range predicates on the raw column compare correctly and stay index-friendly.
+    """
+    def migrate(conn: sqlite3.Connection):
+        # Fast path: anything SQLite's date() understands (e.g. '2025-01-05 00:00:00' written by to_sql)
+        conn.execute(f'''
+            UPDATE {table_name} SET sale_date = date(sale_date)
+            WHERE date(sale_date) IS NOT NULL AND sale_date <> date(sale_date);
+        ''')
+        # Remaining free-form strings ('1/5/2025', '2025-1-5', ...) are parsed by pandas
+        rows = conn.execute(f'''
+            SELECT rowid, sale_date FROM {table_name}
+            WHERE sale_date IS NOT NULL AND date(sale_date) IS NULL;
+        ''').fetchall()
+        if not rows:
+            return
+        row_ids, raw_dates = zip(*rows)
+        normalized = normalize_sale_dates(pd.Series(raw_dates, dtype=object))
+        updates = [(date, row_id) for row_id, date in zip(row_ids, normalized) if isinstance(date, str)]
+        conn.executemany(f"UPDATE {table_name} SET sale_date = ? WHERE rowid = ?;", updates)
+        if len(updates) < len(rows):
+            logging.warning(f"{len(rows) - len(updates)} sale_date values in {table_name} could not be parsed and were left unchanged.")
+    return migrate
+
+# --- Per-user sales DB migrations ---
+
+def _create_sales_table(conn: sqlite3.Connection):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {USER_SALES_TABLE_NAME} (
+            "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+            "item" TEXT NOT NULL,
+            "price" REAL NOT NULL,
+            "quantity_in_stock" INTEGER,
+            "quantity_sold" INTEGER,
+            "sale_date" TEXT
+        );
+    ''')
+
+def _add_sales_id_column(conn: sqlite3.Connection):
+    """
+    Rebuilds sales tables created by the old initialize_database() schema (no "id" column)
+    into the canonical schema. Missing item/price values become '' / 0 to satisfy NOT NULL.
+    """
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({USER_SALES_TABLE_NAME});")]
+    if "id" in columns:
+        return
+    conn.execute(f'ALTER TABLE {USER_SALES_TABLE_NAME} RENAME TO "{USER_SALES_TABLE_NAME}_legacy";')
+    _create_sales_table(conn)
+    conn.execute(f'''
+        INSERT INTO {USER_SALES_TABLE_NAME} (item, price, quantity_in_stock, quantity_sold, sale_date)
+        SELECT COALESCE(item, ''), COALESCE(price, 0), quantity_in_stock, quantity_sold, sale_date
+        FROM "{USER_SALES_TABLE_NAME}_legacy";
+    ''')
+    conn.execute(f'DROP TABLE "{USER_SALES_TABLE_NAME}_legacy";')
+
+def _create_sales_indexes(conn: sqlite3.Connection):
+    """
+    Covering indexes for the dashboard and insight access patterns. Both carry the rowid
+    ("id") right after their date key, so rows come out in a stable (sale_date, id) order:
+    - (sale_date, id, ...): recent-sales ORDER BY sale_date DESC LIMIT n, time-period range
+      filters and monthly trends.
+    - (item, sale_date, id, ...): GROUP BY item rollups of sales value and stock, and
+      per-item date ranges, without touching the table.
+    """
+    covered = "price, quantity_sold, quantity_in_stock"
+    conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_{USER_SALES_TABLE_NAME}_ledger
+        ON {USER_SALES_TABLE_NAME} (sale_date, id, item, {covered});
+    ''')
+    conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_{USER_SALES_TABLE_NAME}_item_ledger
+        ON {USER_SALES_TABLE_NAME} (item, sale_date, id, {covered});
+    ''')
+
+def _add_source_hash(table_name: str, scope_columns: list):
+    """
+    Builds a migration that adds a nullable source_hash column with a partial unique index,
+    so only rows ingested from files, which carry a line hash, are deduplicated. Two
+    identical live sales on the same day are legitimate and never conflict.
+    """
+    key = ", ".join(scope_columns + [SOURCE_HASH_COLUMN])
+    def migrate(conn: sqlite3.Connection):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name});")]
+        if SOURCE_HASH_COLUMN not in columns:
+            conn.execute(f'ALTER TABLE {table_name} ADD COLUMN "{SOURCE_HASH_COLUMN}" TEXT;')
+        conn.execute(f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_{table_name}_source_hash
+            ON {table_name} ({key}) WHERE {SOURCE_HASH_COLUMN} IS NOT NULL;
+        ''')
+    return migrate
+
+def _create_uploads_table(conn: sqlite3.Connection):
+    """Content hashes of files already ingested for this tenant, so re-uploads are a no-op."""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {UPLOADS_TABLE_NAME} (
+            "content_hash" TEXT PRIMARY KEY,
+            "source" TEXT,
+            "rows_written" INTEGER,
+            "rows_skipped" INTEGER,
+            "uploaded_at" TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+
+def _add_dedup_support(conn: sqlite3.Connection):
+    _add_source_hash(USER_SALES_TABLE_NAME, [])(conn)
+    _create_uploads_table(conn)
+
+def _create_data_version_table(conn: sqlite3.Connection):
+    """
+    Single-row counter of committed changes to the sales data. Writers increment it in their
+    transaction, so every process sharing the file sees the same version.
+    """
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {DATA_VERSION_TABLE_NAME} (
+            "id" INTEGER PRIMARY KEY CHECK ("id" = 1),
+            "version" INTEGER NOT NULL
+        );
+    ''')
+    conn.execute(f"INSERT OR IGNORE INTO {DATA_VERSION_TABLE_NAME} (id, version) VALUES (1, 0);")
+
+# (version, description, function applied to the open connection), in ascending version order
+TENANT_MIGRATIONS = [
+    (1, "create sales table", _create_sales_table),
+    (2, "rebuild legacy sales tables without an id column", _add_sales_id_column),
+    (3, "add covering indexes on sale_date and item", _create_sales_indexes),
+    (4, "normalize sale_date to YYYY-MM-DD", _normalize_sale_dates(USER_SALES_TABLE_NAME)),
+    (5, "dedupe ingested lines by source hash and track uploaded file hashes", _add_dedup_support),
+    (6, "add the shared data_version counter", _create_data_version_table),
+]
+
+# --- Master DB migrations ---
+
+def _create_master_table(conn: sqlite3.Connection):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {MASTER_TABLE_NAME} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone_number TEXT,
+            item TEXT,
+            price REAL,
+            quantity_in_stock INTEGER,
+            quantity_sold INTEGER,
+            sale_date TEXT
+        )
+    ''')
+
+MASTER_MIGRATIONS = [
+    (1, "create sales_data table", _create_master_table),
+    (2, "normalize sale_date to YYYY-MM-DD", _normalize_sale_dates(MASTER_TABLE_NAME)),
+    (3, "dedupe ingested lines by source hash", _add_source_hash(MASTER_TABLE_NAME, ["phone_number"])),
+]
+
+def run_migrations(db_path: str, migrations: list) -> int:
+    """
+    Applies every migration newer than the file's PRAGMA user_version in one transaction,
+    then records the new version. Returns the number of migrations applied.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None) # Manage the transaction explicitly so DDL is included
+    try:
+        apply_connection_pragmas(conn)
+        current_version = conn.execute("PRAGMA user_version;").fetchone()[0]
+        pending = [m for m in migrations if m[0] > current_version]
+        if not pending:
+            return 0
+
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            for version, description, migrate in pending:
+                logging.info(f"Applying migration {version} ({description}) to {db_path}")
+                migrate(conn)
+            conn.execute(f"PRAGMA user_version = {pending[-1][0]};")
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        return len(pending)
+    finally:
+        conn.close()
+
+def migrate_master_db() -> int:
+    """Brings master_sales.db to the current schema, creating it if needed."""
+    return run_migrations(MASTER_DB_PATH, MASTER_MIGRATIONS)
+
+def migrate_user_db(phone_number: str) -> int:
+    """Brings one tenant's sales DB to the current schema, creating it if needed."""
+    os.makedirs(USER_DATA_DIR, exist_ok=True)
+    applied = run_migrations(get_user_db_path(phone_number), TENANT_MIGRATIONS)
+    with _ready_tenants_lock:
+        if applied:
+            _sales_columns.pop(phone_number, None)
+        _ready_tenants.add(phone_number)
+    return applied
+
+def ensure_user_sales_db(phone_number: str):
+    """
+    Ensures the sales DB for a user exists at the current schema.
+    After the first call (or startup bootstrap) for a tenant this is a set lookup with no I/O.
+    """
+    if phone_number in _ready_tenants:
+        return
+    migrate_user_db(phone_number)
+
+def get_sales_columns(phone_number: str) -> dict:
+    """
+    Returns {lowercased name: exact name} for the columns of the tenant's sales table.
+    Only the first call per tenant (and the first after a migration) runs PRAGMA table_info;
+    later calls are a dict lookup. Returns an empty dict when the tenant has no DB yet.
+    """
+    columns = _sales_columns.get(phone_number)
+    if columns is not None:
+        return columns
+    if not user_db_exists(phone_number):
+        return {}
+    with read_connection(phone_number) as conn:
+        columns_info = conn.execute(f"PRAGMA table_info({USER_SALES_TABLE_NAME});").fetchall()
+    columns = {col_info[1].lower(): col_info[1] for col_info in columns_info}
+    if columns:
+        _sales_columns[phone_number] = columns
+    return columns
+
+def resolve_sales_column(phone_number: str, col_name: str | None) -> str | None:
+    """Case-insensitively resolves col_name to the exact sales column name, or None if there is no such column."""
+    if not col_name:
+        return None
+    return get_sales_columns(phone_number).get(str(col_name).lower())
+
+def _phone_number_from_path(db_path: str) -> str:
+    return os.path.basename(db_path)[len("sales_"):-len(".db")]
+
+def bootstrap_schemas(max_workers: int = SCHEMA_BOOTSTRAP_WORKERS) -> dict:
+    """
+    Startup-time schema bootstrap: migrates master_sales.db and then every existing
+    user_data/sales_*.db file in parallel. Returns counts of files and migrations applied.
+    """
+    master_applied = migrate_master_db()
+
+    tenant_paths = glob.glob(os.path.join(USER_DATA_DIR, "sales_*.db"))
+    phone_numbers = [_phone_number_from_path(path) for path in tenant_paths]
+    tenant_applied = 0
+    failed = 0
+    if phone_numbers:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {executor.submit(migrate_user_db, phone): phone for phone in phone_numbers}
+            for future, phone in futures.items():
+                try:
+                    tenant_applied += future.result()
+                except Exception:
+                    failed += 1
+                    logging.exception(f"Schema migration failed for tenant {phone}:")
+
+    logging.info(f"Schema bootstrap complete: master migrations applied {master_applied}, "
+                 f"{len(phone_numbers)} tenant DBs checked, {tenant_applied} tenant migrations applied, {failed} failed.")
+    return {
+        "master_migrations": master_applied,
+        "tenant_dbs": len(phone_numbers),
+        "tenant_migrations": tenant_applied,
+        "failed": failed,
+    }
@@ -0,0 +1,29 @@
+import os
+import sys
+import itertools
+
+import pytest
+
+# The backend modules import each other as top-level modules (see run.py)
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Connection pools, caches and the ready-tenant set are per phone number, so each test gets its own
+_phone_numbers = itertools.count(9800000001)
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs the test in an empty directory: user_data/, master_sales.db and audio_cache/ land there."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def tenant(workdir):
+    """A fresh phone number with migrated tenant and master DBs."""
+    from schema_module import migrate_master_db, migrate_user_db
+
+    phone_number = str(next(_phone_numbers))
+    migrate_master_db()
+    migrate_user_db(phone_number)
+    return phone_number
@@ -0,0 +1,25 @@
+from audio_module import AudioFileCache
+
+def test_audio_written_by_another_worker_is_found_on_disk(workdir):
+    # Two caches over one directory stand in for two worker processes
+    serving = AudioFileCache("audio_cache")
+    synthesizing = AudioFileCache("audio_cache")
+    assert "a" * 32 not in serving # Loads the (empty) index before the other worker writes
+
+    synthesizing.put("a" * 32, b"mp3 bytes")
+
+    assert "a" * 32 in serving
+    assert serving.get("a" * 32) == b"mp3 bytes"
+    assert serving.stats()["files"] == 1
+
+def test_pending_marker_is_visible_to_other_workers(workdir):
+    serving = AudioFileCache("audio_cache")
+    synthesizing = AudioFileCache("audio_cache")
+
+    synthesizing.mark_pending("b" * 32)
+    assert serving.is_pending("b" * 32)
+
+    synthesizing.put("b" * 32, b"mp3 bytes")
+    synthesizing.clear_pending("b" * 32)
+    assert not serving.is_pending("b" * 32)
+    assert "b" * 32 in serving
@@ -0,0 +1,35 @@
+import threading
+
+from db_connection_module import TenantConnectionManager
+
+def test_concurrent_checkouts_never_see_a_closed_handle(workdir):
+    manager = TenantConnectionManager(max_connections=2)
+    phone_numbers = [f"98100000{i:02d}" for i in range(6)]
+    errors = []
+
+    def reader(offset: int):
+        for i in range(400):
+            try:
+                with manager.read(phone_numbers[(offset + i) % len(phone_numbers)]) as conn:
+                    conn.execute("SELECT count(*) FROM sqlite_master;").fetchone()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=reader, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, f"{len(errors)} reads failed, first: {errors[0]!r}"
+    # Handles pinned past the limit are evicted once their last user lets go
+    assert len(manager._pool) <= manager.max_connections
+    manager.close()
+
+def test_write_connections_fsync_every_commit(workdir):
+    manager = TenantConnectionManager()
+    with manager.write("9810000100") as conn:
+        assert conn.execute("PRAGMA synchronous;").fetchone()[0] == 2 # FULL
+    with manager.read("9810000100") as conn:
+        assert conn.execute("PRAGMA synchronous;").fetchone()[0] == 1 # NORMAL
+    manager.close()
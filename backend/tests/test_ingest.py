@@ -0,0 +1,36 @@
+import io
+import sqlite3
+
+from db_connection_module import get_user_db_path
+from ingest_module import stream_csv_upload
+
+HEADER = "item,price,quantity_in_stock,quantity_sold,sale_date\n"
+
+def upload(phone_number: str, lines: list, chunk_rows: int | None = None) -> dict:
+    return stream_csv_upload(phone_number, io.StringIO(HEADER + "".join(lines)), chunk_rows=chunk_rows)
+
+def sales_count(phone_number: str) -> int:
+    with sqlite3.connect(get_user_db_path(phone_number)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM sales;").fetchone()[0]
+
+def test_line_hash_does_not_depend_on_the_rest_of_the_chunk(tenant):
+    momo = "momo,150,5,2,2025-01-01\n"
+    assert upload(tenant, [momo])["rows_written"] == 1
+
+    # A decimal or missing price elsewhere turns the chunk's price column into float64
+    result = upload(tenant, [momo, "chiya,20.5,9,1,2025-01-02\n", "samosa,,3,1,2025-01-02\n"])
+
+    assert result["rows_written"] == 2
+    assert result["rows_skipped"] == 1
+    assert sales_count(tenant) == 3
+
+def test_identical_lines_are_kept_across_chunks_and_skipped_on_reupload(tenant):
+    lines = ["momo,150,5,2,2025-01-01\n"] * 3 + ["chiya,20,9,1,2025-01-02\n"]
+    assert upload(tenant, lines, chunk_rows=1)["rows_written"] == 4
+
+    # Same lines plus one more repeat: only the fourth momo is new
+    result = upload(tenant, lines + ["momo,150,5,2,2025-01-01\n"], chunk_rows=2)
+
+    assert result["rows_written"] == 1
+    assert result["rows_skipped"] == 4
+    assert sales_count(tenant) == 5
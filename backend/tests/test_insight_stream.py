@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+import audio_module
+import insight_module
+from write_queue_module import write_sales
+
+PLAN = {
+    "x_axis": "item",
+    "y_axis": "quantity_sold",
+    "aggregation": "none",
+    "time_period": "all_time",
+}
+ANSWER = {"insight": "Momo sells best, \"by far\".", "chart": {"type": "none"}}
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel: a fixed plan, and the answer streamed in small chunks."""
+    answer_calls = 0
+
+    def __init__(self, name):
+        self.name = name
+
+    def generate_content(self, contents=None, stream=False):
+        if self.name == insight_module.MODEL_PLANNER:
+            return _Chunk(json.dumps({"data_parameters": PLAN}))
+        FakeModel.answer_calls += 1
+        text = json.dumps(ANSWER)
+        assert stream
+        return [_Chunk(text[i:i + 5]) for i in range(0, len(text), 5)]
+
+class FakeTTS:
+    def __init__(self, text, lang="en", slow=False):
+        self.text = text
+
+    def write_to_fp(self, fp):
+        fp.write(b"ID3" + self.text.encode("utf-8"))
+
+@pytest.fixture
+def fake_services(monkeypatch):
+    monkeypatch.setattr(insight_module.genai, "GenerativeModel", FakeModel)
+    monkeypatch.setattr(audio_module, "gTTS", FakeTTS)
+    monkeypatch.setattr(insight_module, "plan_fast_path", lambda question, today: None)
+    FakeModel.answer_calls = 0
+
+def test_events_stream_in_order(tenant, fake_services):
+    write_sales(tenant, [("momo", 150.0, 10, 3, "2026-01-05"), ("chiya", 20.0, 50, 12, "2026-01-06")])
+
+    events = list(insight_module.iter_ai_insight_events("Which item sells best?", tenant))
+    names = [event for event, _ in events]
+
+    assert names[0] == "planner"
+    assert names[1] == "data"
+    assert names[-2:] == ["insight", "audio"]
+    assert set(names[2:-2]) == {"token"}
+
+    payloads = dict(events)
+    tokens = "".join(payload["text"] for event, payload in events if event == "token")
+    assert tokens == payloads["insight"]["full_answer"] == ANSWER["insight"]
+    assert payloads["audio"]["audio_url"] == audio_module.audio_url(payloads["audio"]["audio_id"])
+
+def test_data_event_is_capped(tenant, fake_services, monkeypatch):
+    monkeypatch.setattr(insight_module, "INSIGHT_STREAM_DATA_MAX_ROWS", 10)
+    write_sales(tenant, [(f"item{i}", 1.0, 1, 1, "2026-01-05") for i in range(25)])
+
+    events = dict(insight_module.iter_ai_insight_events("Which item sells best?", tenant))
+
+    assert len(events["data"]["data"]) == 10
+    assert events["data"]["row_count"] == 25
+    assert events["data"]["truncated"] is True
+
+def test_repeated_question_is_cached(tenant, fake_services):
+    write_sales(tenant, [("momo", 150.0, 10, 3, "2026-01-05")])
+
+    first = insight_module.get_ai_insights_and_chart_data("Which item sells best?", tenant)
+    second = list(insight_module.iter_ai_insight_events("Which item sells best?", tenant))
+
+    assert FakeModel.answer_calls == 1
+    assert [event for event, _ in second] == ["insight", "audio"]
+    assert second[0][1]["full_answer"] == first["full_answer"]
+
+def test_unrelated_write_keeps_fingerprint_cache(tenant, fake_services, monkeypatch):
+    monkeypatch.setitem(PLAN, "filter_column", "item")
+    monkeypatch.setitem(PLAN, "filter_value", "momo")
+    write_sales(tenant, [("momo", 150.0, 10, 3, "2026-01-05")])
+    insight_module.get_ai_insights_and_chart_data("How is momo selling?", tenant)
+
+    # Bumps the data version, but the rows fetched for the question are unchanged
+    write_sales(tenant, [("chiya", 20.0, 50, 12, "2026-01-06")])
+    events = [event for event, _ in insight_module.iter_ai_insight_events("How is momo selling?", tenant)]
+
+    assert FakeModel.answer_calls == 1
+    assert events[-2:] == ["insight", "audio"]
+    assert "token" not in events
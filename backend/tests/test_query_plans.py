@@ -0,0 +1,95 @@
+import pytest
+import pandas as pd
+
+from db_connection_module import read_connection
+from dashboard_data_module import DASHBOARD_ROLLUP_QUERY, SALES_TREND_QUERY, LOW_STOCK_THRESHOLD, INVENTORY_DISTRIBUTION_ITEMS
+from recent_sales_module import RECENT_SALES_QUERY
+from ledger_module import build_ledger_query, encode_ledger_cursor
+from chart_query_module import normalize_chart_params, _compile_sql
+from write_queue_module import write_sales
+
+@pytest.fixture
+def sales_conn(tenant):
+    write_sales(tenant, [(f"item{i % 40}", 10.0 + i % 7, i % 9, 1 + i % 3, f"2026-{i % 9 + 1:02d}-{i % 28 + 1:02d}")
+                         for i in range(2000)])
+    with read_connection(tenant) as conn:
+        yield conn
+
+def query_plan(conn, sql: str, params) -> list:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+def assert_no_table_scan(plan: list):
+    """Every access to the sales table goes through an index."""
+    for detail in plan:
+        if detail.startswith(("SCAN sales", "SEARCH sales")):
+            assert "INDEX" in detail, plan
+
+def test_dashboard_rollup_groups_over_an_index(sales_conn):
+    plan = query_plan(sales_conn, DASHBOARD_ROLLUP_QUERY, (LOW_STOCK_THRESHOLD, INVENTORY_DISTRIBUTION_ITEMS))
+
+    assert_no_table_scan(plan)
+    assert "SCAN sales USING COVERING INDEX" in " | ".join(plan), plan
+    assert "USE TEMP B-TREE FOR GROUP BY" not in plan, plan
+    assert "USE TEMP B-TREE FOR count(DISTINCT)" not in plan, plan
+
+def test_sales_trend_is_a_covering_range_seek(sales_conn):
+    plan = query_plan(sales_conn, SALES_TREND_QUERY, ("2026-01-01", "2026-08-01"))
+
+    assert any(detail.startswith("SEARCH sales USING COVERING INDEX") and "sale_date>" in detail for detail in plan), plan
+
+def test_recent_sales_reads_the_date_index_in_order(sales_conn):
+    plan = query_plan(sales_conn, RECENT_SALES_QUERY, (10,))
+
+    assert_no_table_scan(plan)
+    assert not any("TEMP B-TREE" in detail for detail in plan), plan
+
+@pytest.mark.parametrize("request_args", [
+    {},
+    {"order": "asc"},
+    {"item": "item3"},
+    {"start_date": "2026-02-01", "end_date": "2026-05-01"},
+    {"cursor": encode_ledger_cursor("2026-03-13", 500)},
+    {"cursor": encode_ledger_cursor("2026-03-13", 500), "item": "item3", "order": "asc"},
+])
+def test_ledger_pages_are_index_seeks(sales_conn, request_args):
+    sql, params, _ = build_ledger_query(**request_args)
+    plan = query_plan(sales_conn, sql, params)
+
+    assert_no_table_scan(plan)
+    assert any(detail.startswith("SEARCH sales USING") for detail in plan), plan
+    # Keyset pagination only works if rows come out of the index already in (sale_date, id) order
+    assert not any("TEMP B-TREE" in detail for detail in plan), plan
+
+def chart_plan(conn, phone_number: str, params: dict) -> list:
+    plan = normalize_chart_params(params, phone_number, pd.Timestamp("2026-10-17"), chart=True)
+    return query_plan(conn, _compile_sql(plan), plan.params())
+
+@pytest.mark.parametrize("params, index_access", [
+    # Time-period range: a seek on the sale_date range, grouped in index order
+    ({"x_axis": "sale_date", "y_axis": "quantity_sold", "aggregation": "sum", "time_period": "2026-02-01 to 2026-05-01"},
+     "SEARCH sales USING COVERING INDEX idx_sales_ledger (sale_date>? AND sale_date<?)"),
+    # Item GROUP BY: one pass over the item index, already in group order
+    ({"x_axis": "item", "y_axis": "total_sales"},
+     "SCAN sales USING COVERING INDEX idx_sales_item_ledger"),
+    # Item filter, alone and combined with a time period
+    ({"x_axis": "sale_date", "y_axis": "quantity_sold", "aggregation": "sum", "filter_column": "item", "filter_value": "item3"},
+     "SEARCH sales USING COVERING INDEX idx_sales_item_ledger (item=?)"),
+    ({"x_axis": "sale_date", "y_axis": "total_sales", "filter_column": "item", "filter_value": "item3", "time_period": "ytd"},
+     "SEARCH sales USING COVERING INDEX idx_sales_item_ledger (item=? AND sale_date>? AND sale_date<?)"),
+])
+def test_chart_queries_use_a_covering_index(tenant, sales_conn, params, index_access):
+    plan = chart_plan(sales_conn, tenant, params)
+
+    assert_no_table_scan(plan)
+    assert index_access in plan, plan
+    assert "USE TEMP B-TREE FOR GROUP BY" not in plan, plan
+
+def test_monthly_trend_reads_only_a_covering_index(tenant, sales_conn):
+    plan = chart_plan(sales_conn, tenant, {"x_axis": "month", "y_axis": "total_sales", "sort_by": "month",
+                                           "sort_order": "asc", "limit": 12})
+
+    assert_no_table_scan(plan)
+    assert any(detail.startswith("SCAN sales USING COVERING INDEX") for detail in plan), plan
+    # substr(sale_date, 1, 7) is not an indexed column, so grouping by month still sorts; the
+    # groups then come out in month order and ORDER BY "month" needs no second sort
+    assert "USE TEMP B-TREE FOR ORDER BY" not in plan, plan
@@ -0,0 +1,22 @@
+import time
+
+import write_queue_module
+from write_queue_module import TenantWriteQueue
+
+def test_rows_awaiting_master_sync_are_bounded(tenant, monkeypatch):
+    def master_down(phone_number, rows):
+        raise OSError("master DB unavailable")
+    monkeypatch.setattr(write_queue_module, "bulk_sync_to_master", master_down)
+    write_queue = TenantWriteQueue(master_retry_seconds=60, max_unsynced_rows=3)
+
+    for day in range(1, 6):
+        assert write_queue.submit(tenant, [("tea", 10.0, 5, 1, f"2026-01-{day:02d}")]).result(timeout=10) == 1
+
+    # Futures resolve at the tenant commit, before the writer attempts (and trims after) the master sync
+    writer = write_queue._writers[tenant]
+    expected = ["2026-01-03", "2026-01-04", "2026-01-05"]
+    deadline = time.monotonic() + 10
+    while [row[4] for row in writer.unsynced] != expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # The newest rows are kept for the retry
+    assert [row[4] for row in writer.unsynced] == expected
@@ -0,0 +1,71 @@
+import logging
+
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+
+# Canonical storage format for sale_date: lexicographic order matches date order,
+# so range predicates on the raw column can use idx_sales_ledger.
+SALE_DATE_FORMAT = '%Y-%m-%d'
+
+def normalize_sale_date(value) -> str | None:
+    """
+    Parses a single sale date into canonical YYYY-MM-DD form.
+    Returns None when the value is missing or cannot be parsed.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    parsed = pd.to_datetime(value, errors='coerce')
+    if pd.isna(parsed):
+        return None
+    return parsed.strftime(SALE_DATE_FORMAT)
+
+def normalize_sale_dates(values: pd.Series) -> pd.Series:
+    """Vectorized normalize_sale_date(): unparseable entries become NaN."""
+    normalized = pd.to_datetime(values, errors='coerce').dt.strftime(SALE_DATE_FORMAT)
+    # pandas infers one format from the first value; parse stragglers in other formats one by one
+    retry = normalized.isna() & values.notna()
+    if retry.any():
+        normalized = normalized.astype(object)
+        normalized[retry] = values[retry].map(normalize_sale_date)
+    return normalized
+
+def _period_bounds(period: pd.Period) -> tuple[str, str]:
+    return period.start_time.strftime(SALE_DATE_FORMAT), (period + 1).start_time.strftime(SALE_DATE_FORMAT)
+
+def get_time_period_bounds(time_period: str | None, today: pd.Timestamp) -> tuple[str, str] | None:
+    """
+    Resolves a planner/frontend time_period into a half-open [start, end) range of
+    canonical date strings, to be used as "sale_date" >= ? AND "sale_date" < ?.
+    Returns None for no filter (missing or 'all_time'); raises ValueError for
+    unsupported values or malformed explicit ranges.
+    """
+    if not time_period or time_period == "all_time":
+        return None
+
+    today = pd.Timestamp(today).normalize()
+    if time_period == "this_month":
+        return _period_bounds(today.to_period('M'))
+    if time_period == "last_month":
+        return _period_bounds(today.to_period('M') - 1)
+    if time_period == "this_quarter":
+        return _period_bounds(today.to_period('Q'))
+    if time_period == "last_quarter":
+        return _period_bounds(today.to_period('Q') - 1)
+    if time_period == "ytd":
+        return today.to_period('Y').start_time.strftime(SALE_DATE_FORMAT), (today + pd.Timedelta(days=1)).strftime(SALE_DATE_FORMAT)
+    if " to " in time_period:
+        start_date_str, end_date_str = [part.strip() for part in time_period.split(" to ", 1)]
+        start = normalize_sale_date(start_date_str)
+        end = normalize_sale_date(end_date_str)
+        if start is None or end is None:
+            raise ValueError(f"Invalid date range format '{time_period}'")
+        # The explicit range is inclusive of its end date
+        end_exclusive = (pd.Timestamp(end) + pd.Timedelta(days=1)).strftime(SALE_DATE_FORMAT)
+        return start, end_exclusive
+    raise ValueError(f"Unsupported time_period '{time_period}'")
+
+def get_trailing_months(today: pd.Timestamp, months: int) -> list[pd.Period]:
+    """Returns the last `months` calendar months up to and including today's month, oldest first."""
+    current = pd.Timestamp(today).to_period('M')
+    return [current - offset for offset in range(months - 1, -1, -1)]
@@ -0,0 +1,204 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+import pandas as pd
+
+from db_connection_module import write_connection
+from master_db_module import bulk_sync_to_master
+from data_version_module import bump_data_version, notify_data_version
+from schema_module import USER_SALES_TABLE_NAME, SALE_COLUMNS, SOURCE_HASH_COLUMN
+
+logging.basicConfig(level=logging.INFO)
+
+# When several writes are queued for a tenant, its writer keeps collecting for up to this
+# many milliseconds before committing them together...
+GROUP_COMMIT_INTERVAL_MS = float(os.environ.get("GROUP_COMMIT_INTERVAL_MS", 5))
+# ...or until this many rows are waiting, whichever comes first
+GROUP_COMMIT_MAX_ROWS = int(os.environ.get("GROUP_COMMIT_MAX_ROWS", 5000))
+# Writer threads exit after this long without work and are restarted on demand
+WRITER_IDLE_SECONDS = float(os.environ.get("WRITER_IDLE_SECONDS", 30))
+# After a failed master sync, the rows are retried this often until they go through
+MASTER_SYNC_RETRY_SECONDS = float(os.environ.get("MASTER_SYNC_RETRY_SECONDS", 5))
+# Most committed rows a writer holds for that retry; past it the oldest are dropped from the
+# master sync (they stay in the tenant DB) so a long master outage cannot exhaust memory
+MASTER_SYNC_MAX_PENDING_ROWS = int(os.environ.get("MASTER_SYNC_MAX_PENDING_ROWS", 100000))
+
+def sale_rows(rows) -> list:
+    """
+    Normalizes sales rows (a cleaned DataFrame or SALE_COLUMNS tuples, optionally followed by
+    a source hash) to a list of SALE_COLUMNS + [source_hash] tuples. Rows without a source
+    hash (live POS sales) get None, so they are never treated as duplicates.
+    """
+    if isinstance(rows, pd.DataFrame):
+        columns = SALE_COLUMNS + ([SOURCE_HASH_COLUMN] if SOURCE_HASH_COLUMN in rows.columns else [])
+        rows = rows[columns].itertuples(index=False, name=None)
+    width = len(SALE_COLUMNS)
+    return [tuple(row) if len(row) > width else (*row, None) for row in rows]
+
+def insert_user_sales(conn, rows) -> int:
+    """
+    Inserts sales rows (see sale_rows()) into the per-user sales table on an open write
+    connection. Ingested lines whose source hash is already present are skipped by the
+    partial unique index; rows without one are always inserted.
+    Returns the number of rows actually inserted.
+    """
+    return conn.executemany(f'''
+        INSERT INTO {USER_SALES_TABLE_NAME} (item, price, quantity_in_stock, quantity_sold, sale_date, {SOURCE_HASH_COLUMN})
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    ''', sale_rows(rows)).rowcount
+
+class _PendingWrite:
+    """One caller's rows plus the future resolved once they are committed."""
+
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.future = Future()
+
+class _TenantWriter(threading.Thread):
+    """
+    The only thread writing to one tenant's sales DB. It drains pending writes from its queue
+    and group-commits them in a single tenant transaction followed by one master transaction.
+    The tenant DB is the source of truth, and a write's future resolves once the tenant
+    commit is durable (write connections use synchronous=FULL). Rows whose master sync fails
+    are kept and retried, up to the manager's max_unsynced_rows, and the writer does not
+    retire until they are synced.
+    """
+
+    def __init__(self, manager: "TenantWriteQueue", phone_number: str):
+        super().__init__(name=f"sales-writer-{phone_number}", daemon=True)
+        self.manager = manager
+        self.phone_number = phone_number
+        self.pending = queue.Queue()
+        self.unsynced = [] # Rows committed to the tenant DB but not yet to the master DB
+
+    def run(self):
+        while True:
+            try:
+                timeout = self.manager.master_retry_seconds if self.unsynced else self.manager.idle_seconds
+                first = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                if self.unsynced:
+                    self._sync_master()
+                elif self.manager._retire(self):
+                    return
+                continue
+
+            # Take everything already waiting. Only linger for more when other writers
+            # are active, so a lone sale is committed without added latency.
+            batch = [first]
+            rows = len(first.rows)
+            deadline = None
+            while rows < self.manager.max_rows:
+                try:
+                    if deadline is None:
+                        pending_write = self.pending.get_nowait()
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        pending_write = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    if deadline is not None or len(batch) == 1:
+                        break
+                    deadline = time.monotonic() + self.manager.interval_ms / 1000.0
+                    continue
+                batch.append(pending_write)
+                rows += len(pending_write.rows)
+
+            self._commit(batch, rows)
+
+    def _commit(self, batch: list, rows: int):
+        version = None
+        try:
+            with write_connection(self.phone_number) as conn:
+                inserted = [insert_user_sales(conn, pending_write.rows) for pending_write in batch]
+                # Cached results derived from this tenant's sales are stale once this commits
+                if sum(inserted):
+                    version = bump_data_version(conn)
+        except Exception as e:
+            logging.exception(f"Group commit of {rows} rows failed for {self.phone_number}:")
+            for pending_write in batch:
+                pending_write.future.set_exception(e)
+            return
+
+        if version is not None:
+            notify_data_version(self.phone_number, version)
+        logging.info(f"Group-committed {rows} rows from {len(batch)} writers for {self.phone_number}")
+        for pending_write, count in zip(batch, inserted):
+            pending_write.future.set_result(count)
+
+        self.unsynced.extend(row for pending_write in batch for row in pending_write.rows)
+        self._sync_master()
+
+    def _sync_master(self):
+        """Copies committed rows to the master DB; on failure they stay queued for a retry."""
+        try:
+            bulk_sync_to_master(self.phone_number, self.unsynced)
+        except Exception:
+            logging.exception(f"Master sync of {len(self.unsynced)} rows failed for {self.phone_number}; "
+                              f"retrying in {self.manager.master_retry_seconds}s:")
+            overflow = len(self.unsynced) - self.manager.max_unsynced_rows
+            if overflow > 0:
+                logging.error(f"Dropping the {overflow} oldest rows awaiting master sync for {self.phone_number} "
+                              f"(limit {self.manager.max_unsynced_rows}); they remain in the tenant DB only")
+                del self.unsynced[:overflow]
+            return
+        self.unsynced = []
+
+class TenantWriteQueue:
+    """
+    Routes every sales write for a tenant through a single writer thread, so concurrent
+    uploads and live sales never contend for the SQLite write lock, and small writes
+    arriving together share one commit.
+    """
+
+    def __init__(self, interval_ms: float = GROUP_COMMIT_INTERVAL_MS, max_rows: int = GROUP_COMMIT_MAX_ROWS,
+                 idle_seconds: float = WRITER_IDLE_SECONDS, master_retry_seconds: float = MASTER_SYNC_RETRY_SECONDS,
+                 max_unsynced_rows: int = MASTER_SYNC_MAX_PENDING_ROWS):
+        self.interval_ms = interval_ms
+        self.max_rows = max_rows
+        self.idle_seconds = idle_seconds
+        self.master_retry_seconds = master_retry_seconds
+        self.max_unsynced_rows = max(0, int(max_unsynced_rows))
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    def submit(self, phone_number: str, rows) -> Future:
+        """
+        Queues sales rows (see sale_rows()) for the tenant. The returned future resolves to
+        the number of rows inserted once they are committed.
+        """
+        pending_write = _PendingWrite(sale_rows(rows))
+        with self._lock:
+            writer = self._writers.get(phone_number)
+            if writer is None:
+                writer = _TenantWriter(self, phone_number)
+                self._writers[phone_number] = writer
+                writer.start()
+            writer.pending.put(pending_write)
+        return pending_write.future
+
+    def _retire(self, writer: _TenantWriter) -> bool:
+        """Removes an idle writer unless something was queued for it in the meantime."""
+        with self._lock:
+            if not writer.pending.empty():
+                return False
+            if self._writers.get(writer.phone_number) is writer:
+                del self._writers[writer.phone_number]
+            return True
+
+# Shared queue used by every ingest path
+tenant_write_queue = TenantWriteQueue()
+
+def submit_sales(phone_number: str, rows) -> Future:
+    """Shortcut for tenant_write_queue.submit(phone_number, rows)."""
+    return tenant_write_queue.submit(phone_number, rows)
+
+def write_sales(phone_number: str, rows, timeout: float | None = None) -> int:
+    """Queues sales rows for the tenant and blocks until they are committed; returns rows inserted."""
+    return submit_sales(phone_number, rows).result(timeout=timeout)
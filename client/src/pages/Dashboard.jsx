@@ -37,27 +37,17 @@ const Dashboard = () => {
       const headers = { 'Content-Type': 'application/json' };
       const body = JSON.stringify({ phone_number: userPhoneNumber });
 
-      // Fetch Summary Data
-      const summaryResponse = await fetch('http://localhost:5000/api/dashboard-summary', { method: 'POST', headers, body });
-      const summaryData = await summaryResponse.json();
-      if (!summaryResponse.ok) throw new Error(summaryData.error || 'Failed to fetch summary data');
-
-      // Fetch Sales Trend Data
-      const salesTrendResponse = await fetch('http://localhost:5000/api/dashboard-sales-trend', { method: 'POST', headers, body });
-      const salesTrendData = await salesTrendResponse.json();
-      if (!salesTrendResponse.ok) throw new Error(salesTrendData.error || 'Failed to fetch sales trend data');
-
-      // Fetch Inventory Distribution Data
-      const inventoryDistributionResponse = await fetch('http://localhost:5000/api/dashboard-inventory-distribution', { method: 'POST', headers, body });
-      const inventoryDistributionData = await inventoryDistributionResponse.json();
-      if (!inventoryDistributionResponse.ok) throw new Error(inventoryDistributionData.error || 'Failed to fetch inventory distribution data');
+      // Summary, trend, inventory and recent sales arrive in one response
+      const bundleResponse = await fetch('http://localhost:5000/api/dashboard-bundle', { method: 'POST', headers, body });
+      const bundleData = await bundleResponse.json();
+      if (!bundleResponse.ok) throw new Error(bundleData.error || 'Failed to fetch dashboard data');
 
       setDashboardData({
         lastUpdated: new Date().toISOString(),
-        summary: summaryData,
-        salesTrend: salesTrendData,
-        inventory: inventoryDistributionData,
-        // recentOrders: [] // If you want to include this, you'd need another endpoint
+        summary: bundleData.summary,
+        salesTrend: bundleData.salesTrend,
+        inventory: bundleData.inventory,
+        recentSales: bundleData.recentSales,
       });
       setLastRefresh(new Date()); // Update last refresh timestamp
     } catch (err) {
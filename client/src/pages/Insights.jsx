@@ -81,15 +81,16 @@ const Insights = () => {
         },
         body: JSON.stringify({
           chart_parameters: chartParameters.data_parameters,
-          phone_number: userPhoneNumber
+          phone_number: userPhoneNumber,
+          format: "columnar" // { columns: [...], data: [[...]] }: column names are sent once
         }),
       });
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
-      const data = await response.json();
-      console.log("Fetched raw chart data from backend:", data);
+      const { columns = [], data = [] } = await response.json();
+      console.log("Fetched raw chart data from backend:", { columns, data });
 
       // Process data for Chart.js
       if (data && data.length > 0) {
@@ -97,22 +98,24 @@ const Insights = () => {
         let yAxisLabel = chartParameters.data_parameters.y_axis;
 
         // Adjust yAxisLabel if backend returned 'total_sales' for 'price' aggregation
-        if (data[0].hasOwnProperty('total_sales') && (yAxisLabel === 'price' || yAxisLabel === 'total_sales')) {
+        if (columns.includes('total_sales') && (yAxisLabel === 'price' || yAxisLabel === 'total_sales')) {
             yAxisLabel = 'total_sales';
             console.log("Adjusted yAxisLabel to 'total_sales' for chart display.");
         }
 
-        const actualXAxisKey = Object.keys(data[0] || {}).find(key => key.toLowerCase() === xAxisLabel?.toLowerCase());
-        const actualYAxisKey = Object.keys(data[0] || {}).find(key => key.toLowerCase() === yAxisLabel?.toLowerCase());
+        const xAxisIndex = columns.findIndex(key => key.toLowerCase() === xAxisLabel?.toLowerCase());
+        const yAxisIndex = columns.findIndex(key => key.toLowerCase() === yAxisLabel?.toLowerCase());
+        const actualXAxisKey = columns[xAxisIndex];
+        const actualYAxisKey = columns[yAxisIndex];
 
 
         if (actualXAxisKey && actualYAxisKey) {
             setChartDataForDisplay({
-                labels: data.map(item => item[actualXAxisKey]),
+                labels: data.map(row => row[xAxisIndex]),
                 datasets: [
                     {
                         label: actualYAxisKey.replace(/_/g, ' ').replace(/\b\w/g, l => l.toUpperCase()),
-                        data: data.map(item => item[actualYAxisKey]),
+                        data: data.map(row => row[yAxisIndex]),
                         // Use multiple colors for pie charts, single for bar/line
                         backgroundColor: chartParameters.type === "pie_chart" ? chartColors : [chartColors[0]],
                         borderColor: chartParameters.type === "pie_chart" ? chartColors.map(color => color.replace('0.8', '1')) : [chartColors[0].replace('0.8', '1')],
@@ -122,11 +125,11 @@ const Insights = () => {
                     },
                 ],
             });
-            console.log("Chart data prepared for display:", { labels: data.map(item => item[actualXAxisKey]), datasets: [{ label: actualYAxisKey, data: data.map(item => item[actualYAxisKey]) }] });
+            console.log("Chart data prepared for display:", { labels: data.map(row => row[xAxisIndex]), datasets: [{ label: actualYAxisKey, data: data.map(row => row[yAxisIndex]) }] });
         } else {
             console.warn("Chart data parameters x_axis or y_axis missing or not found in fetched data for display.");
             console.warn("Requested x_axis:", xAxisLabel, "Requested y_axis:", yAxisLabel);
-            console.warn("Available data keys:", Object.keys(data[0] || {}));
+            console.warn("Available data keys:", columns);
             setChartDataForDisplay(null);
         }
       } else {
@@ -139,6 +142,13 @@ const Insights = () => {
     }
   };
 
+  // Speech is synthesized in the background; the audio endpoint holds the request until it
+  // is ready (?wait) and then streams the MP3 with range support, so playback starts early
+  const playInsightAudio = (audioUrl) => {
+    const audio = new Audio(`http://localhost:5000${audioUrl}?wait=20`);
+    audio.play().catch(e => console.error("Error playing audio:", e));
+  };
+
   const fetchInsights = async (question) => {
     setLoading(true);
     setError(false);
@@ -155,7 +165,9 @@ const Insights = () => {
     }
 
     try {
-      const res = await fetch("http://localhost:5000/insights", {
+      // Server-sent events: the insight text arrives piece by piece while it is generated,
+      // and the audio comes last, so the answer shows up long before the request finishes.
+      const res = await fetch("http://localhost:5000/insights/stream", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -169,23 +181,48 @@ const Insights = () => {
       if (!res.ok) {
         throw new Error(`HTTP error! status: ${res.status}`);
       }
-      const data = await res.json();
-      console.log("Backend response for insights:", data);
-
-      setInsights(data.full_answer);
-
-      if (data.chart_data && data.chart_data.type && data.chart_data.type !== "none") {
-          setChartConfig(data.chart_data);
-          fetchChartData(data.chart_data);
-      } else {
-          setChartConfig(null);
-          setChartDataForDisplay(null);
-          console.log("Backend did not suggest a chart or chart type is 'none'.");
-      }
 
-      if (data.audio_base64) {
-        const audio = new Audio(`data:audio/mpeg;base64,${data.audio_base64}`);
-        audio.play().catch(e => console.error("Error playing audio:", e));
+      const handleEvent = (event, data) => {
+        if (event === "token") {
+          setInsights((previous) => previous + data.text);
+          setLoading(false);
+        } else if (event === "insight" || event === "error") {
+          console.log("Backend response for insights:", data);
+          setInsights(data.full_answer);
+          setLoading(false);
+
+          if (data.chart_data && data.chart_data.type && data.chart_data.type !== "none") {
+              setChartConfig(data.chart_data);
+              fetchChartData(data.chart_data);
+          } else {
+              setChartConfig(null);
+              setChartDataForDisplay(null);
+              console.log("Backend did not suggest a chart or chart type is 'none'.");
+          }
+        } else if (event === "audio" && data.audio_url) {
+          playInsightAudio(data.audio_url);
+        }
+      };
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          let event = "message";
+          let payload = "";
+          for (const line of block.split("\n")) {
+            if (line.startsWith("event: ")) event = line.slice(7);
+            else if (line.startsWith("data: ")) payload += line.slice(6);
+          }
+          if (payload) handleEvent(event, JSON.parse(payload));
+        }
       }
 
     } catch (err) {
@@ -244,7 +244,8 @@ const UploadData = () => {
         alert(`CSV upload failed: ${result.error}`);
       } else {
         console.log('CSV upload successful:', result.message);
-        alert('CSV data uploaded and processed successfully!');
+        // The message reports how many lines were new and how many were already uploaded
+        alert(result.message || 'CSV data uploaded and processed successfully!');
         fetchRecentSales(); // Refresh table after successful upload
       }
     } catch (error) {